@@ -0,0 +1,204 @@
+"""
+Admission control and graceful degradation
+
+Recognition requests wait for one of ADMISSION_CONCURRENCY inference
+slots instead of piling into the thread pool, so time spent waiting is a
+measurable queue latency. The load signal is the larger of a decaying
+average of recent waits and the age of the oldest request still waiting.
+As it crosses the ADMISSION_LEVEL_MS thresholds, requests are served
+progressively cheaper:
+
+  1 reduced_resolution  decode at most ADMISSION_MAX_SIDE pixels per side
+  2 fast_detector       detect on at most ADMISSION_DETECT_SIDE pixels per side,
+                        with the engine's cheaper detector where it has one
+  3 local_search        search only the site partition, no global fallback
+  4 shedding            refuse new requests with 503 and Retry-After
+
+Levels 2 and 3 depend on configuration. The fast detector does nothing
+for an engine whose detector takes a fixed input size and has no smaller
+model configured (ONNX without ONNX_FAST_DETECTOR_MODEL); the local
+search does nothing without GALLERY_PARTITION_BY (by attribute, not
+'hash') and a site on the request or in SITE. Such levels are skipped:
+a response only names the cheapest measure actually applied to it, and
+levels_in_effect() (shown on /health) says which ones can apply.
+
+A full wait queue (ADMISSION_MAX_QUEUE) is refused with 429 at any level.
+Refusing early lets the Node backend answer the kiosk immediately instead
+of timing out after the work has been done anyway. Async jobs are not
+admission controlled; they are the place to send work that can wait.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import config
+import cpu_tuning
+
+LEVELS = ("normal", "reduced_resolution", "fast_detector", "local_search", "shedding")
+REDUCED_RESOLUTION, FAST_DETECTOR, LOCAL_SEARCH, SHEDDING = 1, 2, 3, 4
+
+
+def parse_levels(value):
+    """Comma-separated millisecond thresholds for levels 1..4 ('' disables degradation)"""
+    return [float(part) for part in str(value).split(",") if part.strip()][:SHEDDING]
+
+
+class Overloaded(Exception):
+    """Raised instead of admitting a request"""
+
+    def __init__(self, status, level, retry_after):
+        super().__init__(f"Service overloaded ({LEVELS[level]}), retry in {retry_after}s")
+        self.status = status
+        self.level = level
+        self.retry_after = retry_after
+
+
+def fast_detection(engine):
+    """Whether the fast_detector level makes detection cheaper for an engine"""
+    return engine.downscales_detection or engine.fast_detector is not None
+
+
+def site_search(gallery, site=None):
+    """Whether a search for site can be restricted to its partition"""
+    return bool(site) and bool(gallery.partition_by) and gallery.partition_by != "hash"
+
+
+def levels_in_effect(engine, gallery, site=None):
+    """Degradation levels that can change how engine and gallery serve a request
+
+    The local search is listed when the gallery is partitioned by an
+    attribute; it then applies to requests that name a site (or SITE).
+    """
+    in_effect = [LEVELS[REDUCED_RESOLUTION]]
+    if fast_detection(engine):
+        in_effect.append(LEVELS[FAST_DETECTOR])
+    if site_search(gallery, site or config.SITE or "any"):
+        in_effect.append(LEVELS[LOCAL_SEARCH])
+    return in_effect + [LEVELS[SHEDDING]]
+
+
+class Plan:
+    """How much work an admitted request may spend"""
+
+    def __init__(self, level):
+        self.level = level
+        self.max_side = config.ADMISSION_MAX_SIDE if level >= REDUCED_RESOLUTION else None
+        self.fast_detector = level >= FAST_DETECTOR
+        self.local_only = level >= LOCAL_SEARCH
+
+    def detection(self, engine):
+        """(detector override, detection side) for an engine at this level; (None, None) keeps its own"""
+        if not self.fast_detector:
+            return None, None
+        return engine.fast_detector, config.ADMISSION_DETECT_SIDE if engine.downscales_detection else None
+
+    def applied(self, engine, scope=None):
+        """The highest level whose measure changed a request served by engine with search scope"""
+        if self.local_only and scope == "site":
+            return LOCAL_SEARCH
+        if self.fast_detector and fast_detection(engine):
+            return FAST_DETECTOR
+        return min(self.level, REDUCED_RESOLUTION)
+
+
+class AdmissionController:
+    """Concurrency slots, queue latency tracking and the degradation level"""
+
+    def __init__(self, concurrency=None, max_queue=None, level_ms=None, decay_seconds=None):
+        # One slot per usable core by default: more concurrent inferences only contend
+        self.concurrency = concurrency or config.ADMISSION_CONCURRENCY or len(cpu_tuning.available_cpus())
+        self.max_queue = config.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.level_ms = parse_levels(config.ADMISSION_LEVEL_MS if level_ms is None else level_ms)
+        self.decay_seconds = decay_seconds or config.ADMISSION_DECAY_SECONDS
+        self._slots = None
+        self._lock = threading.Lock()
+        self._waiting = {}
+        self._average_ms = 0.0
+        self._updated = time.monotonic()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {429: 0, 503: 0}
+        self.degraded = [0] * len(LEVELS)
+
+    def _decayed_average(self, now):
+        return self._average_ms * math.exp(-(now - self._updated) / self.decay_seconds)
+
+    def _observe(self, wait_ms, now):
+        # Weighted towards the latest wait so the level follows a burst within a few requests
+        self._average_ms = 0.7 * self._decayed_average(now) + 0.3 * wait_ms
+        self._updated = now
+
+    def queue_ms(self, now=None):
+        """Current queue latency estimate in ms"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            oldest = min(self._waiting.values(), default=now)
+            return max(self._decayed_average(now), (now - oldest) * 1000.0)
+
+    def level(self, now=None):
+        queue_ms = self.queue_ms(now)
+        return sum(1 for threshold in self.level_ms if queue_ms >= threshold)
+
+    def _retry_after(self):
+        return max(1, int(math.ceil(self.queue_ms() / 1000.0)))
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for an inference slot; yields the Plan to serve the request with
+
+        Raises Overloaded when shedding or when the wait queue is full.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        level = self.level()
+        if level >= SHEDDING or len(self._waiting) >= self.max_queue:
+            status = 503 if level >= SHEDDING else 429
+            with self._lock:
+                self.rejected[status] += 1
+            raise Overloaded(status, level, self._retry_after())
+
+        token = object()
+        arrived = time.monotonic()
+        with self._lock:
+            self._waiting[token] = arrived
+        try:
+            await self._slots.acquire()
+        finally:
+            with self._lock:
+                del self._waiting[token]
+        try:
+            now = time.monotonic()
+            with self._lock:
+                self._observe((now - arrived) * 1000.0, now)
+                self.in_flight += 1
+                self.admitted += 1
+            # Requests already admitted are served at most at local_search, never refused
+            level = min(self.level(now), LOCAL_SEARCH)
+            with self._lock:
+                self.degraded[level] += 1
+            yield Plan(level)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def describe(self):
+        queue_ms = self.queue_ms()
+        level = sum(1 for threshold in self.level_ms if queue_ms >= threshold)
+        with self._lock:
+            return {
+                "level": level,
+                "state": LEVELS[level],
+                "queue_ms": round(queue_ms, 1),
+                "level_ms": self.level_ms,
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiting),
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "served_by_level": dict(zip(LEVELS, self.degraded))
+            }
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Thread/worker sweep benchmark
+
+Runs the configured engine with different worker counts and per-worker
+thread budgets on a fixed number of cores, then recommends the setting
+with the best throughput. Each worker is a separate process pinned to
+its own cores, the same way uvicorn workers run with CPU_AFFINITY=auto.
+
+Usage:
+    python benchmark_threads.py --engine onnx --images path/to/faces --cores 8
+"""
+
+import argparse
+import os
+import sys
+import time
+import multiprocessing as mp
+
+
+def candidate_settings(cores):
+    """(workers, threads per worker) pairs that fit in the given cores"""
+    workers = sorted({w for w in (1, 2, 4, 8, 16, 32, cores) if w <= cores})
+    settings = []
+    for w in workers:
+        per_worker = max(1, cores // w)
+        for threads in sorted({per_worker, max(1, per_worker // 2)}):
+            settings.append((w, threads))
+    return settings
+
+
+def _run_worker(slot, workers, threads, cpus, args, images, barrier, results):
+    """Benchmark body executed in each worker process"""
+    # Thread settings are read from the environment when config/numpy are imported
+    os.environ["INTRA_OP_THREADS"] = str(threads)
+    os.environ["INTER_OP_THREADS"] = "1"
+    os.environ["OPENCV_THREADS"] = str(threads)
+    os.environ["BLAS_THREADS"] = str(threads)
+    for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = str(threads)
+
+    import numpy as np
+    import cpu_tuning
+    from engines import get_engine
+    from gallery import Gallery
+
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_tuning.worker_cpus(slot, workers, threads, cpus))
+
+    engine = get_engine(args.engine)
+    engine.load()
+    decoded = [engine.decode(data) for data in images]
+    embedding, _ = engine.represent(decoded[0])
+
+    gallery = Gallery(metric=engine.metric)
+    if embedding is not None and args.gallery_size:
+        rng = np.random.default_rng(slot)
+        gallery.ids = list(range(args.gallery_size))
+        gallery.embeddings = gallery._prepare(rng.standard_normal((args.gallery_size, len(embedding))))
+
+    barrier.wait()
+    latencies = []
+    for i in range(args.requests):
+        start = time.perf_counter()
+        embedding, _ = engine.represent(decoded[i % len(decoded)])
+        if embedding is not None and len(gallery):
+            gallery.best_match(embedding)
+        latencies.append(time.perf_counter() - start)
+    results.put(latencies)
+
+
+def run_setting(workers, threads, cpus, args, images):
+    """Run one (workers, threads) configuration; returns throughput and latencies"""
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers + 1)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=_run_worker, args=(slot, workers, threads, cpus, args, images, barrier, results))
+        for slot in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+    latencies = []
+    for _ in processes:
+        latencies.extend(results.get())
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+
+    latencies.sort()
+    return {
+        "workers": workers,
+        "threads": threads,
+        "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000
+    }
+
+
+def load_images(path):
+    """Read benchmark images from a directory"""
+    images = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")):
+            with open(os.path.join(path, name), "rb") as f:
+                images.append(f.read())
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep worker/thread settings for the face engine")
+    parser.add_argument("--engine", default=None, help="engine name (defaults to FACE_ENGINE)")
+    parser.add_argument("--images", help="directory of face images to run through the engine")
+    parser.add_argument("--cores", type=int, default=None, help="cores to budget for (defaults to all available)")
+    parser.add_argument("--requests", type=int, default=50, help="scans per worker")
+    parser.add_argument("--gallery-size", type=int, default=1000, help="synthetic gallery rows to match against")
+    args = parser.parse_args()
+
+    import config
+    import cpu_tuning
+
+    args.engine = args.engine or config.FACE_ENGINE
+    cpus = cpu_tuning.available_cpus()
+    cores = min(args.cores or len(cpus), len(cpus))
+    cpus = cpus[:cores]
+
+    if args.images:
+        images = load_images(args.images)
+    elif args.engine == "mock":
+        images = [os.urandom(64 * 1024) for _ in range(8)]
+    else:
+        print("❌ --images is required for engines other than mock")
+        sys.exit(1)
+    if not images:
+        print(f"❌ No images found in {args.images}")
+        sys.exit(1)
+
+    print(f"🧪 Benchmarking engine '{args.engine}' on {cores} cores ({len(images)} images, {args.requests} scans/worker)")
+    print(f"{'workers':>8} {'threads':>8} {'scans/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+    rows = []
+    for workers, threads in candidate_settings(cores):
+        row = run_setting(workers, threads, cpus, args, images)
+        rows.append(row)
+        print(f"{row['workers']:>8} {row['threads']:>8} {row['throughput']:>10.1f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f}")
+
+    best = max(rows, key=lambda r: r["throughput"])
+    print("\n✅ Recommended settings:")
+    print(f"WORKERS={best['workers']}")
+    print(f"INTRA_OP_THREADS={best['threads']}")
+    print("INTER_OP_THREADS=1")
+    print(f"OPENCV_THREADS={best['threads']}")
+    print(f"BLAS_THREADS={best['threads']}")
+    print(f"CPUS_PER_WORKER={best['threads']}")
+    print("CPU_AFFINITY=auto")
+
+
+if __name__ == "__main__":
+    main()
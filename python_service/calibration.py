@@ -0,0 +1,68 @@
+"""
+Per-model score calibration
+
+Raw match scores are not comparable across models: OpenFace cosine
+similarities cluster near zero while dlib distances live around 0.6.
+Each model gets a piecewise-linear table mapping its raw score to a
+calibrated confidence in [0, 1], so one CONFIDENCE_THRESHOLD means the
+same thing for every engine (0.5 is the model's operating point).
+"""
+
+import json
+import os
+
+import numpy as np
+
+import config
+
+# model name -> [(raw score, calibrated confidence), ...] with raw scores ascending
+CALIBRATION_TABLES = {
+    # Cosine similarity; operating point from real_face_service's 0.15 threshold
+    "OpenFace": [(-1.0, 0.0), (0.0, 0.05), (0.15, 0.5), (0.4, 0.9), (1.0, 1.0)],
+    # 1 - euclidean distance; operating point from the old dlib service's 1 - distance >= 0.6 check
+    "dlib_resnet_v1": [(-1.0, 0.0), (0.4, 0.05), (0.6, 0.5), (0.8, 0.95), (1.0, 1.0)],
+    # Cosine similarity of L2-normalized ArcFace embeddings
+    "arcface_mobilefacenet": [(-1.0, 0.0), (0.15, 0.05), (0.35, 0.5), (0.55, 0.95), (1.0, 1.0)],
+    # Mock embeddings are either identical (1.0) or unrelated (~0.0)
+    "mock": [(-1.0, 0.0), (0.5, 0.05), (0.9, 0.5), (1.0, 1.0)],
+}
+
+
+def load_calibration_file(path=None):
+    """Merge tables from CALIBRATION_FILE (JSON: {model: [[raw, calibrated], ...]})"""
+    path = path or config.CALIBRATION_FILE
+    if not path or not os.path.exists(path):
+        return 0
+    try:
+        with open(path) as f:
+            tables = json.load(f)
+        for model_name, points in tables.items():
+            CALIBRATION_TABLES[model_name] = sorted((float(r), float(c)) for r, c in points)
+        print(f"✅ Loaded calibration for {len(tables)} models from {path}")
+        return len(tables)
+    except Exception as e:
+        print(f"❌ Error loading calibration file {path}: {e}")
+        return 0
+
+
+def calibration_table(engine):
+    """The engine's table, or one anchored on its default raw threshold"""
+    table = CALIBRATION_TABLES.get(engine.model_name)
+    if table:
+        return table
+    return [(-1.0, 0.0), (engine.default_threshold, 0.5), (1.0, 1.0)]
+
+
+def calibrate(engine, raw_scores):
+    """Map raw match scores of an engine to calibrated confidences"""
+    raw, calibrated = zip(*calibration_table(engine))
+    return np.interp(np.asarray(raw_scores, dtype=np.float64), raw, calibrated)
+
+
+def raw_threshold(engine, confidence):
+    """Raw score at which an engine reaches a calibrated confidence"""
+    raw, calibrated = zip(*calibration_table(engine))
+    return float(np.interp(confidence, calibrated, raw))
+
+
+load_calibration_file()
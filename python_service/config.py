@@ -7,9 +7,120 @@ load_dotenv()
 BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:5000')
 
 # Face Recognition Configuration
-CONFIDENCE_THRESHOLD = float(os.getenv('CONFIDENCE_THRESHOLD', '0.6'))
+# Thresholds apply to calibrated scores (see calibration.py), so 0.5 means the same for every engine
+CONFIDENCE_THRESHOLD = float(os.getenv('CONFIDENCE_THRESHOLD', '0.5'))
+CALIBRATION_FILE = os.getenv('CALIBRATION_FILE', 'calibration.json')
+DEFAULT_TOP_K = int(os.getenv('DEFAULT_TOP_K', '3'))  # candidates returned by /recognize
+MAX_TOP_K = int(os.getenv('MAX_TOP_K', '20'))
 FACE_DETECTION_MODEL = os.getenv('FACE_DETECTION_MODEL', 'hog')  # 'hog' for CPU, 'cnn' for GPU
 
+# Engine Configuration
+FACE_ENGINE = os.getenv('FACE_ENGINE', 'deepface')  # 'deepface', 'dlib', 'onnx' or 'mock'
+DEEPFACE_MODEL = os.getenv('DEEPFACE_MODEL', 'OpenFace')
+DEEPFACE_DETECTOR = os.getenv('DEEPFACE_DETECTOR', 'opencv')
+
+# ONNX Runtime (CPU) engine
+ONNX_DETECTOR_MODEL = os.getenv('ONNX_DETECTOR_MODEL', 'models/version-RFB-320.onnx')
+ONNX_EMBEDDING_MODEL = os.getenv('ONNX_EMBEDDING_MODEL', 'models/arcface_mobilefacenet.onnx')
+ONNX_MODEL_NAME = os.getenv('ONNX_MODEL_NAME', 'arcface_mobilefacenet')
+ONNX_DETECTION_THRESHOLD = float(os.getenv('ONNX_DETECTION_THRESHOLD', '0.7'))
+ONNX_FAST_DETECTOR_MODEL = os.getenv('ONNX_FAST_DETECTOR_MODEL', '')  # smaller detector used under load; '' = none
+
+# Face alignment and crop cache
+# 'engine' keeps each engine's own alignment (DeepFace's eye alignment, the detection box elsewhere),
+# 'box' the plain detection box, 'eyes' levels the eyes when landmarks exist. DeepFace encodings made
+# with 'box' or 'eyes' get their own fingerprint, so they are never compared with 'engine' ones.
+ALIGN_MODE = os.getenv('ALIGN_MODE', 'engine')
+CROP_CACHE_DIR = os.getenv('CROP_CACHE_DIR', '')  # aligned crops of /encode photos; '' disables
+
+# Liveness / anti-spoofing ('' disables, 'texture' needs numpy only, 'onnx' runs LIVENESS_MODEL)
+LIVENESS_CHECK = os.getenv('LIVENESS_CHECK', '')
+LIVENESS_THRESHOLD = float(os.getenv('LIVENESS_THRESHOLD', '0.5'))
+LIVENESS_MODEL = os.getenv('LIVENESS_MODEL', 'models/minifasnet_v2.onnx')
+LIVENESS_CROP_SCALE = float(os.getenv('LIVENESS_CROP_SCALE', '2.7'))  # face box enlargement fed to the model
+LIVENESS_LIVE_CLASS = int(os.getenv('LIVENESS_LIVE_CLASS', '1'))  # output index of the 'live' class
+
+# CPU / Threading Configuration (0 leaves the library default)
+INTRA_OP_THREADS = int(os.getenv('INTRA_OP_THREADS', '0'))  # threads inside one inference op
+INTER_OP_THREADS = int(os.getenv('INTER_OP_THREADS', '0'))  # ops run in parallel
+ONNX_INTRA_OP_THREADS = int(os.getenv('ONNX_INTRA_OP_THREADS', str(INTRA_OP_THREADS)))
+ONNX_INTER_OP_THREADS = int(os.getenv('ONNX_INTER_OP_THREADS', str(INTER_OP_THREADS)))
+OPENCV_THREADS = int(os.getenv('OPENCV_THREADS', '-1'))  # -1 keeps OpenCV's default, 0 disables its pool
+BLAS_THREADS = int(os.getenv('BLAS_THREADS', '0'))  # numpy matching (OpenBLAS/MKL)
+CPU_AFFINITY = os.getenv('CPU_AFFINITY', '')  # '' (no pinning), 'auto', or a core list like '0-3,8'
+CPUS_PER_WORKER = int(os.getenv('CPUS_PER_WORKER', '0'))  # 'auto' pinning; 0 splits cores evenly across WORKERS
+WORKERS = int(os.getenv('WORKERS', '1'))
+
+# Bulk Enrollment
+ENROLL_DIR = os.getenv('ENROLL_DIR', 'enrollment_runs')  # one sub-directory per run
+ENROLL_WORKERS = int(os.getenv('ENROLL_WORKERS', '0'))  # 0 uses every core
+ENROLL_BATCH_SIZE = int(os.getenv('ENROLL_BATCH_SIZE', '16'))
+ENROLL_SOURCE_ROOT = os.getenv('ENROLL_SOURCE_ROOT', '')  # /enroll/bulk reads sources only under it; '' allows uploads only
+
+# Duplicate-identity detection
+DUPLICATES_THRESHOLD = float(os.getenv('DUPLICATES_THRESHOLD', '0.9'))  # calibrated confidence
+DUPLICATES_MEMORY_MB = int(os.getenv('DUPLICATES_MEMORY_MB', '256'))
+DUPLICATES_INDEX = os.getenv('DUPLICATES_INDEX', 'duplicates_index.npz')
+
+# Model migration (re-embedding stored photos with a new engine)
+UPLOADS_DIR = os.getenv('UPLOADS_DIR', '../server/uploads')  # root of the backend's imagePath values
+MIGRATION_WORKERS = int(os.getenv('MIGRATION_WORKERS', '0'))  # 0 uses every core
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '16'))
+
+# Async Recognition Jobs
+JOBS_DB = os.getenv('JOBS_DB', 'jobs.sqlite3')
+JOBS_DIR = os.getenv('JOBS_DIR', 'jobs')  # uploaded images waiting for a worker
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '1'))
+JOB_QUEUE_MAX = int(os.getenv('JOB_QUEUE_MAX', '1000'))  # pending jobs before 429
+JOB_RETENTION_HOURS = float(os.getenv('JOB_RETENTION_HOURS', '24'))
+JOB_WEBHOOK_RETRIES = int(os.getenv('JOB_WEBHOOK_RETRIES', '3'))
+JOB_WEBHOOK_TIMEOUT = float(os.getenv('JOB_WEBHOOK_TIMEOUT', '10'))
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))  # running jobs of a silent worker are re-queued after this
+
+# Node fast path (length-prefixed frames over a Unix socket; empty disables it)
+FASTPATH_SOCKET = os.getenv('FASTPATH_SOCKET', '')
+FASTPATH_MAX_FRAME_MB = int(os.getenv('FASTPATH_MAX_FRAME_MB', '10'))
+FASTPATH_MAX_PIPELINE = int(os.getenv('FASTPATH_MAX_PIPELINE', '64'))  # requests in flight per connection
+
+# Recognition Event Log (SQLite WAL, written in batches off the request path; empty disables it)
+EVENTS_DB = os.getenv('EVENTS_DB', 'events.sqlite3')
+EVENT_BATCH_SIZE = int(os.getenv('EVENT_BATCH_SIZE', '200'))
+EVENT_FLUSH_SECONDS = float(os.getenv('EVENT_FLUSH_SECONDS', '1.0'))
+EVENT_QUEUE_MAX = int(os.getenv('EVENT_QUEUE_MAX', '10000'))  # events beyond this are dropped, never waited on
+
+# Gallery Partitioning
+GALLERY_PARTITION_BY = os.getenv('GALLERY_PARTITION_BY', '')  # '' (none), an employee field such as 'city', or 'hash'
+GALLERY_HASH_PARTITIONS = int(os.getenv('GALLERY_HASH_PARTITIONS', '4'))
+GALLERY_SHARDS = int(os.getenv('GALLERY_SHARDS', '0'))  # shard processes for scatter-gather search; 0 searches in-process
+SITE = os.getenv('SITE', '')  # partition searched first when a request names no site (e.g. this gate's city)
+
+# Gallery replication (seed from a peer service URL or an export file instead of the Node backend)
+GALLERY_SEED = os.getenv('GALLERY_SEED', '')
+GALLERY_SEED_TIMEOUT = float(os.getenv('GALLERY_SEED_TIMEOUT', '60'))
+
+# Recent-recognition cache (per camera; skips the full search for someone just recognized, 0 TTL disables it)
+RECENT_CACHE_TTL_SECONDS = float(os.getenv('RECENT_CACHE_TTL_SECONDS', '5'))
+RECENT_CACHE_CAMERAS = int(os.getenv('RECENT_CACHE_CAMERAS', '256'))
+RECENT_CACHE_PER_CAMERA = int(os.getenv('RECENT_CACHE_PER_CAMERA', '4'))
+RECENT_CACHE_MIN_CONFIDENCE = float(os.getenv('RECENT_CACHE_MIN_CONFIDENCE', '0.8'))
+RECENT_CACHE_MIN_MARGIN = float(os.getenv('RECENT_CACHE_MIN_MARGIN', '0.2'))
+
+# Profiling (memory/CPU admin endpoints under /admin/profile; empty PROFILE_DIR disables them)
+PROFILE_DIR = os.getenv('PROFILE_DIR', '')  # snapshots and CPU profiles, e.g. 'profiles'
+PROFILE_TRACE_FRAMES = int(os.getenv('PROFILE_TRACE_FRAMES', '10'))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '10'))
+
+# Admission control (queue latency thresholds in ms for reduced resolution, fast detector,
+# site-only search and shedding; '' disables degradation). The fast detector level needs an engine
+# that detects faster on a smaller image or has a cheaper detector (ONNX: ONNX_FAST_DETECTOR_MODEL);
+# site-only search needs GALLERY_PARTITION_BY and a site. /health lists the levels in effect.
+ADMISSION_CONCURRENCY = int(os.getenv('ADMISSION_CONCURRENCY', '0'))  # concurrent inferences; 0 = one per core
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '64'))  # waiting requests before 429
+ADMISSION_LEVEL_MS = os.getenv('ADMISSION_LEVEL_MS', '250,500,1000,2000')
+ADMISSION_DECAY_SECONDS = float(os.getenv('ADMISSION_DECAY_SECONDS', '2'))
+ADMISSION_MAX_SIDE = int(os.getenv('ADMISSION_MAX_SIDE', '480'))  # longest image side at reduced resolution
+ADMISSION_DETECT_SIDE = int(os.getenv('ADMISSION_DETECT_SIDE', '320'))  # longest side seen by the fast detector
+
 # Service Configuration
 HOST = os.getenv('HOST', '0.0.0.0')
 PORT = int(os.getenv('PORT', '8000'))
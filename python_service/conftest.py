@@ -0,0 +1,94 @@
+"""
+Shared test setup
+
+Tests run the service in-process with the mock engine: no models, no
+Node backend (the `backend` fixture stands in for its employee store)
+and no event log. Job queues, profiles and other files go to each
+test's own temporary directory, and configuration changed through
+monkeypatch is restored after every test.
+"""
+
+import os
+
+# Before any service module is imported: config reads the environment once
+os.environ["FACE_ENGINE"] = "mock"
+os.environ["EVENTS_DB"] = ""
+
+import pytest
+
+import config
+import gallery
+import migration
+import service
+from engines import get_engine
+from gallery import Gallery, encode_embedding
+
+# A manual script that drives a running service over HTTP
+collect_ignore = ["test_face_recognition.py"]
+
+
+@pytest.fixture(autouse=True)
+def isolated_config(tmp_path, monkeypatch):
+    """Keep job, event and profile files of every test in its temporary directory"""
+    monkeypatch.setattr(config, "JOBS_DB", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(config, "JOBS_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(config, "EVENTS_DB", "")
+    monkeypatch.setattr(config, "PROFILE_DIR", "")
+    monkeypatch.setattr(config, "CROP_CACHE_DIR", "")
+    monkeypatch.setattr(config, "FACE_ENGINE", "mock")
+
+
+@pytest.fixture
+def engine():
+    """A loaded mock engine"""
+    engine = get_engine("mock")
+    engine.load()
+    return engine
+
+
+@pytest.fixture
+def employee(engine):
+    """employee(i, ...) -> a backend employee row enrolled from the photo b'employee-<i>'"""
+    def make(i, embedding=None, fingerprint=None, with_engine=None, **fields):
+        source = with_engine or engine
+        if embedding is None:
+            embedding, _ = source.represent(source.decode(f"employee-{i}".encode()))
+        return {"id": i, "name": f"Employee {i}", "employeeId": f"EMP{i:04d}", "specialty": "Staff",
+                "city": None, "birthDate": None,
+                "faceEncoding": encode_embedding(embedding, "raw", fingerprint or source.fingerprint), **fields}
+    return make
+
+
+class Backend:
+    """Stand-in for the Node backend's employee store"""
+
+    def __init__(self):
+        self.employees = []
+
+    def fetch(self, backend_url=None):
+        return self.employees
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Serves backend.employees to every module that fetches employees"""
+    backend = Backend()
+    for module in (gallery, service, migration):
+        monkeypatch.setattr(module, "fetch_employees", backend.fetch)
+    return backend
+
+
+@pytest.fixture
+def make_app(engine, backend):
+    """make_app(employees, with_engine=None, gallery=None) -> app with its galleries loaded from them"""
+    def make(employees=(), with_engine=None, gallery=None):
+        serving = with_engine or engine
+        serving.load()
+        backend.employees = list(employees)
+        if gallery is None:
+            gallery = Gallery(metric=serving.metric, fingerprint=serving.fingerprint,
+                              accept_untagged=serving.accepts_untagged)
+        app = service.create_app(serving, gallery, load_gallery=False)
+        service.reload_galleries(app)
+        return app
+    return make
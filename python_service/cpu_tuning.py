@@ -0,0 +1,159 @@
+"""
+CPU thread and affinity settings for inference workers
+
+TensorFlow, ONNX Runtime, OpenCV and BLAS each size their own thread
+pools to the whole machine. With several uvicorn workers on one host
+that oversubscribes the cores, so every pool is sized from config here.
+"""
+
+import os
+
+import config
+
+# Environment variables read by BLAS/OpenMP when numpy is first imported
+BLAS_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+# Kept open for the life of the process so the claimed 'auto' slot stays ours
+_slot_lock = None
+
+
+def parse_cpu_list(value):
+    """Parse a core list such as '0-3,8' into a sorted list of ints"""
+    cores = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cores.update(range(int(start), int(end) + 1))
+        else:
+            cores.add(int(part))
+    return sorted(cores)
+
+
+def available_cpus():
+    """Cores this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def claim_worker_slot(workers):
+    """Claim a free worker index using per-slot lock files
+
+    Locks are released by the OS when a worker exits, so a restarted
+    worker picks up the slot its predecessor held.
+    """
+    global _slot_lock
+    try:
+        import fcntl
+    except ImportError:
+        return None
+
+    import tempfile
+    lock_dir = os.path.join(tempfile.gettempdir(), f"face_service_slots_{config.PORT}")
+    os.makedirs(lock_dir, exist_ok=True)
+    for slot in range(workers):
+        handle = open(os.path.join(lock_dir, f"slot-{slot}.lock"), "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        _slot_lock = handle
+        return slot
+    return None
+
+
+def worker_cpus(slot, workers, cpus_per_worker=0, cpus=None):
+    """Cores assigned to a worker slot when splitting the machine evenly"""
+    cpus = cpus if cpus is not None else available_cpus()
+    per_worker = cpus_per_worker or max(1, len(cpus) // max(1, workers))
+    start = (slot * per_worker) % len(cpus)
+    return [cpus[(start + i) % len(cpus)] for i in range(min(per_worker, len(cpus)))]
+
+
+def apply_cpu_affinity(setting=None):
+    """Pin this process to the configured cores; returns the cores or None"""
+    setting = config.CPU_AFFINITY if setting is None else setting
+    if not setting or not hasattr(os, "sched_setaffinity"):
+        return None
+
+    if setting == "auto":
+        slot = os.getenv("WORKER_INDEX")
+        slot = int(slot) if slot is not None else claim_worker_slot(config.WORKERS)
+        if slot is None:
+            print("⚠️ No free worker slot for CPU pinning; running unpinned")
+            return None
+        cores = worker_cpus(slot, config.WORKERS, config.CPUS_PER_WORKER)
+    else:
+        cores = parse_cpu_list(setting)
+
+    try:
+        os.sched_setaffinity(0, cores)
+        print(f"📌 Pinned worker {os.getpid()} to cores {cores}")
+        return cores
+    except OSError as e:
+        print(f"❌ Error setting CPU affinity {cores}: {e}")
+        return None
+
+
+def apply_blas_threads(threads=None):
+    """Limit BLAS threads used by numpy matching
+
+    Environment variables only take effect before numpy is imported;
+    threadpoolctl (when installed) also limits an already loaded BLAS.
+    """
+    threads = config.BLAS_THREADS if threads is None else threads
+    if threads <= 0:
+        return
+    for name in BLAS_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=threads, user_api="blas")
+    except ImportError:
+        pass
+
+
+def configure_opencv(cv2, threads=None):
+    """Apply OPENCV_THREADS to an imported cv2 module"""
+    threads = config.OPENCV_THREADS if threads is None else threads
+    if threads >= 0:
+        cv2.setNumThreads(threads)
+
+
+def configure_tensorflow(intra_op_threads=None, inter_op_threads=None):
+    """Size TensorFlow's thread pools; must run before the first TF op"""
+    intra = config.INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+    inter = config.INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+    if intra <= 0 and inter <= 0:
+        return
+    import tensorflow as tf
+    try:
+        if intra > 0:
+            tf.config.threading.set_intra_op_parallelism_threads(intra)
+        if inter > 0:
+            tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except RuntimeError as e:
+        # TensorFlow refuses once its runtime has been initialized
+        print(f"⚠️ TensorFlow thread settings not applied: {e}")
+
+
+def apply_process_settings():
+    """Apply affinity and BLAS limits for this worker process"""
+    cores = apply_cpu_affinity()
+    apply_blas_threads()
+    return cores
+
+
+def describe():
+    """Current thread settings, for /health"""
+    return {
+        "intra_op_threads": config.INTRA_OP_THREADS,
+        "inter_op_threads": config.INTER_OP_THREADS,
+        "opencv_threads": config.OPENCV_THREADS,
+        "blas_threads": config.BLAS_THREADS,
+        "cpu_affinity": available_cpus()
+    }
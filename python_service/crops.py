@@ -0,0 +1,108 @@
+"""
+Aligned face crop cache
+
+/encode keeps the aligned crop of each enrollment photo, keyed by a hash
+of the photo bytes. Re-embedding jobs look the photo up here first and
+hand the crop straight to the new engine's embed stage, so a migration
+or quality check does not run detection on the original photos again.
+
+Each crop is one .npz file: the RGB pixels plus the face box, landmarks,
+detector and alignment as JSON metadata. A crop is only handed to an
+engine that aligns faces the same way (FaceEngine.alignment); DeepFace's
+own eye-aligned faces and dlib's padded context crops are not what
+another engine's embedder expects.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+
+import config
+from engines import DetectedFace
+
+
+def crop_key(contents):
+    """Cache key of an uploaded photo"""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def face_metadata(face, engine=None):
+    """JSON-friendly description of a face detected and aligned by engine"""
+    metadata = face.to_dict()
+    metadata["detector"] = engine.detector_name if engine is not None else None
+    metadata["align_mode"] = engine.alignment if engine is not None else config.ALIGN_MODE
+    metadata["aligned_shape"] = list(np.shape(face.aligned)) if face.aligned is not None else None
+    return metadata
+
+
+def crop_png(face):
+    """Base64 PNG of an aligned crop, or None when it is not an image"""
+    from PIL import Image
+
+    crop = face.aligned
+    if crop is None or np.ndim(crop) != 3 or not crop.size:
+        return None
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(crop)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+class CropCache:
+    """Directory of aligned crops keyed by photo hash"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or config.CROP_CACHE_DIR
+
+    def path(self, key):
+        # Two-level fan-out keeps directories small for large galleries
+        return os.path.join(self.directory, key[:2], f"{key}.npz")
+
+    def get(self, contents, engine=None):
+        """DetectedFace with .aligned set for a cached photo, or None
+
+        With an engine, crops aligned differently from it count as misses.
+        """
+        path = self.path(crop_key(contents))
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                metadata = json.loads(str(data["metadata"]))
+                if engine is not None and metadata.get("align_mode") != engine.alignment:
+                    return None
+                face = DetectedFace(metadata["box"], metadata["score"],
+                                    {k: tuple(v) for k, v in metadata["landmarks"].items()})
+                face.aligned = data["pixels"]
+            return face
+        except Exception as e:
+            print(f"❌ Error reading cached crop {path}: {e}")
+            return None
+
+    def put(self, contents, face, engine=None):
+        """Store the aligned crop of a photo; returns the cache key"""
+        key = crop_key(contents)
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temp name so readers never see a partial file
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, pixels=np.asarray(face.aligned),
+                 metadata=np.array(json.dumps(face_metadata(face, engine))))
+        os.replace(tmp_path, path)
+        return key
+
+    def __len__(self):
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(
+            name.endswith(".npz") and not name.endswith(".tmp.npz")
+            for _, _, names in os.walk(self.directory) for name in names
+        )
+
+
+def get_cache():
+    """The configured crop cache, or None when CROP_CACHE_DIR is unset"""
+    return CropCache() if config.CROP_CACHE_DIR else None
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Duplicate-identity detection
+
+Finds gallery rows of different employees that look like the same
+person (double enrollment under two employeeIds). The gallery is joined
+with itself in square blocks sized from a memory budget, so 100k+
+identities never need the full N x N similarity matrix.
+
+Checked rows are kept in an index file; later runs only compare newly
+enrolled or re-enrolled faces against that index (and each other)
+unless --full is given.
+
+Usage:
+    python duplicates.py --threshold 0.9 --output duplicates.json
+    python duplicates.py --gallery-file enroll_run/gallery.npz --full
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+import calibration
+import config
+from engines import get_engine
+from gallery import Gallery
+
+def block_rows_for(memory_mb, dimension):
+    """Rows per block so a block x block tile and its temporaries fit the budget"""
+    budget = memory_mb * 1024 * 1024 - 2 * 4 * dimension * 64
+    # float32 score tile plus roughly two tile-sized temporaries (mask, euclidean terms)
+    return max(64, int(np.sqrt(max(budget, 0) / (3 * 4))))
+
+
+def pair_scores(a, b, metric):
+    """Score matrix between two row blocks (higher is more similar)"""
+    if metric == "euclidean":
+        squared = (a * a).sum(1)[:, None] + (b * b).sum(1)[None, :] - 2.0 * (a @ b.T)
+        return 1.0 - np.sqrt(np.maximum(squared, 0.0))
+    return a @ b.T
+
+
+def bound_scores(coarse_a, coarse_b, residual_a, residual_b, metric):
+    """Upper bound of the exact scores of two row blocks from their projections
+
+    Each row is its projection plus a residual orthogonal to it, so a dot
+    product differs from the projected one by at most the product of the
+    residual norms, and a distance is at least the projected distance
+    combined with the difference of the residual norms.
+    """
+    if metric == "euclidean":
+        squared = ((coarse_a * coarse_a).sum(1)[:, None] + (coarse_b * coarse_b).sum(1)[None, :]
+                   - 2.0 * (coarse_a @ coarse_b.T) + (residual_a[:, None] - residual_b[None, :]) ** 2)
+        return 1.0 - np.sqrt(np.maximum(squared, 0.0))
+    return coarse_a @ coarse_b.T + residual_a[:, None] * residual_b[None, :]
+
+
+def fit_projection(embeddings, dims, sample=5000, seed=0):
+    """Top principal directions of a sample, for the approximate pass"""
+    rng = np.random.default_rng(seed)
+    rows = embeddings if len(embeddings) <= sample else embeddings[rng.choice(len(embeddings), sample, replace=False)]
+    _, _, vt = np.linalg.svd(rows, full_matrices=False)
+    return vt[:dims].T.astype(np.float32)
+
+
+def blocked_join(left, right, threshold, metric, block_rows, same=False, projection=None):
+    """Yield (left row, right row, score) pairs scoring at or above threshold
+
+    With same=True, left and right are the same matrix and only the upper
+    triangle (i < j) is visited. With a projection, blocks are scored in
+    the reduced space as an upper bound of the exact score (bound_scores),
+    so no pair is missed, and surviving pairs are rescored exactly.
+    """
+    if projection is not None:
+        coarse_left, coarse_right = left @ projection, right @ projection
+        residual_left = np.linalg.norm(left - coarse_left @ projection.T, axis=1)
+        residual_right = np.linalg.norm(right - coarse_right @ projection.T, axis=1)
+    # The bound is exact up to float32 rounding, which is all this margin covers
+    coarse_threshold = threshold - 1e-4 if projection is not None else threshold
+
+    for i in range(0, len(left), block_rows):
+        start_j = i if same else 0
+        for j in range(start_j, len(right), block_rows):
+            if projection is not None:
+                tile = bound_scores(coarse_left[i:i + block_rows], coarse_right[j:j + block_rows],
+                                    residual_left[i:i + block_rows], residual_right[j:j + block_rows], metric)
+            else:
+                tile = pair_scores(left[i:i + block_rows], right[j:j + block_rows], metric)
+            if same and i == j:
+                # Keep only the strict upper triangle of diagonal tiles
+                tile[np.tril_indices(tile.shape[0], 0, tile.shape[1])] = -np.inf
+            rows, cols = np.nonzero(tile >= coarse_threshold)
+            if not rows.size:
+                continue
+            rows, cols = rows + i, cols + j
+            if projection is not None:
+                if metric == "euclidean":
+                    exact = 1.0 - np.linalg.norm(left[rows] - right[cols], axis=1)
+                else:
+                    exact = (left[rows] * right[cols]).sum(1)
+                keep = exact >= threshold
+                rows, cols, scores = rows[keep], cols[keep], exact[keep]
+            else:
+                scores = tile[rows - i, cols - j]
+            for r, c, score in zip(rows, cols, scores):
+                yield int(r), int(c), float(score)
+
+
+def row_key(employee_id, embedding):
+    """Stable key of a gallery row: identity plus a hash of its embedding"""
+    return f"{employee_id}:{hashlib.sha1(np.ascontiguousarray(embedding).tobytes()).hexdigest()[:16]}"
+
+
+def load_index(path):
+    """Rows already checked by a previous run"""
+    if not path or not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {
+            "keys": {str(k) for k in data["keys"]},
+            "model": str(data["model"]),
+            "dimension": int(data["dimension"])
+        }
+
+
+def save_index(path, keys, model, dimension):
+    np.savez(path, keys=np.array(keys), model=np.array(model), dimension=np.array(dimension))
+
+
+def find_duplicates(gallery, engine, threshold, memory_mb=None, index_path=None, full=False, dims=0):
+    """Suspected duplicate pairs between different identities
+
+    threshold is a calibrated confidence. Returns a list of dicts sorted
+    by score; updates the index file so the next run is incremental.
+    """
+    memory_mb = memory_mb or config.DUPLICATES_MEMORY_MB
+    raw = calibration.raw_threshold(engine, threshold)
+    embeddings = gallery.embeddings
+    ids = [str(i) for i in gallery.ids]
+    keys = [row_key(i, e) for i, e in zip(ids, embeddings)]
+    if not len(ids):
+        return []
+    block_rows = block_rows_for(memory_mb, embeddings.shape[1])
+
+    index = None if full else load_index(index_path)
+    if index is not None and (index["model"] != engine.model_name or index["dimension"] != embeddings.shape[1]):
+        print("⚠️ Duplicate index was built for another model; running a full check")
+        index = None
+
+    if index is not None:
+        # Rows removed from the gallery drop out of the index; new or changed rows are checked
+        old_rows = [r for r, key in enumerate(keys) if key in index["keys"]]
+        new_rows = [r for r, key in enumerate(keys) if key not in index["keys"]]
+    else:
+        old_rows, new_rows = [], list(range(len(ids)))
+    print(f"🔍 Checking {len(new_rows)} new rows against {len(old_rows)} indexed rows "
+          f"(raw threshold {raw:.4f}, blocks of {block_rows})")
+
+    projection = None
+    if dims and dims < embeddings.shape[1]:
+        projection = fit_projection(embeddings, dims)
+
+    new = embeddings[new_rows]
+    pairs = []
+    for a, b, score in blocked_join(new, new, raw, gallery.metric, block_rows, same=True, projection=projection):
+        pairs.append((new_rows[a], new_rows[b], score))
+    if old_rows:
+        old = embeddings[old_rows]
+        for a, b, score in blocked_join(new, old, raw, gallery.metric, block_rows, projection=projection):
+            pairs.append((new_rows[a], old_rows[b], score))
+
+    confidences = calibration.calibrate(engine, [score for _, _, score in pairs]) if pairs else []
+    report = []
+    for (a, b, score), confidence in zip(pairs, confidences):
+        if ids[a] == ids[b]:
+            # Several photos of one employee are expected to match
+            continue
+        report.append({
+            "id_a": ids[a],
+            "id_b": ids[b],
+            "name_a": gallery.records.get(gallery.ids[a], {}).get("name"),
+            "name_b": gallery.records.get(gallery.ids[b], {}).get("name"),
+            "raw_score": score,
+            "confidence": float(confidence)
+        })
+    report.sort(key=lambda pair: pair["raw_score"], reverse=True)
+
+    if index_path:
+        save_index(index_path, keys, engine.model_name, embeddings.shape[1])
+    return report
+
+
+def load_gallery_file(path, metric):
+    """Gallery from an enrollment gallery.npz, keyed by employeeId code"""
+    gallery = Gallery(metric=metric)
+    with np.load(path) as data:
+        codes = [str(c) for c in data["employee_codes"]]
+        gallery._swap(codes, gallery._prepare(data["embeddings"]),
+                      {code: {"name": None, "employeeId": code} for code in codes})
+    return gallery
+
+
+def load_backend_gallery(engine):
+    """Gallery of the engine's own encodings from the backend's employees"""
+    # Stored encodings are tagged per model; an untagged gallery would skip all of them
+    gallery = Gallery(metric=engine.metric, fingerprint=engine.fingerprint,
+                      accept_untagged=engine.accepts_untagged)
+    gallery.load_from_backend()
+    return gallery
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report gallery faces enrolled under more than one employee")
+    parser.add_argument("--engine", default=None, help="engine whose model produced the gallery (defaults to FACE_ENGINE)")
+    parser.add_argument("--gallery-file", help="enrollment gallery.npz instead of the backend's employees")
+    parser.add_argument("--threshold", type=float, default=config.DUPLICATES_THRESHOLD, help="calibrated confidence")
+    parser.add_argument("--memory-mb", type=int, default=config.DUPLICATES_MEMORY_MB, help="memory budget per block")
+    parser.add_argument("--index", default=config.DUPLICATES_INDEX, help="index of already-checked rows")
+    parser.add_argument("--full", action="store_true", help="ignore the index and check every pair")
+    parser.add_argument("--dims", type=int, default=0,
+                        help="prefilter pairs in this many PCA dimensions (0 = off); results stay exact")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    engine = get_engine(args.engine)
+    if args.gallery_file:
+        gallery = load_gallery_file(args.gallery_file, engine.metric)
+    else:
+        gallery = load_backend_gallery(engine)
+
+    started = time.time()
+    report = find_duplicates(gallery, engine, args.threshold, args.memory_mb, args.index, args.full, args.dims)
+    print(f"✅ Checked {len(gallery)} gallery rows in {time.time() - started:.1f}s, "
+          f"{len(report)} suspected duplicates")
+    for pair in report[:50]:
+        print(f"   {pair['id_a']} ({pair['name_a']}) ~ {pair['id_b']} ({pair['name_b']}): "
+              f"{pair['confidence']:.3f} (raw {pair['raw_score']:.4f})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
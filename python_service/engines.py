@@ -0,0 +1,596 @@
+"""
+Face engine interface and registry
+
+Every detector/recognizer backend implements the same small interface
+(detect -> align -> embed) and registers itself under a name, so the
+service can pick its engine from config.FACE_ENGINE instead of hard-coding
+a model. The aligned crop between the stages can be cached (crops.py) and
+embedded later by any engine without running detection again.
+"""
+
+import time
+
+import numpy as np
+
+import config
+import cpu_tuning
+
+# Registered engine classes, keyed by name
+ENGINES = {}
+
+
+def register_engine(name):
+    """Class decorator that registers an engine under the given name"""
+    def decorator(cls):
+        cls.name = name
+        ENGINES[name] = cls
+        return cls
+    return decorator
+
+
+def available_engines():
+    """Names of all registered engines"""
+    return sorted(ENGINES)
+
+
+def get_engine(name=None, **options):
+    """Instantiate a registered engine (defaults to config.FACE_ENGINE)"""
+    name = name or config.FACE_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown face engine '{name}'. Available: {', '.join(available_engines())}")
+    return ENGINES[name](**options)
+
+
+def add_timing(timings, stage, started):
+    """Add the ms since `started` to timings[stage]; returns the new start"""
+    now = time.perf_counter()
+    timings[stage] = timings.get(stage, 0.0) + (now - started) * 1000.0
+    return now
+
+
+def load_image(data, max_side=None):
+    """Decode image bytes (or a file path) into an RGB numpy array
+
+    With max_side the longer side is limited to it; JPEGs are then decoded
+    at reduced scale directly, which is much cheaper than a full decode.
+    """
+    import io
+    from PIL import Image
+
+    if isinstance(data, (bytes, bytearray)):
+        data = io.BytesIO(data)
+    image = Image.open(data)
+    if max_side:
+        scale = max_side / float(max(image.size))
+        image.draft('RGB', (int(image.size[0] * scale), int(image.size[1] * scale)))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BILINEAR)
+    return np.asarray(image)
+
+
+def downscale(image, max_side):
+    """(image limited to max_side per side, scale applied); the image itself when already small enough"""
+    from PIL import Image
+
+    height, width = image.shape[:2]
+    scale = max_side / float(max(height, width))
+    if scale >= 1.0:
+        return image, 1.0
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR)), scale
+
+
+class DetectedFace:
+    """A face found by an engine's detector"""
+
+    def __init__(self, box, score=1.0, landmarks=None, chip=None):
+        # box is (x, y, w, h) in image pixels
+        self.box = tuple(int(v) for v in box)
+        self.score = float(score)
+        self.landmarks = landmarks or {}
+        # Aligned face produced by the detector itself (DeepFace), if any
+        self.chip = chip
+        # Filled in by FaceEngine.align
+        self.aligned = None
+
+    def crop(self, image):
+        """Cut this face out of an RGB image"""
+        x, y, w, h = self.box
+        height, width = image.shape[:2]
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(width, x + w), min(height, y + h)
+        return image[y0:y1, x0:x1]
+
+    def to_dict(self):
+        return {
+            "box": list(self.box),
+            "score": self.score,
+            "landmarks": {k: [int(c) for c in v] for k, v in self.landmarks.items()}
+        }
+
+
+def _warp_affine(image, matrix, size):
+    """Bilinear sample of image at matrix @ [x, y, 1] for every output pixel"""
+    width, height = size
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    src_x = matrix[0, 0] * xs + matrix[0, 1] * ys + matrix[0, 2]
+    src_y = matrix[1, 0] * xs + matrix[1, 1] * ys + matrix[1, 2]
+    limit_y, limit_x = image.shape[0] - 1, image.shape[1] - 1
+    x0 = np.clip(np.floor(src_x), 0, limit_x).astype(np.int64)
+    y0 = np.clip(np.floor(src_y), 0, limit_y).astype(np.int64)
+    x1, y1 = np.minimum(x0 + 1, limit_x), np.minimum(y0 + 1, limit_y)
+    fx = np.clip(src_x - x0, 0, 1)[..., None]
+    fy = np.clip(src_y - y0, 0, 1)[..., None]
+    pixels = image.astype(np.float32)
+    top = pixels[y0, x0] * (1 - fx) + pixels[y0, x1] * fx
+    bottom = pixels[y1, x0] * (1 - fx) + pixels[y1, x1] * fx
+    return np.clip(top * (1 - fy) + bottom * fy + 0.5, 0, 255).astype(np.uint8)
+
+
+def align_face(image, face, mode=None):
+    """Canonical crop of a detected face
+
+    'engine' uses the face the detector aligned itself where it does so
+    (DeepFace) and the detection box elsewhere. 'box' cuts the detection
+    box out unchanged. 'eyes' rotates around the box centre so the eyes
+    are level when the detector reported them, and falls back to the
+    plain box otherwise.
+    """
+    mode = mode or config.ALIGN_MODE
+    if mode == "engine" and face.chip is not None:
+        return np.ascontiguousarray(face.chip)
+    eyes = face.landmarks.get("left_eye"), face.landmarks.get("right_eye")
+    if mode != "eyes" or not all(eyes):
+        return np.ascontiguousarray(face.crop(image))
+
+    (lx, ly), (rx, ry) = eyes
+    angle = np.arctan2(ry - ly, rx - lx)
+    if rx < lx:
+        # Landmarks are from the subject's point of view on some detectors
+        angle -= np.pi
+    x, y, w, h = face.box
+    cx, cy = x + w / 2.0, y + h / 2.0
+    cos, sin = np.cos(angle), np.sin(angle)
+    # Output pixel -> source pixel: rotate about the box centre
+    matrix = np.array([
+        [cos, -sin, cx - cos * w / 2.0 + sin * h / 2.0],
+        [sin, cos, cy - sin * w / 2.0 - cos * h / 2.0]
+    ], dtype=np.float32)
+    return _warp_affine(image, matrix, (w, h))
+
+
+class FaceEngine:
+    """Base class for detector/recognizer backends"""
+
+    name = None
+    model_name = None
+    detector_name = None
+    # Cheaper detector used when the service is overloaded (None: no faster option)
+    fast_detector = None
+    # Whether detection gets cheaper on a smaller image (False where the detector resizes to a fixed input)
+    downscales_detection = True
+    # 'cosine' for similarity embeddings, 'euclidean' for distance embeddings (dlib)
+    metric = "cosine"
+    # How /encode serializes embeddings: 'pickle' (DeepFace) or 'raw' float64 bytes (dlib)
+    encoding_format = "pickle"
+    # Raw score treated as the operating point when calibration.py has no table for the model
+    default_threshold = 0.6
+    # True when detect() returns faces the engine aligned itself (DetectedFace.chip)
+    aligns_natively = False
+
+    def __init__(self):
+        self.loaded = False
+
+    def load(self):
+        """Import heavy dependencies and warm the models up (idempotent)"""
+        if self.loaded:
+            return True
+        try:
+            print(f"🔧 Initializing {self.name} engine...")
+            self._load()
+            self.loaded = True
+            print(f"✅ {self.name} engine initialized successfully")
+            return True
+        except Exception as e:
+            print(f"❌ {self.name} engine initialization failed: {e}")
+            return False
+
+    def _load(self):
+        pass
+
+    def decode(self, data, max_side=None):
+        """Turn uploaded image bytes into the engine's image representation"""
+        return load_image(data, max_side)
+
+    def detect(self, image, detector=None):
+        """Return a list of DetectedFace for an RGB image
+
+        detector overrides the configured detector where the engine has a
+        choice (fast_detector under load).
+        """
+        raise NotImplementedError
+
+    def detect_scaled(self, image, detector=None, max_side=None):
+        """detect() on a copy limited to max_side pixels per side
+
+        Boxes and landmarks are mapped back to the full image; a chip the
+        detector aligned itself stays at the reduced size.
+        """
+        small, scale = downscale(image, max_side) if max_side and self.downscales_detection else (image, 1.0)
+        faces = self.detect(small, detector) if detector else self.detect(small)
+        if scale != 1.0:
+            for face in faces:
+                face.box = tuple(int(round(v / scale)) for v in face.box)
+                face.landmarks = {k: tuple(c / scale for c in v) for k, v in face.landmarks.items()}
+        return faces
+
+    def align(self, image, face):
+        """Aligned crop of a detected face; also kept on face.aligned"""
+        face.aligned = align_face(image, face)
+        return face.aligned
+
+    def embed(self, image, face):
+        """Return the embedding of one detected face as a numpy array"""
+        aligned = face.aligned if face.aligned is not None else self.align(image, face)
+        return self.embed_aligned(aligned)
+
+    def embed_aligned(self, crop):
+        """Return the embedding of an aligned face crop (RGB array) as a numpy array"""
+        raise NotImplementedError
+
+    def represent(self, image, liveness=None, timings=None, detector=None, detect_side=None):
+        """Detect, align and embed the first face; returns (embedding, face)
+
+        A liveness check runs on the detected face before alignment and
+        raises liveness.SpoofDetected before any embedding work. The
+        aligned crop stays on face.aligned for callers that cache it.
+        Stage durations are added to the timings dict (ms) when given.
+        detector and detect_side make detection cheaper under load.
+        """
+        if not self.load():
+            return None, None
+        timings = {} if timings is None else timings
+        started = time.perf_counter()
+        faces = self.detect_scaled(image, detector, detect_side)
+        started = add_timing(timings, "detect", started)
+        if not faces:
+            return None, None
+        face = faces[0]
+        if liveness is not None:
+            try:
+                liveness.check(image, face)
+            finally:
+                started = add_timing(timings, "liveness", started)
+        self.align(image, face)
+        started = add_timing(timings, "align", started)
+        embedding = np.asarray(self.embed(image, face))
+        add_timing(timings, "embed", started)
+        return embedding, face
+
+    def represent_aligned(self, crop):
+        """Embed a cached aligned crop, skipping detection"""
+        if not self.load():
+            return None
+        return np.asarray(self.embed_aligned(crop))
+
+    @property
+    def alignment(self):
+        """Preprocessing of the crops this engine embeds; cached crops only carry over within one"""
+        if config.ALIGN_MODE == "engine":
+            return self.name if self.aligns_natively else "box"
+        return config.ALIGN_MODE
+
+    @property
+    def accepts_untagged(self):
+        """Whether untagged legacy encodings share this engine's embedding space
+
+        They were made with the engine's own alignment; other alignments
+        get their own fingerprint, so those rows are re-encoded instead.
+        """
+        return not self.aligns_natively or config.ALIGN_MODE == "engine"
+
+    @property
+    def fingerprint(self):
+        """Identifies the embedding space; embeddings only compare within one fingerprint"""
+        fingerprint = f"{self.name}:{self.model_name}"
+        if self.aligns_natively and config.ALIGN_MODE != "engine":
+            fingerprint += f"+{config.ALIGN_MODE}"
+        return fingerprint
+
+    def describe(self):
+        return {
+            "engine": self.name,
+            "fingerprint": self.fingerprint,
+            "model": self.model_name,
+            "detector": self.detector_name
+        }
+
+
+@register_engine("deepface")
+class DeepFaceEngine(FaceEngine):
+    """DeepFace (TensorFlow) models such as OpenFace"""
+
+    default_threshold = 0.15
+    aligns_natively = True
+
+    def __init__(self, model_name=None, detector_backend=None):
+        super().__init__()
+        self.model_name = model_name or config.DEEPFACE_MODEL
+        self.detector_name = detector_backend or config.DEEPFACE_DETECTOR
+        # OpenCV's Haar cascade is the cheapest DeepFace detector; when it is already configured,
+        # only the downscaled detection image makes overloaded requests cheaper
+        self.fast_detector = "opencv" if self.detector_name != "opencv" else None
+        self._deepface = None
+
+    def _load(self):
+        cpu_tuning.configure_tensorflow()
+        import cv2
+        cpu_tuning.configure_opencv(cv2)
+        from deepface import DeepFace
+        self._deepface = DeepFace
+
+        # Run a blank image through once so model weights are built up front
+        test_img = np.zeros((224, 224, 3), dtype=np.uint8)
+        DeepFace.represent(
+            img_path=test_img,
+            model_name=self.model_name,
+            detector_backend=self.detector_name,
+            enforce_detection=False
+        )
+
+    def detect(self, image, detector=None):
+        try:
+            # DeepFace works on BGR arrays
+            faces = self._deepface.extract_faces(
+                img_path=image[:, :, ::-1],
+                detector_backend=detector or self.detector_name,
+                enforce_detection=True
+            )
+        except ValueError:
+            # Raised by DeepFace when no face could be detected
+            return []
+
+        detected = []
+        for face in faces:
+            area = face["facial_area"]
+            landmarks = {k: area[k] for k in ("left_eye", "right_eye") if area.get(k)}
+            # The eye-aligned face DeepFace.represent embeds internally (RGB in [0, 1])
+            chip = np.clip(np.asarray(face["face"]) * 255.0 + 0.5, 0, 255).astype(np.uint8)
+            detected.append(DetectedFace(
+                (area["x"], area["y"], area["w"], area["h"]),
+                face.get("confidence", 1.0),
+                landmarks,
+                chip
+            ))
+        return detected
+
+    def embed_aligned(self, crop):
+        # 'skip' embeds the crop as given: alignment already happened in detect/align
+        embedding = self._deepface.represent(
+            img_path=np.ascontiguousarray(crop[:, :, ::-1]),
+            model_name=self.model_name,
+            detector_backend="skip",
+            enforce_detection=False
+        )
+        return np.array(embedding[0]["embedding"])
+
+
+@register_engine("dlib")
+class DlibEngine(FaceEngine):
+    """dlib ResNet encodings via the face_recognition package"""
+
+    model_name = "dlib_resnet_v1"
+    metric = "euclidean"
+    encoding_format = "raw"
+    # Scores are 1 - distance; the old dlib service accepted matches scoring 0.6 or more
+    default_threshold = 0.6
+
+    def __init__(self, detection_model=None):
+        super().__init__()
+        self.detector_name = detection_model or config.FACE_DETECTION_MODEL
+        # HOG is far cheaper than the CNN detector; with HOG configured the downscaled image is the saving
+        self.fast_detector = "hog" if self.detector_name != "hog" else None
+        self._fr = None
+
+    def _load(self):
+        import face_recognition
+        self._fr = face_recognition
+
+    def detect(self, image, detector=None):
+        locations = self._fr.face_locations(image, model=detector or self.detector_name)
+        return [
+            DetectedFace((left, top, right - left, bottom - top))
+            for top, right, bottom, left in locations
+        ]
+
+    @property
+    def alignment(self):
+        # The crop is dlib's own context crop (see align) under every ALIGN_MODE
+        return self.name
+
+    def align(self, image, face):
+        """The box plus half its size on every side, zero-filled past the image edge
+
+        dlib aligns its own 150px chip from landmarks and reads context
+        beyond the box, so this crop is what both live scans and cached
+        crops embed; embed_aligned finds the box again from the crop size.
+        """
+        x, y, w, h = face.box
+        margin_x, margin_y = w // 2, h // 2
+        crop = np.zeros((h + 2 * margin_y, w + 2 * margin_x) + image.shape[2:], dtype=image.dtype)
+        height, width = image.shape[:2]
+        x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+        x1, y1 = min(width, x + w + margin_x), min(height, y + h + margin_y)
+        if x1 > x0 and y1 > y0:
+            left, top = x0 - (x - margin_x), y0 - (y - margin_y)
+            crop[top:top + y1 - y0, left:left + x1 - x0] = image[y0:y1, x0:x1]
+        face.aligned = crop
+        return crop
+
+    def embed_aligned(self, crop):
+        height, width = crop.shape[:2]
+        w, h = (width + 1) // 2, (height + 1) // 2
+        left, top = (width - w) // 2, (height - h) // 2
+        encodings = self._fr.face_encodings(np.ascontiguousarray(crop), [(top, left + w, top + h, left)])
+        return encodings[0]
+
+
+def _nms(boxes, scores, iou_threshold):
+    """Greedy non-maximum suppression over (x0, y0, x1, y1) boxes"""
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        xx0 = np.maximum(boxes[i, 0], boxes[order[1:], 0])
+        yy0 = np.maximum(boxes[i, 1], boxes[order[1:], 1])
+        xx1 = np.minimum(boxes[i, 2], boxes[order[1:], 2])
+        yy1 = np.minimum(boxes[i, 3], boxes[order[1:], 3])
+        inter = np.clip(xx1 - xx0, 0, None) * np.clip(yy1 - yy0, 0, None)
+        iou = inter / (areas[i] + areas[order[1:]] - inter + 1e-9)
+        order = order[1:][iou <= iou_threshold]
+    return keep
+
+
+@register_engine("onnx")
+class OnnxEngine(FaceEngine):
+    """ONNX Runtime CPU backend for both detection and embedding
+
+    The detector is expected to follow the UltraFace layout (scores and
+    normalized corner boxes), the embedder an ArcFace-style 112x112 input.
+    """
+
+    default_threshold = 0.35
+    downscales_detection = False
+
+    def __init__(self, detector_model=None, embedding_model=None,
+                 intra_op_threads=None, inter_op_threads=None):
+        super().__init__()
+        self.detector_path = detector_model or config.ONNX_DETECTOR_MODEL
+        self.embedding_path = embedding_model or config.ONNX_EMBEDDING_MODEL
+        self.intra_op_threads = config.ONNX_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+        self.inter_op_threads = config.ONNX_INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+        self.model_name = config.ONNX_MODEL_NAME
+        self.detector_name = "onnx:" + self.detector_path.replace("\\", "/").split("/")[-1]
+        # A smaller detector network, if configured; the detector input size is fixed, so a
+        # downscaled image would not save anything
+        self.fast_detector_path = config.ONNX_FAST_DETECTOR_MODEL or None
+        self.fast_detector = ("onnx:" + self.fast_detector_path.replace("\\", "/").split("/")[-1]
+                              if self.fast_detector_path else None)
+        self._detector = None
+        self._fast_detector = None
+        self._embedder = None
+        self._cv2 = None
+
+    def session_options(self):
+        """ONNX Runtime session options with the configured thread pools"""
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 lets ONNX Runtime size the pool to the machine
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        options.execution_mode = (
+            ort.ExecutionMode.ORT_PARALLEL if self.inter_op_threads > 1
+            else ort.ExecutionMode.ORT_SEQUENTIAL
+        )
+        return options
+
+    def _load(self):
+        import onnxruntime as ort
+        import cv2
+        cpu_tuning.configure_opencv(cv2)
+        self._cv2 = cv2
+
+        options = self.session_options()
+        providers = ["CPUExecutionProvider"]
+        self._detector = ort.InferenceSession(self.detector_path, options, providers=providers)
+        self._embedder = ort.InferenceSession(self.embedding_path, options, providers=providers)
+        if self.fast_detector_path:
+            self._fast_detector = ort.InferenceSession(self.fast_detector_path, options, providers=providers)
+
+        # Input shapes are NCHW; dynamic dimensions fall back to the usual sizes
+        self._detector_size = self._input_size(self._detector, 320, 240)
+        if self._fast_detector is not None:
+            self._fast_detector_size = self._input_size(self._fast_detector, 320, 240)
+        self._embedder_size = self._input_size(self._embedder, 112, 112)
+
+    @staticmethod
+    def _input_size(session, default_w, default_h):
+        _, _, height, width = session.get_inputs()[0].shape
+        return (width if isinstance(width, int) else default_w,
+                height if isinstance(height, int) else default_h)
+
+    def detect(self, image, detector=None):
+        if detector and detector == self.fast_detector and self._fast_detector is not None:
+            session, size = self._fast_detector, self._fast_detector_size
+        else:
+            session, size = self._detector, self._detector_size
+        height, width = image.shape[:2]
+        resized = self._cv2.resize(image, size)
+        blob = ((resized.astype(np.float32) - 127.0) / 128.0).transpose(2, 0, 1)[np.newaxis]
+
+        input_name = session.get_inputs()[0].name
+        scores, boxes = session.run(None, {input_name: blob})
+        scores = scores[0, :, 1]
+        mask = scores > config.ONNX_DETECTION_THRESHOLD
+        if not mask.any():
+            return []
+
+        boxes = boxes[0][mask] * np.array([width, height, width, height], dtype=np.float32)
+        scores = scores[mask]
+        faces = []
+        for i in _nms(boxes, scores, 0.3):
+            x0, y0, x1, y1 = boxes[i]
+            faces.append(DetectedFace((x0, y0, x1 - x0, y1 - y0), scores[i]))
+        return faces
+
+    def embed_aligned(self, crop):
+        crop = self._cv2.resize(crop, self._embedder_size)
+        blob = ((crop.astype(np.float32) - 127.5) / 127.5).transpose(2, 0, 1)[np.newaxis]
+
+        input_name = self._embedder.get_inputs()[0].name
+        embedding = self._embedder.run(None, {input_name: blob})[0].reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+
+@register_engine("mock")
+class MockEngine(FaceEngine):
+    """Simulated engine for testing without any ML dependency
+
+    Images are never decoded: the "embedding" is derived from a hash of
+    the uploaded bytes, so the same photo always maps to the same vector.
+    """
+
+    model_name = "mock"
+    detector_name = "mock"
+    encoding_format = "raw"
+    default_threshold = 0.9
+    downscales_detection = False
+
+    def __init__(self, dimension=128):
+        super().__init__()
+        self.dimension = dimension
+
+    def decode(self, data, max_side=None):
+        return bytes(data)
+
+    def detect(self, image, detector=None):
+        return [DetectedFace((0, 0, 0, 0))]
+
+    def align(self, image, face):
+        # The "image" is the upload itself; keep it byte for byte
+        face.aligned = np.frombuffer(image, dtype=np.uint8)
+        return face.aligned
+
+    def embed_aligned(self, crop):
+        import hashlib
+
+        seed = int.from_bytes(hashlib.sha256(np.asarray(crop).tobytes()).digest()[:8], "little")
+        embedding = np.random.default_rng(seed).standard_normal(self.dimension)
+        return embedding / np.linalg.norm(embedding)
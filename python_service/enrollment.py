@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Bulk enrollment
+
+Streams a directory or archive (.zip / .tar / .tar.gz) of staff photos,
+embeds them in parallel batches across cores and writes the results as
+gallery entries in one file. Photos are matched to employees by name:
+<employeeId>.jpg (layout "file") or <employeeId>/<any>.jpg (layout "folder").
+
+Progress is appended to manifest.jsonl after every batch, so an
+interrupted run picks up where it stopped when started again with the
+same output directory. Photos without exactly one face are reported in
+the manifest instead of being enrolled.
+
+Usage:
+    python enrollment.py photos.zip --output enroll_run [--push]
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
+
+import config
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+MANIFEST_FILE = "manifest.jsonl"
+GALLERY_FILE = "gallery.npz"
+LAYOUTS = ("file", "folder")
+# Manifest statuses a resumed run keeps; anything else (errors) is tried again
+FINAL_STATUSES = ("ok", "no_face", "multiple_faces")
+
+# Engine instance owned by each worker process
+worker_engine = None
+
+
+def employee_code_for(path, layout="file"):
+    """employeeId for a photo: the file stem, or its folder name for the 'folder' layout"""
+    parts = path.replace("\\", "/").split("/")
+    if layout == "folder" and len(parts) > 1:
+        return parts[-2]
+    return os.path.splitext(parts[-1])[0]
+
+
+def iter_sources(source):
+    """Yield (relative path, image bytes) lazily from a directory or archive"""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    with open(path, "rb") as f:
+                        yield os.path.relpath(path, source).replace("\\", "/"), f.read()
+    elif source.lower().endswith(".zip"):
+        import zipfile
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield info.filename, archive.read(info)
+    else:
+        import tarfile
+        # Stream mode reads the archive sequentially without an index
+        with tarfile.open(source, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield member.name, archive.extractfile(member).read()
+
+
+def init_worker(engine_name):
+    """Build one single-threaded engine per worker process"""
+    global worker_engine
+    # Parallelism comes from the worker processes; keep each engine to one core
+    config.INTRA_OP_THREADS = config.ONNX_INTRA_OP_THREADS = 1
+    config.INTER_OP_THREADS = config.ONNX_INTER_OP_THREADS = 1
+    config.OPENCV_THREADS = 1
+
+    from engines import get_engine
+    worker_engine = get_engine(engine_name)
+    if not worker_engine.load():
+        raise RuntimeError(f"Could not load the {engine_name} engine in an enrollment worker")
+
+
+def _embed_batch(batch, layout="file"):
+    """Detect and embed every photo of a batch; returns (entries, embeddings)"""
+    entries, embeddings = [], []
+    for path, data in batch:
+        entry = {"file": path, "employeeId": employee_code_for(path, layout)}
+        try:
+            image = worker_engine.decode(data)
+            faces = worker_engine.detect(image)
+            entry["faces"] = len(faces)
+            if not faces:
+                entry["status"] = "no_face"
+            elif len(faces) > 1:
+                entry["status"] = "multiple_faces"
+            else:
+                embeddings.append(np.asarray(worker_engine.embed(image, faces[0]), dtype=np.float32))
+                entry["status"] = "ok"
+                entry["box"] = list(faces[0].box)
+                entry["score"] = faces[0].score
+        except Exception as e:
+            entry["status"] = "error"
+            entry["error"] = str(e)
+        entries.append(entry)
+    return entries, embeddings
+
+
+def read_manifest(output_dir):
+    """Entries already recorded by a previous (possibly interrupted) run"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    entries = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # A torn last line from an interrupted write; that photo is redone
+                        pass
+    return entries
+
+
+def _batches(items, size, skip):
+    """Group (path, bytes) pairs into batches, skipping finished paths"""
+    batch = []
+    for path, data in items:
+        if path in skip:
+            continue
+        batch.append((path, data))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class EnrollmentRun:
+    """One resumable bulk enrollment into an output directory"""
+
+    def __init__(self, source, output_dir, engine_name=None, workers=None, batch_size=None, layout="file"):
+        self.source = source
+        self.output_dir = output_dir
+        self.layout = layout
+        self.engine_name = engine_name or config.FACE_ENGINE
+        self.workers = workers or config.ENROLL_WORKERS or os.cpu_count() or 1
+        self.batch_size = batch_size or config.ENROLL_BATCH_SIZE
+        self.counts = {}
+        self.state = "pending"
+        self.error = None
+
+    def _record(self, manifest, entries, embeddings, batch_index):
+        """Persist one finished batch: embeddings first, then its manifest lines"""
+        batch_file = f"batch-{batch_index:05d}.npz"
+        if embeddings:
+            np.savez(os.path.join(self.output_dir, batch_file), embeddings=np.stack(embeddings))
+        row = 0
+        for entry in entries:
+            if entry["status"] == "ok":
+                entry["batch"], entry["row"] = batch_file, row
+                row += 1
+            manifest.write(json.dumps(entry) + "\n")
+            self.counts[entry["status"]] = self.counts.get(entry["status"], 0) + 1
+        manifest.flush()
+        os.fsync(manifest.fileno())
+
+    def run(self):
+        """Embed every photo not yet in the manifest, then write gallery.npz"""
+        self.state = "running"
+        os.makedirs(self.output_dir, exist_ok=True)
+        # The last entry of a photo wins: an error may have been retried since
+        latest = {entry["file"]: entry for entry in read_manifest(self.output_dir)}
+        skip = {path for path, entry in latest.items() if entry["status"] in FINAL_STATUSES}
+        for path in skip:
+            status = latest[path]["status"]
+            self.counts[status] = self.counts.get(status, 0) + 1
+        if skip:
+            print(f"🔄 Resuming enrollment: {len(skip)} photos already processed")
+
+        existing = [f for f in os.listdir(self.output_dir) if f.startswith("batch-")]
+        batch_index = max((int(f[6:11]) for f in existing), default=-1) + 1
+
+        started = time.time()
+        try:
+            with open(os.path.join(self.output_dir, MANIFEST_FILE), "a") as manifest, \
+                    ProcessPoolExecutor(max_workers=self.workers,
+                                        mp_context=mp.get_context("spawn"),
+                                        initializer=init_worker,
+                                        initargs=(self.engine_name,)) as pool:
+                pending = set()
+                # Keep a bounded number of batches in flight so memory stays flat on huge imports
+                for batch in _batches(iter_sources(self.source), self.batch_size, skip):
+                    pending.add(pool.submit(_embed_batch, batch, self.layout))
+                    if len(pending) >= self.workers * 2:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            self._record(manifest, *future.result(), batch_index)
+                            batch_index += 1
+                for future in pending:
+                    self._record(manifest, *future.result(), batch_index)
+                    batch_index += 1
+            self.write_gallery()
+            self.state = "completed"
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"❌ Bulk enrollment failed: {e}")
+            raise
+        finally:
+            print(f"📋 Enrollment {self.state} in {time.time() - started:.1f}s: {self.counts}")
+        return self.counts
+
+    def write_gallery(self):
+        """Collect every enrolled embedding into a single gallery.npz"""
+        latest = {entry["file"]: entry for entry in read_manifest(self.output_dir)}
+        entries = [e for e in latest.values() if e["status"] == "ok"]
+        batches = {}
+        vectors = []
+        for entry in entries:
+            if entry["batch"] not in batches:
+                with np.load(os.path.join(self.output_dir, entry["batch"])) as data:
+                    batches[entry["batch"]] = data["embeddings"]
+            vectors.append(batches[entry["batch"]][entry["row"]])
+
+        from engines import get_engine
+        engine = get_engine(self.engine_name)
+        np.savez(
+            os.path.join(self.output_dir, GALLERY_FILE),
+            embeddings=np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32),
+            employee_codes=np.array([e["employeeId"] for e in entries]),
+            files=np.array([e["file"] for e in entries]),
+            scores=np.array([e.get("score", 1.0) for e in entries], dtype=np.float32),
+            model=np.array(engine.model_name)
+        )
+        print(f"✅ Wrote {len(vectors)} gallery entries to {os.path.join(self.output_dir, GALLERY_FILE)}")
+        return len(vectors)
+
+    def push_to_backend(self, backend_url=None):
+        """Store the best embedding per employee through the Node backend"""
+        import requests
+        from engines import get_engine
+        from gallery import encode_embedding, merge_face_encoding
+
+        backend_url = backend_url or config.BACKEND_URL
+        engine = get_engine(self.engine_name)
+        with np.load(os.path.join(self.output_dir, GALLERY_FILE)) as data:
+            codes, scores, embeddings = data["employee_codes"], data["scores"], data["embeddings"]
+
+        # Highest detection score wins when an employee has several photos
+        best = {}
+        for row, code in enumerate(codes):
+            if code not in best or scores[row] > scores[best[code]]:
+                best[code] = row
+
+        employees = requests.get(f"{backend_url}/api/employees").json()
+        by_code = {e["employeeId"]: e for e in employees}
+        pushed, unknown = 0, []
+        for code, row in best.items():
+            if code not in by_code:
+                unknown.append(str(code))
+                continue
+            employee = by_code[code]
+            # Keep encodings of other models (e.g. during a migration) next to this one
+            entry = encode_embedding(embeddings[row], engine.encoding_format, engine.fingerprint)
+            requests.post(
+                f"{backend_url}/api/employees/{employee['id']}/face-encoding",
+                json={"faceEncoding": merge_face_encoding(employee.get("faceEncoding"), engine.fingerprint, entry)},
+                timeout=30
+            ).raise_for_status()
+            pushed += 1
+        if unknown:
+            print(f"⚠️ {len(unknown)} photo folders have no matching employee: {', '.join(unknown[:20])}")
+        print(f"✅ Pushed {pushed} face encodings to the backend")
+        return {"pushed": pushed, "unknown_employees": unknown}
+
+    def describe(self):
+        return {
+            "state": self.state,
+            "source": self.source,
+            "output": self.output_dir,
+            "engine": self.engine_name,
+            "layout": self.layout,
+            "counts": self.counts,
+            "error": self.error
+        }
+
+
+def resolve_source(source):
+    """Real path of a source on this host, which must lie under ENROLL_SOURCE_ROOT"""
+    if not config.ENROLL_SOURCE_ROOT:
+        raise HTTPException(status_code=403, detail="Source paths are disabled; upload an archive instead")
+    root = os.path.realpath(config.ENROLL_SOURCE_ROOT)
+    path = os.path.realpath(os.path.join(root, source))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPException(status_code=403, detail="Source must be inside the enrollment source root")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=400, detail=f"Source not found: {source}")
+    return path
+
+
+# Bulk runs started through the API, keyed by run id
+RUNS = {}
+
+router = APIRouter()
+
+
+def start_background_run(run_id, run, push=False, on_complete=None):
+    """Run an enrollment on a background thread"""
+    RUNS[run_id] = run
+
+    def target():
+        try:
+            run.run()
+            if push:
+                run.push_to_backend()
+            if on_complete:
+                on_complete()
+        except Exception as e:
+            run.state, run.error = "failed", str(e)
+
+    threading.Thread(target=target, name=f"enroll-{run_id}", daemon=True).start()
+
+
+@router.post("/enroll/bulk")
+async def bulk_enroll_endpoint(request: Request,
+                               archive: UploadFile = File(None),
+                               source: str = Form(None),
+                               layout: str = Form("file"),
+                               push: bool = Form(False)):
+    """Start a bulk enrollment from an uploaded archive or a source under ENROLL_SOURCE_ROOT"""
+    if archive is None and not source:
+        raise HTTPException(status_code=400, detail="Upload an archive or give a source directory")
+    if layout not in LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"layout must be one of: {', '.join(LAYOUTS)}")
+    if archive is None:
+        source = resolve_source(source)
+
+    run_id = uuid.uuid4().hex[:12]
+    output_dir = os.path.join(config.ENROLL_DIR, run_id)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if archive is not None:
+        # Keep the archive's extension so iter_sources can tell zip from tar
+        source = os.path.join(output_dir, "source_" + os.path.basename(archive.filename or "photos.zip"))
+        with open(source, "wb") as f:
+            while chunk := await archive.read(1024 * 1024):
+                f.write(chunk)
+
+    # Imported here: service imports this module to mount the router
+    from service import reload_galleries
+
+    app = request.app
+    run = EnrollmentRun(source, output_dir, app.state.engine.name, layout=layout)
+    # After a push, reload every served gallery (and the recent cache) the same way /reload does
+    start_background_run(run_id, run, push, on_complete=(lambda: reload_galleries(app)) if push else None)
+    print(f"📥 Bulk enrollment {run_id} started from {source}")
+    return {"success": True, "run_id": run_id, **run.describe()}
+
+
+@router.get("/enroll/bulk/{run_id}")
+async def bulk_enroll_status(run_id: str):
+    """Progress and failure counts of a bulk enrollment"""
+    run = RUNS.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Unknown enrollment run")
+    return {"run_id": run_id, **run.describe()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enroll a directory or archive of staff photos")
+    parser.add_argument("source", help="directory, .zip or .tar(.gz) of staff photos")
+    parser.add_argument("--layout", choices=LAYOUTS, default="file",
+                        help="'file': <employeeId>.jpg, 'folder': <employeeId>/<any>.jpg")
+    parser.add_argument("--output", required=True, help="run directory (re-use it to resume)")
+    parser.add_argument("--engine", default=None, help="engine name (defaults to FACE_ENGINE)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (defaults to all cores)")
+    parser.add_argument("--batch-size", type=int, default=None, help="photos per batch")
+    parser.add_argument("--push", action="store_true", help="store the encodings through the backend API")
+    args = parser.parse_args()
+
+    run = EnrollmentRun(args.source, args.output, args.engine, args.workers, args.batch_size, args.layout)
+    run.run()
+    if args.push:
+        run.push_to_backend()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Threshold tuning and accuracy-vs-speed evaluation
+
+Runs a labeled photo set (<identity>/<photo>.jpg, directory or archive)
+through every combination of engine, detector input resolution and
+gallery index, and reports for each one:
+
+- FAR / FRR over calibrated-confidence thresholds (ROC), the EER and
+  the threshold that meets a target FAR
+- per-photo embedding latency and per-probe search latency
+
+Photos are embedded in parallel worker processes, one per core. Part of
+the identities is held out of the gallery so their probes measure false
+accepts (open-set identification, as at a gate). The cheapest
+configuration meeting --target-far and --max-frr is recommended, and
+--write-calibration turns the measured score distributions into
+calibration.py tables.
+
+The recognition event log (events.py) can be evaluated too: with a
+labels CSV (image hash, true employee id) it yields the same FAR/FRR
+from live traffic; without one it reports accept rates and stage latency.
+
+Usage:
+    python evaluate.py photos/ --engines onnx,deepface --resolutions 0,640,320 --indexes exact,pca64
+    python evaluate.py --events events.sqlite3 --labels labels.csv
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import calibration
+import config
+import enrollment
+import events
+from duplicates import fit_projection
+from engines import get_engine
+from gallery import Gallery
+
+THRESHOLDS = np.round(np.linspace(0.0, 1.0, 101), 2)
+
+
+def _embed_images(batch, resolution):
+    """Embed (index, bytes) pairs in a worker; returns (index, embedding or None, ms)"""
+    engine = enrollment.worker_engine
+    results = []
+    for index, data in batch:
+        started = time.perf_counter()
+        try:
+            # Only detection sees the reduced image (as under admission control); faces are embedded at full size
+            embedding, face = engine.represent(engine.decode(data), detect_side=resolution or None)
+        except Exception as e:
+            print(f"❌ Error embedding photo {index}: {e}")
+            embedding = None
+        elapsed = (time.perf_counter() - started) * 1000.0
+        results.append((index, None if embedding is None else np.asarray(embedding, dtype=np.float32), elapsed))
+    return results
+
+
+def embed_all(engine_name, photos, resolution, workers, batch_size):
+    """Embeddings (None where no face was found) and per-photo latencies for all photos"""
+    embeddings = [None] * len(photos)
+    latencies = np.zeros(len(photos))
+    batches = [
+        [(i, photos[i]) for i in range(start, min(start + batch_size, len(photos)))]
+        for start in range(0, len(photos), batch_size)
+    ]
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=mp.get_context("spawn"),
+                             initializer=enrollment.init_worker,
+                             initargs=(engine_name,)) as pool:
+        for results in pool.map(_embed_images, batches, [resolution] * len(batches)):
+            for index, embedding, elapsed in results:
+                embeddings[index] = embedding
+                latencies[index] = elapsed
+    return embeddings, latencies
+
+
+def split_probes(labels, gallery_per_identity=1, unknown_fraction=0.2, seed=0):
+    """Gallery rows, probe rows and enrolled identities for a labeled set
+
+    Identities drawn into the unknown fraction are never enrolled, so all
+    of their photos become non-mated probes.
+    """
+    identities = sorted(set(labels))
+    rng = np.random.default_rng(seed)
+    unknown = set(rng.choice(identities, int(len(identities) * unknown_fraction), replace=False)) if identities else set()
+    seen = {}
+    gallery_rows, probe_rows = [], []
+    for row, identity in enumerate(labels):
+        if identity not in unknown and seen.get(identity, 0) < gallery_per_identity:
+            gallery_rows.append(row)
+            seen[identity] = seen.get(identity, 0) + 1
+        else:
+            probe_rows.append(row)
+    return gallery_rows, probe_rows, set(identities) - unknown
+
+
+def search(gallery_embeddings, gallery_labels, probes, metric, index):
+    """Top-1 (label, raw score) per probe and the search latency of each, in ms
+
+    index is 'exact' or 'pca<dims>' (embeddings projected onto the
+    gallery's principal directions before scoring).
+    """
+    gallery_embeddings = np.asarray(gallery_embeddings, dtype=np.float32)
+    probes = np.asarray(probes, dtype=np.float32)
+    if index.startswith("pca"):
+        projection = fit_projection(gallery_embeddings, int(index[3:]))
+        gallery_embeddings, probes = gallery_embeddings @ projection, probes @ projection
+    elif index != "exact":
+        raise ValueError(f"Unknown index '{index}' (use 'exact' or 'pca<dims>')")
+
+    gallery = Gallery(metric=metric)
+    ids = list(range(len(gallery_labels)))
+    gallery._swap(ids, gallery._prepare(gallery_embeddings), {i: {"employeeId": i} for i in ids})
+    matches, latencies = [], []
+    for probe in probes:
+        started = time.perf_counter()
+        best = gallery.top_k(probe, 1)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+        matches.append((gallery_labels[best[0][0]], best[0][1]) if best else (None, -np.inf))
+    return matches, np.asarray(latencies)
+
+
+def error_rates(mated, non_mated):
+    """FAR, FRR and misidentification rate at every threshold
+
+    mated is [(confidence, correct identity)] for probes of enrolled
+    people, non_mated the confidences of everyone else. A mated probe is
+    falsely rejected when its best match is below the threshold or is
+    someone else; a non-mated probe is falsely accepted at or above it.
+    """
+    mated_conf = np.asarray([c for c, _ in mated], dtype=np.float64)
+    correct = np.asarray([ok for _, ok in mated], dtype=bool)
+    non_mated = np.asarray(non_mated, dtype=np.float64)
+    roc = []
+    for t in THRESHOLDS:
+        accepted = mated_conf >= t
+        far = float((non_mated >= t).mean()) if non_mated.size else 0.0
+        frr = float(1.0 - (accepted & correct).mean()) if mated_conf.size else 0.0
+        misid = float((accepted & ~correct).mean()) if mated_conf.size else 0.0
+        roc.append({"threshold": float(t), "far": far, "frr": frr, "misid": misid})
+    return roc
+
+
+def summarize(roc, target_far):
+    """EER and operating points from an ROC"""
+    eer = min(roc, key=lambda p: abs(p["far"] - p["frr"]))
+    meeting = [p for p in roc if p["far"] <= target_far]
+    at_target = meeting[0] if meeting else None
+    current = min(roc, key=lambda p: abs(p["threshold"] - config.CONFIDENCE_THRESHOLD))
+    return {
+        "eer": (eer["far"] + eer["frr"]) / 2.0,
+        "eer_threshold": eer["threshold"],
+        "threshold_at_target_far": at_target["threshold"] if at_target else None,
+        "frr_at_target_far": at_target["frr"] if at_target else None,
+        "far_at_current_threshold": current["far"],
+        "frr_at_current_threshold": current["frr"]
+    }
+
+
+def percentiles(values):
+    values = np.asarray(values, dtype=np.float64)
+    if not values.size:
+        return {"p50": None, "p95": None}
+    return {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95))}
+
+
+def calibration_points(genuine_raw, impostor_raw, target_far):
+    """A calibration table putting 0.5 at the raw score that meets target_far"""
+    impostor_raw = np.asarray(impostor_raw, dtype=np.float64)
+    low = float(np.quantile(impostor_raw, 0.9))
+    operating = float(np.quantile(impostor_raw, 1.0 - target_far))
+    high = max(float(np.quantile(impostor_raw, 1.0 - target_far / 10.0)),
+               float(np.median(genuine_raw)) if len(genuine_raw) else operating)
+    # Keep raw scores strictly ascending around the operating point
+    low, high = min(low, operating - 1e-3), max(high, operating + 1e-3)
+    return [(min(-1.0, low - 1.0), 0.0), (low, 0.05), (operating, 0.5), (high, 0.95), (max(1.0, high + 1e-3), 1.0)]
+
+
+def write_calibration(path, tables):
+    """Merge model tables into a calibration file read by calibration.py"""
+    existing = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = json.load(f)
+    existing.update({model: [list(point) for point in table] for model, table in tables.items()})
+    with open(path, "w") as f:
+        json.dump(existing, f, indent=2)
+    print(f"💾 Calibration for {', '.join(tables)} written to {path}")
+
+
+def evaluate_photos(args):
+    """Evaluate every engine x resolution x index configuration on a labeled set"""
+    photos = list(enrollment.iter_sources(args.source))
+    labels = [enrollment.employee_code_for(path, "folder") for path, _ in photos]
+    images = [data for _, data in photos]
+    print(f"📂 {len(images)} photos of {len(set(labels))} identities")
+
+    results, tables = [], {}
+    for engine_name in args.engines.split(","):
+        engine = get_engine(engine_name)
+        for resolution in [int(r) for r in args.resolutions.split(",")]:
+            started = time.time()
+            embeddings, embed_ms = embed_all(engine_name, images, resolution, args.workers, args.batch_size)
+            found = [i for i, e in enumerate(embeddings) if e is not None]
+            print(f"🔧 {engine.fingerprint} @ {resolution or 'full'} px: {len(found)}/{len(images)} faces "
+                  f"in {time.time() - started:.1f}s")
+            found_labels = [labels[i] for i in found]
+            gallery_rows, probe_rows, enrolled = split_probes(found_labels, args.gallery_per_identity,
+                                                              args.unknown_fraction, args.seed)
+            if not gallery_rows or not probe_rows:
+                print("⚠️ Not enough photos with faces for a gallery and probes; skipping")
+                continue
+            gallery_embeddings = [embeddings[found[r]] for r in gallery_rows]
+            gallery_labels = [found_labels[r] for r in gallery_rows]
+            probes = [embeddings[found[r]] for r in probe_rows]
+            probe_labels = [found_labels[r] for r in probe_rows]
+
+            for index in args.indexes.split(","):
+                matches, search_ms = search(gallery_embeddings, gallery_labels, probes, engine.metric, index)
+                raw = [score for _, score in matches]
+                confidences = calibration.calibrate(engine, raw)
+                mated, non_mated, genuine_raw, impostor_raw = [], [], [], []
+                for (label, score), confidence, truth in zip(matches, confidences, probe_labels):
+                    if truth in enrolled:
+                        mated.append((confidence, label == truth))
+                        genuine_raw.append(score)
+                    else:
+                        non_mated.append(confidence)
+                        impostor_raw.append(score)
+                roc = error_rates(mated, non_mated)
+                result = {
+                    "engine": engine.fingerprint,
+                    "resolution": resolution,
+                    "index": index,
+                    "photos": len(images),
+                    "faces_found": len(found),
+                    "mated_probes": len(mated),
+                    "non_mated_probes": len(non_mated),
+                    **summarize(roc, args.target_far),
+                    "embed_ms": percentiles(embed_ms[found]),
+                    "search_ms": percentiles(search_ms),
+                    "roc": roc
+                }
+                result["cost_ms"] = (result["embed_ms"]["p50"] or 0.0) + (result["search_ms"]["p50"] or 0.0)
+                results.append(result)
+                if index == "exact" and impostor_raw and engine.model_name not in tables:
+                    tables[engine.model_name] = calibration_points(genuine_raw, impostor_raw, args.target_far)
+
+    print_results(results, args.target_far, args.max_frr)
+    if args.write_calibration:
+        if tables:
+            write_calibration(args.write_calibration, tables)
+        else:
+            print("⚠️ No non-mated probes to calibrate from; raise --unknown-fraction")
+    return results
+
+
+def read_labels(path):
+    """image hash -> true employee id ('' for people who are not enrolled)"""
+    with open(path, newline="") as f:
+        return {row["image"]: (row.get("employeeId") or "").strip() for row in csv.DictReader(f)}
+
+
+def evaluate_events(args):
+    """FAR/FRR (with labels) or accept rates, plus stage latency, from the event log"""
+    logged = [e for e in events.read_events(args.events, since=args.since) if e["kind"] != "verify"]
+    labels = read_labels(args.labels) if args.labels else None
+    results = []
+    for model in sorted({e.get("model") or "" for e in logged}):
+        model_events = [e for e in logged if (e.get("model") or "") == model]
+        timings = {}
+        for e in model_events:
+            for stage, ms in e.get("timings", {}).items():
+                timings.setdefault(stage, []).append(ms)
+        result = {
+            "engine": model or None,
+            "events": len(model_events),
+            "latency_ms": {stage: percentiles(values) for stage, values in sorted(timings.items())}
+        }
+        best = [e["candidates"][0] if e.get("candidates") else None for e in model_events]
+        if labels is not None:
+            mated, non_mated = [], []
+            for e, top in zip(model_events, best):
+                if e.get("image") not in labels:
+                    continue
+                truth = labels[e["image"]]
+                confidence = top[1] if top else 0.0
+                if truth:
+                    mated.append((confidence, top is not None and str(top[0]) == truth))
+                else:
+                    non_mated.append(confidence)
+            roc = error_rates(mated, non_mated)
+            result.update({"mated_probes": len(mated), "non_mated_probes": len(non_mated),
+                           **summarize(roc, args.target_far), "roc": roc})
+        else:
+            confidences = np.asarray([top[1] if top else 0.0 for top in best])
+            result["accept_rate"] = {
+                f"{t:.2f}": float((confidences >= t).mean()) if confidences.size else 0.0
+                for t in (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+            }
+        results.append(result)
+
+    for result in results:
+        print(f"📊 {result['engine']}: {result['events']} events")
+        for stage, p in result["latency_ms"].items():
+            print(f"   {stage:>9}: p50 {p['p50']:.2f} ms, p95 {p['p95']:.2f} ms")
+        if "eer" in result:
+            print(f"   EER {result['eer']:.4f} at {result['eer_threshold']:.2f}; "
+                  f"threshold for FAR <= {args.target_far}: {result['threshold_at_target_far']}")
+        elif "accept_rate" in result:
+            print("   accept rate: " + ", ".join(f"{t}: {r:.1%}" for t, r in result["accept_rate"].items()))
+    return results
+
+
+def print_results(results, target_far, max_frr):
+    if not results:
+        print("⚠️ No configuration could be evaluated")
+        return
+    print(f"\n{'engine':<28} {'res':>5} {'index':>7} {'EER':>7} {'thr@FAR':>8} {'FRR@FAR':>8} "
+          f"{'embed p50':>10} {'search p50':>11}")
+    for r in results:
+        threshold = f"{r['threshold_at_target_far']:.2f}" if r["threshold_at_target_far"] is not None else "-"
+        frr = f"{r['frr_at_target_far']:.4f}" if r["frr_at_target_far"] is not None else "-"
+        print(f"{r['engine']:<28} {r['resolution'] or 'full':>5} {r['index']:>7} {r['eer']:>7.4f} {threshold:>8} "
+              f"{frr:>8} {r['embed_ms']['p50']:>8.2f}ms {r['search_ms']['p50']:>9.3f}ms")
+
+    meeting = [r for r in results if r["frr_at_target_far"] is not None and r["frr_at_target_far"] <= max_frr]
+    if not meeting:
+        print(f"\n⚠️ No configuration reaches FRR <= {max_frr} at FAR <= {target_far}")
+        return
+    best = min(meeting, key=lambda r: r["cost_ms"])
+    print(f"\n✅ Cheapest configuration meeting FAR <= {target_far}, FRR <= {max_frr}: "
+          f"{best['engine']} at {best['resolution'] or 'full'} px, {best['index']} index "
+          f"({best['cost_ms']:.2f} ms); set CONFIDENCE_THRESHOLD={best['threshold_at_target_far']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate accuracy and latency per recognition configuration")
+    parser.add_argument("source", nargs="?", help="labeled photos: <identity>/<photo> directory or archive")
+    parser.add_argument("--events", help="evaluate a recognition event log instead of photos")
+    parser.add_argument("--labels", help="CSV with image,employeeId columns for --events")
+    parser.add_argument("--since", type=float, default=None, help="only events after this unix time")
+    parser.add_argument("--engines", default=config.FACE_ENGINE, help="comma-separated engine names")
+    parser.add_argument("--resolutions", default="0", help="comma-separated max image side for detection (0 = full)")
+    parser.add_argument("--indexes", default="exact", help="comma-separated: exact, pca<dims>")
+    parser.add_argument("--gallery-per-identity", type=int, default=1, help="photos enrolled per identity")
+    parser.add_argument("--unknown-fraction", type=float, default=0.2, help="identities kept out of the gallery")
+    parser.add_argument("--target-far", type=float, default=0.001, help="acceptable false accept rate")
+    parser.add_argument("--max-frr", type=float, default=0.05, help="acceptable false reject rate at the target FAR")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="embedding processes")
+    parser.add_argument("--batch-size", type=int, default=16, help="photos per worker task")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the unknown-identity draw")
+    parser.add_argument("--write-calibration", help="merge measured calibration tables into this file")
+    parser.add_argument("--output", help="write full results (including ROC points) as JSON")
+    args = parser.parse_args()
+
+    if args.events:
+        results = evaluate_events(args)
+    elif args.source:
+        results = evaluate_photos(args)
+    else:
+        parser.error("give a labeled photo set or --events")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
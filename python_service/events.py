@@ -0,0 +1,196 @@
+"""
+Recognition event log
+
+Every recognition and verification is recorded as one event: when it
+happened, what it cost per stage, the top-k scores and which model
+answered. Requests only put the event on an in-memory queue; a
+background thread writes queued events to a SQLite WAL database in
+batches, so logging never adds a disk or database round trip to a scan.
+If the writer falls behind, events are dropped and counted rather than
+slowing recognition down.
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    kind TEXT NOT NULL,
+    model TEXT,
+    recognized INTEGER,
+    employee_id INTEGER,
+    confidence REAL,
+    total_ms REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+"""
+
+
+def open_db(path):
+    db = sqlite3.connect(path, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def read_events(path, since=None, until=None, kind=None, limit=None):
+    """Events from a log database, oldest first (analytics, evaluate.py)"""
+    clauses, params = [], []
+    if since is not None:
+        clauses.append("ts >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("ts < ?")
+        params.append(until)
+    if kind:
+        clauses.append("kind = ?")
+        params.append(kind)
+    sql = "SELECT data FROM events"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY id"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    db = sqlite3.connect(path)
+    try:
+        return [json.loads(row[0]) for row in db.execute(sql, params)]
+    finally:
+        db.close()
+
+
+class EventLog:
+    """Bounded queue drained into SQLite by one writer thread"""
+
+    def __init__(self, path=None, batch_size=None, flush_seconds=None, queue_max=None):
+        self.path = path or config.EVENTS_DB
+        self.batch_size = batch_size or config.EVENT_BATCH_SIZE
+        self.flush_seconds = flush_seconds or config.EVENT_FLUSH_SECONDS
+        self._queue = queue.Queue(maxsize=queue_max or config.EVENT_QUEUE_MAX)
+        self._stopping = threading.Event()
+        self._thread = None
+        # Opened on first use, so creating the app does not touch the disk
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    def _connection(self):
+        """The log database (callers hold self._db_lock)"""
+        if self._db is None:
+            self._db = open_db(self.path)
+        return self._db
+
+    def record(self, kind, event):
+        """Queue an event; never blocks the caller"""
+        event = {"ts": time.time(), "kind": kind, **event}
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self, batch):
+        rows = [
+            (e["ts"], e["kind"], e.get("model"), int(bool(e.get("recognized", e.get("verified")))),
+             e.get("employeeId"), e.get("confidence"), e.get("timings", {}).get("total"), json.dumps(e))
+            for e in batch
+        ]
+        try:
+            with self._db_lock, self._connection() as db:
+                db.executemany(
+                    "INSERT INTO events (ts, kind, model, recognized, employee_id, confidence, total_ms, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+            self.written += len(rows)
+        except Exception as e:
+            print(f"❌ Error writing {len(rows)} recognition events: {e}")
+            self.dropped += len(rows)
+
+    def _drain(self, wait):
+        """Collect up to batch_size events, waiting at most `wait` seconds for the first"""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=wait) if wait else self._queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _writer(self):
+        while not self._stopping.is_set():
+            batch = self._drain(self.flush_seconds)
+            if batch:
+                self._write(batch)
+        # Flush whatever is left on shutdown
+        while True:
+            batch = self._drain(0)
+            if not batch:
+                break
+            self._write(batch)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._writer, name="event-log", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def recent(self, limit=100, kind=None):
+        sql = "SELECT data FROM events" + (" WHERE kind = ?" if kind else "") + " ORDER BY id DESC LIMIT ?"
+        params = (kind, limit) if kind else (limit,)
+        with self._db_lock:
+            return [json.loads(row[0]) for row in self._connection().execute(sql, params)]
+
+    def stats(self, since):
+        with self._db_lock:
+            rows = self._connection().execute(
+                "SELECT kind, model, COUNT(*), SUM(recognized), AVG(confidence), AVG(total_ms) "
+                "FROM events WHERE ts >= ? GROUP BY kind, model", (since,)
+            ).fetchall()
+        return [
+            {"kind": kind, "model": model, "events": count, "accepted": accepted or 0,
+             "avg_confidence": avg_confidence, "avg_total_ms": avg_total_ms}
+            for kind, model, count, accepted, avg_confidence, avg_total_ms in rows
+        ]
+
+    def describe(self):
+        return {"path": self.path, "queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+
+router = APIRouter()
+
+
+def _log(request):
+    log = request.app.state.events
+    if log is None:
+        raise HTTPException(status_code=404, detail="Recognition event log is disabled")
+    return log
+
+
+@router.get("/events")
+async def recent_events(request: Request,
+                        limit: int = Query(100, ge=1, le=1000),
+                        kind: str = Query(None)):
+    """Most recent recognition events, newest first"""
+    return {"events": _log(request).recent(limit, kind)}
+
+
+@router.get("/events/stats")
+async def event_stats(request: Request, hours: float = Query(24, gt=0)):
+    """Event counts, accept rate and latency per kind and model"""
+    log = _log(request)
+    return {"since_hours": hours, "groups": log.stats(time.time() - hours * 3600), **log.describe()}
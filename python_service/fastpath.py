@@ -0,0 +1,250 @@
+"""
+Binary fast path for the Node backend
+
+A persistent Unix socket carrying length-prefixed frames, so a scan costs
+one write of the raw image bytes instead of a multipart upload parsed
+into a temp file. Frames on one connection are processed concurrently
+(up to FASTPATH_MAX_PIPELINE at a time, then admission control decides)
+and answered as they finish; the client matches each response to its
+request by id, so one slow request never holds up the others.
+
+Request frame:   uint32 length | uint32 request id | uint8 op | uint8 top_k | image bytes
+                 (op 2 adds uint8 site length | site before the image; op 3 adds
+                 uint8 site length | site | uint8 camera length | camera, either
+                 possibly empty; text fields are UTF-8)
+Response frame:  uint32 length | uint32 request id | compact JSON result
+                 (refused requests get {"error", "status": 429/503, "retry_after"};
+                 a malformed stream gets an error with request id 0, then the connection closes)
+
+Integers are big-endian; lengths exclude the 4-byte length prefix.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import struct
+
+from starlette.concurrency import run_in_threadpool
+
+import admission
+import config
+
+HEADER = struct.Struct(">I")
+REQUEST_ID = struct.Struct(">I")
+OP_PING = 0
+OP_RECOGNIZE = 1
+OP_RECOGNIZE_AT_SITE = 2
+OP_RECOGNIZE_WITH_CONTEXT = 3
+
+
+class FrameError(Exception):
+    """Raised for malformed or oversized frames"""
+
+
+def short_field(text):
+    """uint8 length + UTF-8 bytes, truncated to 255 bytes"""
+    encoded = (text or "").encode("utf-8")[:255]
+    return bytes((len(encoded),)) + encoded
+
+
+def encode_request(request_id, op, image=b"", top_k=1, site=None, camera=None):
+    if site or camera:
+        # The camera keys the recent-recognition cache, as on the HTTP path
+        payload = REQUEST_ID.pack(request_id) + bytes((OP_RECOGNIZE_WITH_CONTEXT, top_k)) + \
+            short_field(site) + short_field(camera) + image
+    else:
+        payload = REQUEST_ID.pack(request_id) + bytes((op, top_k)) + image
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_response(request_id, result):
+    payload = REQUEST_ID.pack(request_id) + json.dumps(result, separators=(",", ":")).encode()
+    return HEADER.pack(len(payload)) + payload
+
+
+def split_frame(frame):
+    """(request id, payload) of a frame without its length prefix"""
+    if len(frame) < REQUEST_ID.size:
+        raise FrameError("frame too short for a request id")
+    (request_id,) = REQUEST_ID.unpack_from(frame)
+    return request_id, frame[REQUEST_ID.size:]
+
+
+def compact_result(result):
+    """Only the fields the scan route needs; names come from the backend's own database"""
+    compact = {
+        "recognized": result["recognized"],
+        "confidence": result["confidence"],
+        "raw_score": result.get("raw_score", 0.0),
+        "margin": result.get("margin", 0.0),
+        "candidates": [[c["employeeId"], c["confidence"]] for c in result.get("candidates", [])],
+        "model_used": result.get("model_used"),
+        "search_scope": result.get("search_scope")
+    }
+    if result["recognized"]:
+        compact["employeeId"] = result["employeeId"]
+    if result.get("degradation"):
+        compact["degradation"] = result["degradation"]
+    if result.get("spoof"):
+        compact["spoof"] = True
+        compact["liveness_score"] = result["liveness_score"]
+    return compact
+
+
+def read_short_field(payload, offset, name):
+    """(text or None, offset after it) of a uint8-length field"""
+    if len(payload) <= offset or len(payload) < offset + 1 + payload[offset]:
+        raise FrameError(f"{name} field overruns the payload")
+    end = offset + 1 + payload[offset]
+    return payload[offset + 1:end].decode("utf-8", "replace") or None, end
+
+
+def handle_payload(app, payload, plan=None):
+    """Result dict for one request payload (blocking)"""
+    if len(payload) < 2:
+        raise FrameError("payload too short")
+    op, top_k = payload[0], payload[1]
+    if op == OP_PING:
+        return {"ok": True, "model_used": app.state.engine.model_name}
+    offset, site, camera = 2, None, None
+    if op in (OP_RECOGNIZE_AT_SITE, OP_RECOGNIZE_WITH_CONTEXT):
+        site, offset = read_short_field(payload, offset, "site")
+    if op == OP_RECOGNIZE_WITH_CONTEXT:
+        camera, offset = read_short_field(payload, offset, "camera")
+    elif op not in (OP_RECOGNIZE, OP_RECOGNIZE_AT_SITE):
+        raise FrameError(f"unknown op {op}")
+    # Imported here: service imports this module to start the listener
+    from service import recognition_response
+    top_k = min(max(top_k, 1), config.MAX_TOP_K)
+    return compact_result(recognition_response(app, payload[offset:], top_k, "fastpath", site, camera, plan=plan))
+
+
+async def read_frame(reader):
+    """Next frame payload, or None on a clean end of stream"""
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise FrameError("truncated frame header")
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > config.FASTPATH_MAX_FRAME_MB * 1024 * 1024:
+        raise FrameError(f"frame of {length} bytes exceeds FASTPATH_MAX_FRAME_MB")
+    return await reader.readexactly(length)
+
+
+async def answer(app, request_id, payload, writer, write_lock):
+    """Process one request and write its response frame"""
+    try:
+        async with app.state.admission.slot() as plan:
+            result = await run_in_threadpool(handle_payload, app, payload, plan)
+    except admission.Overloaded as e:
+        result = {"error": str(e), "status": e.status, "retry_after": e.retry_after}
+    except Exception as e:
+        print(f"❌ Error in fast path recognition: {e}")
+        result = {"error": str(e)}
+    async with write_lock:
+        writer.write(encode_response(request_id, result))
+        await writer.drain()
+
+
+async def serve_connection(app, reader, writer):
+    write_lock = asyncio.Lock()
+    # Bounds the requests one connection can have in flight; reading stops until one finishes
+    pipeline = asyncio.Semaphore(config.FASTPATH_MAX_PIPELINE)
+    tasks = set()
+
+    def finished(task):
+        tasks.discard(task)
+        pipeline.release()
+        if not task.cancelled() and task.exception() is not None and \
+                not isinstance(task.exception(), ConnectionError):
+            print(f"❌ Error answering a fast path request: {task.exception()}")
+
+    try:
+        while True:
+            try:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                request_id, payload = split_frame(frame)
+            except (FrameError, asyncio.IncompleteReadError) as e:
+                # The stream is out of sync; report and drop the connection
+                async with write_lock:
+                    writer.write(encode_response(0, {"error": str(e)}))
+                break
+            await pipeline.acquire()
+            task = asyncio.ensure_future(answer(app, request_id, payload, writer, write_lock))
+            tasks.add(task)
+            task.add_done_callback(finished)
+        # Answer what is already in flight before closing
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(app, path=None):
+    """Listen on the Unix socket; returns the asyncio server"""
+    path = path or config.FASTPATH_SOCKET
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(lambda r, w: serve_connection(app, r, w), path=path)
+    print(f"⚡ Fast path listening on {path}")
+    return server
+
+
+class FastPathClient:
+    """Blocking client over one persistent connection (benchmarks, scripts, tests)
+
+    call() waits for its own answer; send() and receive() pipeline several
+    requests, with responses arriving in completion order.
+    """
+
+    def __init__(self, path=None, timeout=30):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path or config.FASTPATH_SOCKET)
+        self.next_id = 1
+
+    def _read_exactly(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("fast path connection closed")
+            data += chunk
+        return bytes(data)
+
+    def send(self, op, image=b"", top_k=1, site=None, camera=None):
+        """Send one request without waiting; returns its request id"""
+        request_id = self.next_id
+        self.next_id = self.next_id % 0xFFFFFFFF + 1
+        self.sock.sendall(encode_request(request_id, op, image, top_k, site, camera))
+        return request_id
+
+    def receive(self):
+        """Next (request id, result) to arrive"""
+        (length,) = HEADER.unpack(self._read_exactly(HEADER.size))
+        request_id, payload = split_frame(self._read_exactly(length))
+        return request_id, json.loads(payload)
+
+    def call(self, op, image=b"", top_k=1, site=None, camera=None):
+        request_id = self.send(op, image, top_k, site, camera)
+        answered, result = self.receive()
+        if answered != request_id:
+            raise ConnectionError(f"fast path answered request {answered} while waiting for {request_id}")
+        return result
+
+    def recognize(self, image, top_k=1, site=None, camera=None):
+        return self.call(OP_RECOGNIZE, image, top_k, site, camera)
+
+    def ping(self):
+        return self.call(OP_PING)
+
+    def close(self):
+        self.sock.close()
+
@@ -0,0 +1,346 @@
+"""
+Face gallery
+
+Holds the enrolled embeddings as one contiguous matrix next to the
+employee ids and metadata, so matching is a single vectorized pass
+instead of a Python loop over known_face_encodings.
+
+A stored faceEncoding may hold embeddings from several models, each
+tagged with the model fingerprint ("<fingerprint>|<base64>", entries
+separated by ";"). Each gallery loads only its own model's entries;
+untagged legacy encodings are accepted by the primary gallery.
+
+Rows can be partitioned by an employee attribute (e.g. city) or by a
+hash of the id; a search can then be scoped to one partition, and with
+shard processes attached (shards.py) searches are scattered across them.
+"""
+
+import base64
+import pickle
+import zlib
+from collections import Counter
+
+import numpy as np
+
+import config
+
+
+FINGERPRINT_SEPARATOR = "|"
+ENTRY_SEPARATOR = ";"
+
+
+def encode_embedding(embedding, encoding_format="pickle", fingerprint=None):
+    """Serialize an embedding to the base64 string stored by the backend"""
+    embedding = np.asarray(embedding, dtype=np.float64)
+    if encoding_format == "raw":
+        payload = embedding.tobytes()
+    else:
+        payload = pickle.dumps(embedding)
+    encoded = base64.b64encode(payload).decode('utf-8')
+    return f"{fingerprint}{FINGERPRINT_SEPARATOR}{encoded}" if fingerprint else encoded
+
+
+def decode_embedding(face_encoding):
+    """Decode a stored embedding, accepting both pickled and raw float64 payloads"""
+    payload = base64.b64decode(face_encoding)
+    # Pickle protocol 2+ always starts with the PROTO opcode, but so do about
+    # 1 in 256 raw payloads (it is just the first mantissa byte there)
+    if payload[:1] == b'\x80':
+        try:
+            return np.asarray(pickle.loads(payload), dtype=np.float64)
+        except Exception:
+            if len(payload) % 8:
+                raise
+    return np.frombuffer(payload, dtype=np.float64)
+
+
+def split_face_encoding(value):
+    """Split a stored faceEncoding into {fingerprint or None: encoded entry}"""
+    entries = {}
+    for entry in (value or "").split(ENTRY_SEPARATOR):
+        if not entry:
+            continue
+        if FINGERPRINT_SEPARATOR in entry:
+            fingerprint, _ = entry.split(FINGERPRINT_SEPARATOR, 1)
+            entries[fingerprint] = entry
+        else:
+            entries[None] = entry
+    return entries
+
+
+def join_face_encoding(entries):
+    """Inverse of split_face_encoding"""
+    return ENTRY_SEPARATOR.join(entry for entry in entries.values() if entry)
+
+
+def merge_face_encoding(value, fingerprint, entry, legacy_fingerprint=None):
+    """Add or replace one model's entry in a stored faceEncoding
+
+    An untagged legacy entry is tagged with legacy_fingerprint so it stays
+    attributable once several models share the field.
+    """
+    entries = split_face_encoding(value)
+    if None in entries and legacy_fingerprint:
+        entries[legacy_fingerprint] = f"{legacy_fingerprint}{FINGERPRINT_SEPARATOR}{entries.pop(None)}"
+    entries[fingerprint] = entry
+    return join_face_encoding(entries)
+
+
+def parse_face_encoding(value):
+    """Decode a stored faceEncoding into {fingerprint or None: embedding}"""
+    return {
+        fingerprint: decode_embedding(entry.split(FINGERPRINT_SEPARATOR, 1)[-1])
+        for fingerprint, entry in split_face_encoding(value).items()
+    }
+
+
+def fetch_employees(backend_url=None):
+    """Employees from the Node backend, or None when the request fails"""
+    import requests
+
+    response = requests.get(f"{backend_url or config.BACKEND_URL}/api/employees")
+    if response.status_code != 200:
+        print("❌ Failed to load employees from database")
+        return None
+    return response.json()
+
+
+def _dimension(embeddings):
+    """Embedding size of a gallery matrix, or None while it is empty"""
+    return embeddings.shape[1] if embeddings.shape[0] else None
+
+
+def partition_key(value):
+    """Normalized partition name, so 'Cairo ' and 'cairo' share a partition"""
+    if value is None or value == "":
+        return None
+    return str(value).strip().lower()
+
+
+def hash_partition(employee_id, partitions):
+    """Stable hash bucket of an employee id (same in every process)"""
+    return str(zlib.crc32(str(employee_id).encode()) % partitions)
+
+
+class Gallery:
+    """Enrolled face embeddings, searchable in one matrix operation"""
+
+    def __init__(self, metric="cosine", fingerprint=None, accept_untagged=True, partition_by=None):
+        self.metric = metric
+        self.fingerprint = fingerprint
+        self.accept_untagged = accept_untagged
+        # Employee field to partition by, 'hash', or None
+        self.partition_by = partition_by or None
+        self.partitions = {}
+        self.shards = None
+        self.ids = []
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.records = {}
+        # O(1) lookups for 1:1 verification: id -> gallery rows, badge code -> id
+        self.rows_by_id = {}
+        self.ids_by_code = {}
+        # (ids, embeddings, records, partitions, rows_by_id) of the current version, replaced in
+        # one assignment by _swap; searches read it once so a concurrent swap cannot mix versions
+        self.state = (self.ids, self.embeddings, self.records, self.partitions, self.rows_by_id)
+
+    def __len__(self):
+        return len(self.state[0])
+
+    @property
+    def dimension(self):
+        return _dimension(self.state[1])
+
+    def _prepare(self, matrix):
+        """Pre-normalize rows for cosine scoring"""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if self.metric == "cosine" and matrix.size:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = matrix / norms
+        return matrix
+
+    def load_employees(self, employees):
+        """Replace the gallery with the employees returned by the backend"""
+        ids, vectors, records = [], [], {}
+        for employee in employees:
+            if not employee.get('faceEncoding'):
+                continue
+            try:
+                entries = parse_face_encoding(employee['faceEncoding'])
+                embedding = entries.get(self.fingerprint) if self.fingerprint else None
+                if embedding is None and self.accept_untagged:
+                    embedding = entries.get(None)
+                if embedding is None:
+                    # Only enrolled with another model
+                    continue
+                vectors.append(embedding)
+                ids.append(employee['id'])
+                records[employee['id']] = {
+                    'name': employee['name'],
+                    'employeeId': employee['employeeId'],
+                    'specialty': employee['specialty'],
+                    'city': employee['city'],
+                    'birthDate': employee['birthDate']
+                }
+            except Exception as e:
+                print(f"❌ Error loading face encoding for employee {employee.get('id')}: {e}")
+
+        # Embeddings from a different model cannot be compared; keep the dominant size
+        if vectors:
+            dimension = Counter(len(v) for v in vectors).most_common(1)[0][0]
+            skipped = [i for i, v in zip(ids, vectors) if len(v) != dimension]
+            if skipped:
+                print(f"⚠️ Skipping {len(skipped)} embeddings with a size other than {dimension}: {skipped}")
+            kept = [k for k, v in enumerate(vectors) if len(v) == dimension]
+            ids = [ids[k] for k in kept]
+            matrix = np.stack([vectors[k] for k in kept])
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+
+        self._swap(ids, self._prepare(matrix), records)
+        return len(self.ids)
+
+    def add_rows(self, ids, embeddings, records):
+        """Insert or replace the rows of the given employees"""
+        replaced = set(ids)
+        keep = [row for row, employee_id in enumerate(self.ids) if employee_id not in replaced]
+        new_rows = self._prepare(np.stack([np.asarray(e, dtype=np.float64) for e in embeddings]))
+        if keep and new_rows.shape[1] != self.dimension:
+            raise ValueError(f"Embedding size {new_rows.shape[1]} does not match gallery size {self.dimension}")
+        matrix = np.vstack([self.embeddings[keep], new_rows]) if keep else new_rows
+        merged = {**self.records, **records}
+        self._swap([self.ids[row] for row in keep] + list(ids), matrix, merged)
+        return len(self.ids)
+
+    def load_prepared(self, ids, embeddings, records):
+        """Install rows already prepared by a gallery of the same model (replication.py)"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(ids):
+            raise ValueError(f"{len(ids)} ids do not match an embedding matrix of shape {embeddings.shape}")
+        self._swap(list(ids), embeddings, records)
+        return len(self.ids)
+
+    def _swap(self, ids, embeddings, records, partitions=None):
+        """Install new gallery contents together with their lookup indexes
+
+        partitions overrides the ones derived from records (shard
+        processes receive them from the parent gallery).
+        """
+        rows_by_id = {}
+        for row, employee_id in enumerate(ids):
+            rows_by_id.setdefault(employee_id, []).append(row)
+        # Only employees that kept a row, so a resolved id always has something to verify against
+        records = {employee_id: record for employee_id, record in records.items() if employee_id in rows_by_id}
+        ids_by_code = {record['employeeId']: employee_id for employee_id, record in records.items()}
+        if partitions is None:
+            partitions = self._partition(ids, records)
+        self.state = (ids, embeddings, records, partitions, rows_by_id)
+        # Convenience views of the same version for callers outside the search path
+        self.ids, self.embeddings, self.records = ids, embeddings, records
+        self.rows_by_id, self.ids_by_code, self.partitions = rows_by_id, ids_by_code, partitions
+        if self.shards is not None:
+            self.shards.load(ids, embeddings, partitions)
+
+    def _partition(self, ids, records):
+        """partition name -> row indexes; rows without a value are only searched globally"""
+        if not self.partition_by:
+            return {}
+        rows = {}
+        for row, employee_id in enumerate(ids):
+            if self.partition_by == "hash":
+                key = hash_partition(employee_id, config.GALLERY_HASH_PARTITIONS)
+            else:
+                key = partition_key(records.get(employee_id, {}).get(self.partition_by))
+            if key is not None:
+                rows.setdefault(key, []).append(row)
+        return {key: np.asarray(r, dtype=np.int64) for key, r in rows.items()}
+
+    def attach_shards(self, shards):
+        """Serve top_k from shard processes; they receive every gallery update"""
+        self.shards = shards
+        ids, embeddings, _, partitions, _ = self.state
+        shards.load(ids, embeddings, partitions)
+
+    def describe_partitions(self):
+        return {
+            "by": self.partition_by,
+            "partitions": {key: len(rows) for key, rows in self.partitions.items()},
+            "shards": self.shards.describe() if self.shards is not None else None
+        }
+
+    def load_from_backend(self, backend_url=None):
+        """Fetch employees from the Node backend and rebuild the gallery"""
+        print("🔄 Loading face database...")
+        employees = fetch_employees(backend_url)
+        if employees is None:
+            return len(self.ids)
+        count = self.load_employees(employees)
+        print(f"✅ Loaded {count} face embeddings from database")
+        return count
+
+    def scores(self, embedding, rows=None):
+        """Score a query embedding against gallery rows (all by default; higher is better)"""
+        return self._scores(self.state[1], embedding, rows)
+
+    def _scores(self, embeddings, embedding, rows=None):
+        """scores() against the embedding matrix of one state"""
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        dimension = _dimension(embeddings)
+        if dimension is None or query.shape[0] != dimension:
+            if dimension is not None:
+                print(f"⚠️ Query embedding size {query.shape[0]} does not match gallery size {dimension}")
+            return np.empty(0, dtype=np.float32)
+        embeddings = embeddings if rows is None else embeddings[rows]
+        if self.metric == "euclidean":
+            return 1.0 - np.linalg.norm(embeddings - query, axis=1)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return np.zeros(len(embeddings), dtype=np.float32)
+        return embeddings @ (query / norm)
+
+    def resolve_id(self, employee_id=None, employee_code=None):
+        """Find a gallery id from a database id or a badge employeeId code"""
+        if employee_id is not None and employee_id in self.state[4]:
+            return employee_id
+        if employee_code is not None:
+            return self.ids_by_code.get(employee_code)
+        return None
+
+    def verify(self, embedding, employee_id):
+        """1:1 score against one identity's rows only; None if not enrolled"""
+        _, embeddings, _, _, rows_by_id = self.state
+        rows = rows_by_id.get(employee_id)
+        if not rows:
+            return None
+        scores = self._scores(embeddings, embedding, rows)
+        return float(scores.max()) if scores.size else 0.0
+
+    def top_k(self, embedding, k=1, partition=None):
+        """Return the k best (employee id, score) pairs, best first, from one scoring pass
+
+        With a partition only that partition's rows are searched (an
+        unknown partition has no matches).
+        """
+        ids, embeddings, _, partitions, _ = self.state
+        rows = None
+        if partition is not None:
+            partition = partition_key(partition)
+            rows = partitions.get(partition)
+            if rows is None:
+                return []
+        if self.shards is not None:
+            return self.shards.top_k(embedding, k, partition)
+        scores = self._scores(embeddings, embedding, rows)
+        if not scores.size:
+            return []
+        k = min(k, scores.size)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        if rows is not None:
+            return [(ids[rows[i]], float(scores[i])) for i in best]
+        return [(ids[i], float(scores[i])) for i in best]
+
+    def best_match(self, embedding):
+        """Return (employee id, score) of the closest gallery row"""
+        matches = self.top_k(embedding, 1)
+        return matches[0] if matches else (None, 0.0)
@@ -0,0 +1,340 @@
+"""
+Asynchronous recognition jobs
+
+Clients submit an image and get a job id back immediately; worker threads
+drain a persistent SQLite queue at the engine's own pace, and the result
+is either polled from /jobs/{id} or POSTed to the job's callback URL.
+Bursts queue up on disk instead of holding HTTP requests open until they
+time out.
+
+Several service workers can share one queue database. A running job
+belongs to the process that claimed it, which renews a lease on it
+while it works; a job is only re-queued once its owner has died or
+stopped renewing, so a restarted worker never takes over jobs its
+siblings are still running. Owners carry a random per-process token, so
+a restart that reuses the hostname and pid still recovers the jobs its
+previous incarnation left running. The database is opened on first use,
+not when the app is created.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from fastapi import APIRouter, File, Form, HTTPException, Query, Request, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    image_path TEXT NOT NULL,
+    top_k INTEGER NOT NULL,
+    site TEXT,
+    callback_url TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT,
+    webhook_status TEXT,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class QueueFull(Exception):
+    """Raised when the queue already holds JOB_QUEUE_MAX pending jobs"""
+
+
+# Random per process: a restarted container often gets the same hostname and pid again
+PROCESS_TOKEN = uuid.uuid4().hex[:12]
+
+
+def process_owner():
+    """Identifies this process among the workers sharing a queue database (host:pid:token)"""
+    return f"{socket.gethostname()}:{os.getpid()}:{PROCESS_TOKEN}"
+
+
+def owner_alive(owner):
+    """False only for an owner known to be gone (a dead process, or an earlier one with our pid)"""
+    host, _, rest = (owner or "").partition(":")
+    pid, _, token = rest.partition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        # Another host: only its lease tells
+        return True
+    if int(pid) == os.getpid():
+        # This pid is us; jobs under another (or no) token belong to a process that ran before us
+        return token == PROCESS_TOKEN
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class JobQueue:
+    """SQLite-backed recognition job queue with worker threads"""
+
+    def __init__(self, processor, db_path=None, image_dir=None, workers=None):
+        # processor(contents, top_k, site) -> result dict; blocking
+        self.processor = processor
+        self.db_path = db_path or config.JOBS_DB
+        self.image_dir = image_dir or config.JOBS_DIR
+        self.workers = workers or config.JOB_WORKERS
+        self.lease_seconds = config.JOB_LEASE_SECONDS
+        self.owner = process_owner()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._last_cleanup = 0.0
+        self._last_recovery = 0.0
+        self._db = None
+
+    def _connection(self):
+        """The queue database, opened on first use (callers hold self._lock)"""
+        if self._db is None:
+            db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+            # Queues created before jobs carried a site or an owner
+            for column, kind in (("site", "TEXT"), ("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._db = db
+        return self._db
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def submit(self, contents, top_k=1, callback_url=None, site=None):
+        """Persist a job and wake a worker; returns the job id"""
+        if self.depth() >= config.JOB_QUEUE_MAX:
+            raise QueueFull()
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.image_dir, exist_ok=True)
+        image_path = os.path.join(self.image_dir, f"{job_id}.img")
+        with open(image_path, "wb") as f:
+            f.write(contents)
+        self._execute(
+            "INSERT INTO jobs (id, status, image_path, top_k, site, callback_url, created_at) "
+            "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, image_path, top_k, site, callback_url, time.time())
+        )
+        self._wakeup.set()
+        return job_id
+
+    def depth(self):
+        """Jobs waiting or in progress"""
+        return self._query("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')")[0][0]
+
+    def get(self, job_id):
+        """A job as a response dict, or None"""
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = rows[0]
+        response = {
+            "job_id": job["id"],
+            "status": job["status"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "result": json.loads(job["result"]) if job["result"] else None,
+            "error": job["error"],
+            "webhook_status": job["webhook_status"]
+        }
+        if job["status"] == "queued":
+            response["position"] = self._query(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (job["created_at"],)
+            )[0][0] + 1
+        return response
+
+    def stats(self):
+        counts = {row[0]: row[1] for row in self._query("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+        return {"workers": self.workers, "counts": counts}
+
+    def _claim(self):
+        """Atomically move the oldest queued job to running, owned and leased by this process"""
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    db.execute("UPDATE jobs SET status = 'running', started_at = ?, owner = ?, lease_until = ? "
+                               "WHERE id = ?", (now, self.owner, now + self.lease_seconds, row["id"]))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return row
+
+    def _renew(self):
+        """Extend the lease on every job this process is running (owner includes PROCESS_TOKEN)"""
+        self._execute("UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                      (time.time() + self.lease_seconds, self.owner))
+
+    def recover(self):
+        """Re-queue running jobs whose owner died or whose lease ran out; returns how many"""
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                stale = [
+                    row["id"] for row in db.execute("SELECT id, owner, lease_until FROM jobs WHERE status = 'running'")
+                    # Jobs from before leases have neither owner nor lease
+                    if row["lease_until"] is None or row["lease_until"] < now or not owner_alive(row["owner"])
+                ]
+                for job_id in stale:
+                    db.execute("UPDATE jobs SET status = 'queued', started_at = NULL, owner = NULL, "
+                               "lease_until = NULL WHERE id = ? AND status = 'running'", (job_id,))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        self._last_recovery = now
+        if stale:
+            print(f"🔄 Re-queued {len(stale)} interrupted recognition jobs")
+            self._wakeup.set()
+        return len(stale)
+
+    def _process(self, job):
+        try:
+            with open(job["image_path"], "rb") as f:
+                contents = f.read()
+            result = self.processor(contents, job["top_k"], job["site"])
+            self._execute("UPDATE jobs SET status = 'done', finished_at = ?, result = ? WHERE id = ?",
+                          (time.time(), json.dumps(result), job["id"]))
+        except Exception as e:
+            print(f"❌ Recognition job {job['id']} failed: {e}")
+            self._execute("UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                          (time.time(), str(e), job["id"]))
+        finally:
+            try:
+                os.unlink(job["image_path"])
+            except OSError:
+                pass
+        if job["callback_url"]:
+            self._deliver_webhook(job["id"], job["callback_url"])
+
+    def _deliver_webhook(self, job_id, callback_url):
+        """POST the finished job to its callback URL, retrying with backoff"""
+        import requests
+
+        payload = self.get(job_id)
+        status = "failed"
+        for attempt in range(config.JOB_WEBHOOK_RETRIES):
+            try:
+                response = requests.post(callback_url, json=payload, timeout=config.JOB_WEBHOOK_TIMEOUT)
+                if response.status_code < 300:
+                    status = "delivered"
+                    break
+                status = f"http {response.status_code}"
+            except Exception as e:
+                status = f"error: {e}"
+            if attempt + 1 < config.JOB_WEBHOOK_RETRIES:
+                time.sleep(2 ** attempt)
+        self._execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (status, job_id))
+
+    def _cleanup(self):
+        """Forget finished jobs older than JOB_RETENTION_HOURS"""
+        cutoff = time.time() - config.JOB_RETENTION_HOURS * 3600
+        self._execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+        self._last_cleanup = time.time()
+
+    def _heartbeat(self):
+        """Renew leases well before they run out, and take over jobs of dead workers"""
+        while not self._stopping.wait(self.lease_seconds / 3.0):
+            try:
+                self._renew()
+                if time.time() - self._last_recovery > self.lease_seconds:
+                    self.recover()
+            except Exception as e:
+                print(f"❌ Error renewing recognition job leases: {e}")
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            job = self._claim()
+            if job is None:
+                if time.time() - self._last_cleanup > 3600:
+                    self._cleanup()
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                continue
+            self._process(job)
+
+    def start(self):
+        self._stopping.clear()
+        self.recover()
+        targets = [(self._worker, f"recognition-job-{i}") for i in range(self.workers)]
+        for target, name in targets + [(self._heartbeat, "recognition-job-lease")]:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"✅ Recognition job queue started with {self.workers} workers ({self.depth()} pending)")
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+
+router = APIRouter()
+
+
+@router.post("/jobs/recognize", status_code=202)
+async def submit_recognition_job(request: Request,
+                                 file: UploadFile = File(...),
+                                 top_k: int = Query(config.DEFAULT_TOP_K, ge=1, le=config.MAX_TOP_K),
+                                 callback_url: str = Form(None),
+                                 site: str = Form(None)):
+    """Queue an image for recognition; poll /jobs/{job_id} or wait for the callback"""
+    queue = request.app.state.jobs
+    contents = await file.read()
+    # The image write and the SQLite insert block, so they run off the event loop
+    try:
+        job_id = await run_in_threadpool(queue.submit, contents, top_k, callback_url, site)
+    except QueueFull:
+        raise HTTPException(status_code=429, detail="Recognition queue is full, retry later")
+    return await run_in_threadpool(queue.get, job_id)
+
+
+@router.get("/jobs/{job_id}")
+async def get_recognition_job(request: Request, job_id: str):
+    """Status and, once finished, the recognition result of a job"""
+    job = await run_in_threadpool(request.app.state.jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+@router.get("/jobs")
+async def recognition_job_stats(request: Request):
+    """Job counts by status"""
+    return await run_in_threadpool(request.app.state.jobs.stats)
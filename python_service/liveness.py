@@ -0,0 +1,169 @@
+"""
+Liveness (anti-spoofing) checks
+
+A check scores the face crop the engine's detector already produced, so
+a print or screen replay is rejected before the embedding model runs.
+Checks register themselves by name like engines do; the service picks
+one from config.LIVENESS_CHECK ('' disables the stage).
+"""
+
+import numpy as np
+
+import config
+
+# Registered check classes, keyed by name
+CHECKS = {}
+
+
+def register_check(name):
+    """Class decorator that registers a liveness check under the given name"""
+    def decorator(cls):
+        cls.name = name
+        CHECKS[name] = cls
+        return cls
+    return decorator
+
+
+def get_check(name=None):
+    """Instantiate the configured liveness check, or None when disabled"""
+    name = config.LIVENESS_CHECK if name is None else name
+    if not name:
+        return None
+    if name not in CHECKS:
+        raise ValueError(f"Unknown liveness check '{name}'. Available: {', '.join(sorted(CHECKS))}")
+    return CHECKS[name]()
+
+
+class SpoofDetected(Exception):
+    """Raised by FaceEngine.represent when the liveness check rejects a face"""
+
+    def __init__(self, score, check):
+        super().__init__(f"liveness score {score:.3f} below {config.LIVENESS_THRESHOLD}")
+        self.score = score
+        self.check = check
+
+
+class LivenessCheck:
+    """Base class: score(image, face) returns the probability the face is live"""
+
+    name = None
+
+    def __init__(self):
+        self.threshold = config.LIVENESS_THRESHOLD
+        self.loaded = False
+
+    def load(self):
+        if not self.loaded:
+            self._load()
+            self.loaded = True
+
+    def _load(self):
+        pass
+
+    def score(self, image, face):
+        raise NotImplementedError
+
+    def check(self, image, face):
+        """Raise SpoofDetected unless the face looks live; returns the score"""
+        self.load()
+        score = self.score(image, face)
+        if score is not None and score < self.threshold:
+            print(f"🛑 Liveness check '{self.name}' rejected face: {score:.3f}")
+            raise SpoofDetected(score, self.name)
+        return score
+
+    def describe(self):
+        return {"check": self.name, "threshold": self.threshold}
+
+
+@register_check("texture")
+class TextureCheck(LivenessCheck):
+    """Frequency-domain heuristic, numpy only
+
+    Recaptured faces lose fine detail (prints blur, screens low-pass the
+    image) and screens add moire: isolated peaks in the high band of the
+    spectrum. A live face keeps a smooth, heavier high-frequency tail.
+    The class constants are starting points to tune on your own cameras;
+    the 'onnx' check is the stronger option where a model is available.
+    """
+
+    # Mean spectral amplitude above half Nyquist relative to the 0.1-0.3 band:
+    # a sharp capture sits around 0.2-0.35, a re-photographed print below 0.06
+    HIGH_BAND_MIN = 0.06
+    HIGH_BAND_FULL = 0.15
+    # Max/median amplitude in the high band; moire peaks push it into the hundreds
+    PEAK_RATIO_MAX = 200.0
+    MIN_CROP = 48
+
+    def score(self, image, face):
+        crop = face.crop(image)
+        if crop.ndim != 3 or min(crop.shape[:2]) < self.MIN_CROP:
+            # Too small to judge; let recognition decide
+            return None
+        gray = crop.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        gray -= gray.mean()
+        height, width = gray.shape
+        gray *= np.outer(np.hanning(height), np.hanning(width)).astype(np.float32)
+
+        spectrum = np.abs(np.fft.fftshift(np.fft.fft2(gray)))
+        fy = (np.arange(height) - height // 2) / (height / 2)
+        fx = (np.arange(width) - width // 2) / (width / 2)
+        radius = np.sqrt(fy[:, None] ** 2 + fx[None, :] ** 2)
+        mid = spectrum[(radius > 0.1) & (radius <= 0.3)].mean()
+        if mid <= 0:
+            return 0.0
+        high = spectrum[(radius > 0.5) & (radius <= 1.0)]
+
+        sharpness = (high.mean() / mid - self.HIGH_BAND_MIN) / (self.HIGH_BAND_FULL - self.HIGH_BAND_MIN)
+        moire = high.max() / (np.median(high) + 1e-9) / self.PEAK_RATIO_MAX
+        return float(np.clip(sharpness, 0.0, 1.0) * np.clip(1.5 - moire, 0.0, 1.0))
+
+
+@register_check("onnx")
+class OnnxCheck(LivenessCheck):
+    """Small ONNX anti-spoofing classifier (MiniFASNet-style) on an enlarged face crop"""
+
+    def __init__(self, model_path=None):
+        super().__init__()
+        self.model_path = model_path or config.LIVENESS_MODEL
+        self._session = None
+        self._cv2 = None
+
+    def _load(self):
+        import onnxruntime as ort
+        import cv2
+
+        self._cv2 = cv2
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = config.ONNX_INTRA_OP_THREADS
+        options.inter_op_num_threads = config.ONNX_INTER_OP_THREADS
+        self._session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        _, _, height, width = self._session.get_inputs()[0].shape
+        self._size = (width if isinstance(width, int) else 80, height if isinstance(height, int) else 80)
+
+    def score(self, image, face):
+        # Anti-spoofing models look at the border around the face (paper edges, bezels)
+        x, y, w, h = face.box
+        scale = config.LIVENESS_CROP_SCALE
+        cx, cy = x + w / 2, y + h / 2
+        height, width = image.shape[:2]
+        x0, y0 = int(max(0, cx - w * scale / 2)), int(max(0, cy - h * scale / 2))
+        x1, y1 = int(min(width, cx + w * scale / 2)), int(min(height, cy + h * scale / 2))
+        if x1 <= x0 or y1 <= y0:
+            return None
+        crop = self._cv2.resize(image[y0:y1, x0:x1, ::-1], self._size)
+        blob = crop.astype(np.float32).transpose(2, 0, 1)[np.newaxis]
+
+        input_name = self._session.get_inputs()[0].name
+        logits = self._session.run(None, {input_name: blob})[0].reshape(-1)
+        probabilities = np.exp(logits - logits.max())
+        probabilities /= probabilities.sum()
+        return float(probabilities[config.LIVENESS_LIVE_CLASS])
+
+
+@register_check("mock")
+class MockCheck(LivenessCheck):
+    """Pairs with the mock engine: uploads containing b'spoof' are rejected"""
+
+    def score(self, image, face):
+        return 0.0 if b"spoof" in bytes(image) else 1.0
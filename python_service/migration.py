@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Model migration
+
+Re-embeds every stored employee photo with a new engine in parallel
+background batches and stores the result next to the current encoding,
+tagged with the new model's fingerprint. While a migration runs the
+service serves both galleries (primary first, the new model as
+fallback); /migration/cutover swaps them without a reload, and
+/migration/finish stops serving the old model and optionally purges
+its encodings.
+
+Usage:
+    python migration.py onnx [--workers 4]
+"""
+
+import argparse
+import os
+import threading
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from fastapi import APIRouter, Form, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+import config
+import crops
+import enrollment
+import shards
+from engines import get_engine
+from gallery import (Gallery, encode_embedding, fetch_employees, merge_face_encoding,
+                     split_face_encoding, join_face_encoding)
+
+
+def _embed_photos(batch):
+    """Embed (employee id, photo bytes) pairs in a worker; returns (id, status, embedding)
+
+    Photos with a cached aligned crop skip detection and go straight to
+    the target engine's embed stage.
+    """
+    engine = enrollment.worker_engine
+    cache = crops.get_cache()
+    results = []
+    for employee_id, data in batch:
+        try:
+            cached = cache.get(data, engine) if cache is not None else None
+            if cached is not None:
+                embedding = engine.represent_aligned(cached.aligned)
+            else:
+                embedding, face = engine.represent(engine.decode(data))
+                if embedding is not None and cache is not None:
+                    cache.put(data, face, engine)
+            if embedding is None:
+                results.append((employee_id, "no_face", None))
+            else:
+                results.append((employee_id, "migrated", np.asarray(embedding, dtype=np.float64)))
+        except Exception as e:
+            results.append((employee_id, f"error: {e}", None))
+    return results
+
+
+def fetch_employee(employee_id, backend_url=None):
+    """One employee as currently stored by the Node backend"""
+    import requests
+
+    response = requests.get(f"{backend_url or config.BACKEND_URL}/api/employees/{employee_id}", timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def store_face_encoding(employee_id, face_encoding, backend_url=None):
+    """Write an employee's faceEncoding through the Node backend"""
+    import requests
+
+    requests.post(
+        f"{backend_url or config.BACKEND_URL}/api/employees/{employee_id}/face-encoding",
+        json={"faceEncoding": face_encoding},
+        timeout=30
+    ).raise_for_status()
+
+
+class MigrationRun:
+    """Re-embedding of all employee photos with a target engine"""
+
+    def __init__(self, target_engine, source_fingerprint, workers=None, batch_size=None, on_batch=None):
+        self.target = target_engine if not isinstance(target_engine, str) else get_engine(target_engine)
+        self.source_fingerprint = source_fingerprint
+        self.workers = workers or config.MIGRATION_WORKERS or os.cpu_count() or 1
+        self.batch_size = batch_size or config.MIGRATION_BATCH_SIZE
+        # Called with (ids, embeddings, employees) after each stored batch
+        self.on_batch = on_batch
+        self.counts = {}
+        self.total = 0
+        self.state = "pending"
+        self.error = None
+
+    def _count(self, status, n=1):
+        self.counts[status] = self.counts.get(status, 0) + n
+
+    def _photos(self, employees):
+        """Yield (employee id, photo bytes) for employees still lacking the target model"""
+        for employee in employees:
+            if self.target.fingerprint in split_face_encoding(employee.get("faceEncoding")):
+                self._count("already_migrated")
+                continue
+            path = os.path.join(config.UPLOADS_DIR, employee.get("imagePath") or "")
+            if not employee.get("imagePath") or not os.path.isfile(path):
+                self._count("missing_photo")
+                continue
+            with open(path, "rb") as f:
+                yield employee["id"], f.read()
+
+    def _store(self, results, employees_by_id):
+        """Merge one batch of new embeddings into the stored encodings"""
+        ids, embeddings = [], []
+        for employee_id, status, embedding in results:
+            if embedding is None:
+                if status != "no_face":
+                    print(f"❌ Error re-embedding employee {employee_id}: {status}")
+                self._count(status.split(":")[0])
+                continue
+            employee = employees_by_id[employee_id]
+            entry = encode_embedding(embedding, self.target.encoding_format, self.target.fingerprint)
+            try:
+                # Merge into the encoding as stored now, not as it was when the run started,
+                # so an /encode or employee edit made during the migration is kept
+                employee.update(fetch_employee(employee_id))
+                value = merge_face_encoding(employee.get("faceEncoding"), self.target.fingerprint, entry,
+                                            legacy_fingerprint=self.source_fingerprint)
+                store_face_encoding(employee_id, value)
+                employee["faceEncoding"] = value
+                ids.append(employee_id)
+                embeddings.append(embedding)
+                self._count("migrated")
+            except Exception as e:
+                print(f"❌ Error storing migrated encoding for employee {employee_id}: {e}")
+                self._count("error")
+        if ids and self.on_batch:
+            self.on_batch(ids, embeddings, employees_by_id)
+
+    def run(self):
+        self.state = "running"
+        started = time.time()
+        try:
+            employees = fetch_employees()
+            if employees is None:
+                raise RuntimeError("could not load employees from the backend")
+            self.total = len(employees)
+            employees_by_id = {e["id"]: e for e in employees}
+            print(f"🔄 Migrating {self.total} employees to {self.target.fingerprint}")
+
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     mp_context=mp.get_context("spawn"),
+                                     initializer=enrollment.init_worker,
+                                     initargs=(self.target.name,)) as pool:
+                pending = set()
+                batch = []
+                for item in self._photos(employees):
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        pending.add(pool.submit(_embed_photos, batch))
+                        batch = []
+                    if len(pending) >= self.workers * 2:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            self._store(future.result(), employees_by_id)
+                if batch:
+                    pending.add(pool.submit(_embed_photos, batch))
+                for future in pending:
+                    self._store(future.result(), employees_by_id)
+            self.state = "completed"
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"❌ Migration failed: {e}")
+        finally:
+            print(f"📋 Migration {self.state} in {time.time() - started:.1f}s: {self.counts}")
+        return self.counts
+
+    def describe(self):
+        return {
+            "state": self.state,
+            "target": self.target.fingerprint,
+            "source": self.source_fingerprint,
+            "employees": self.total,
+            "counts": self.counts,
+            "error": self.error
+        }
+
+
+def purge_other_models(keep_fingerprint):
+    """Drop every stored encoding entry not produced by keep_fingerprint"""
+    purged = 0
+    for employee in fetch_employees() or []:
+        entries = split_face_encoding(employee.get("faceEncoding"))
+        if len(entries) < 2:
+            continue
+        # Re-read before writing, as in MigrationRun._store
+        entries = split_face_encoding(fetch_employee(employee["id"]).get("faceEncoding"))
+        kept = {fp: entry for fp, entry in entries.items() if fp == keep_fingerprint}
+        if kept and len(kept) != len(entries):
+            store_face_encoding(employee["id"], join_face_encoding(kept))
+            purged += 1
+    print(f"🧹 Purged old model encodings from {purged} employees")
+    return purged
+
+
+router = APIRouter()
+
+
+@router.post("/migration/start")
+async def start_migration(request: Request,
+                          engine: str = Form(...),
+                          workers: int = Form(None),
+                          batch_size: int = Form(None)):
+    """Start re-embedding with a new engine and serve it as the secondary model"""
+    state = request.app.state
+    if state.migration is not None and state.migration.state == "running":
+        raise HTTPException(status_code=409, detail="A migration is already running")
+
+    try:
+        target = get_engine(engine)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if target.fingerprint == state.engine.fingerprint:
+        raise HTTPException(status_code=400, detail=f"Already serving {target.fingerprint}")
+    if not await run_in_threadpool(target.load):
+        raise HTTPException(status_code=500, detail=f"Engine {engine} failed to load")
+
+    gallery = Gallery(metric=target.metric, fingerprint=target.fingerprint, accept_untagged=False,
+                      partition_by=config.GALLERY_PARTITION_BY)
+    # Searched like the primary, so it gets shard processes of its own; they follow it through a cutover
+    await run_in_threadpool(shards.attach, gallery, target.metric)
+    employees = await run_in_threadpool(fetch_employees)
+    if employees is not None:
+        gallery.load_employees(employees)
+    replaced, state.secondary = state.secondary, (target, gallery)
+    if replaced is not None:
+        await run_in_threadpool(shards.detach, replaced[1])
+
+    def on_batch(ids, embeddings, employees_by_id):
+        # New rows become searchable as soon as their batch is stored
+        records = {}
+        for employee_id in ids:
+            employee = employees_by_id[employee_id]
+            records[employee_id] = {key: employee.get(key) for key in ("name", "employeeId", "specialty", "city", "birthDate")}
+        gallery.add_rows(ids, embeddings, records)
+
+    run = MigrationRun(target, state.engine.fingerprint, workers, batch_size, on_batch=on_batch)
+    state.migration = run
+    threading.Thread(target=run.run, name="migration", daemon=True).start()
+    print(f"🚚 Migration to {target.fingerprint} started")
+    return {"success": True, **run.describe()}
+
+
+@router.get("/migration/status")
+async def migration_status(request: Request):
+    """Progress of the current migration and the models being served"""
+    state = request.app.state
+    secondary = state.secondary
+    return {
+        "migration": state.migration.describe() if state.migration else None,
+        "primary": {"loaded_faces": len(state.gallery), **state.engine.describe()},
+        "secondary": {"loaded_faces": len(secondary[1]), **secondary[0].describe()} if secondary else None
+    }
+
+
+@router.post("/migration/cutover")
+async def cutover(request: Request):
+    """Swap primary and secondary models; the old model stays as fallback"""
+    state = request.app.state
+    if state.secondary is None:
+        raise HTTPException(status_code=409, detail="No secondary model to cut over to")
+    old = (state.engine, state.gallery)
+    state.engine, state.gallery = state.secondary
+    state.secondary = old
+    print(f"🔀 Cut over to {state.engine.fingerprint}; {old[0].fingerprint} kept as fallback")
+    return {"success": True, "primary": state.engine.describe(), "secondary": old[0].describe()}
+
+
+@router.post("/migration/finish")
+async def finish_migration(request: Request, purge: bool = Form(False)):
+    """Stop serving the secondary model, optionally deleting its stored encodings"""
+    state = request.app.state
+    if state.migration is not None and state.migration.state == "running":
+        raise HTTPException(status_code=409, detail="Migration is still running")
+    secondary, state.secondary = state.secondary, None
+    dropped = secondary[0].fingerprint if secondary else None
+    if secondary is not None:
+        await run_in_threadpool(shards.detach, secondary[1])
+    purged = await run_in_threadpool(purge_other_models, state.engine.fingerprint) if purge else 0
+    return {"success": True, "dropped": dropped, "purged": purged, "primary": state.engine.describe()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed all employee photos with a new engine")
+    parser.add_argument("engine", help="target engine name")
+    parser.add_argument("--source-engine", default=None, help="engine that produced untagged encodings (defaults to FACE_ENGINE)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (defaults to all cores)")
+    parser.add_argument("--batch-size", type=int, default=None, help="photos per batch")
+    args = parser.parse_args()
+
+    source = get_engine(args.source_engine)
+    MigrationRun(args.engine, source.fingerprint, args.workers, args.batch_size).run()
+
+
+if __name__ == "__main__":
+    main()
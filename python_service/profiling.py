@@ -0,0 +1,252 @@
+"""
+Memory and CPU profiling hooks
+
+Opt-in admin endpoints (PROFILE_DIR) for chasing RSS growth across
+reloads and long uptimes:
+
+- tracemalloc snapshots, dumped to PROFILE_DIR and diffed against the
+  previous snapshot, so growth between two points shows up by source line
+- per-request allocation counts per request kind: net allocated blocks
+  always, net traced bytes while tracemalloc is running (approximate when
+  requests overlap)
+- a sampling CPU profiler that writes collapsed stacks (flamegraph.pl /
+  speedscope input)
+
+Nothing is traced or sampled until asked for through the endpoints.
+"""
+
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+
+import config
+
+# tracemalloc's own bookkeeping and import machinery are noise in diffs
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss_mb():
+    """Resident set size of this process in MB (None where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _stat_entry(stat):
+    return {"where": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+
+
+def _diff_entry(stat):
+    return {"where": str(stat.traceback[0]), "size_diff_kb": round(stat.size_diff / 1024, 1),
+            "count_diff": stat.count_diff, "size_kb": round(stat.size / 1024, 1)}
+
+
+def _collapse(frame):
+    """Stack of a frame as 'outer;...;inner' function labels"""
+    labels = []
+    while frame is not None:
+        code = frame.f_code
+        labels.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Profiler:
+    """Snapshots, request allocation counters and CPU sampling for one process"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or config.PROFILE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.previous = None
+        self.snapshots = 0
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._sampling = threading.Lock()
+
+    def _path(self, prefix, suffix):
+        return os.path.join(self.directory, f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{self.snapshots}{suffix}")
+
+    def start_tracing(self, frames=None):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames or config.PROFILE_TRACE_FRAMES)
+        self.previous = None
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        self.previous = None
+
+    def snapshot(self, limit=20, collect=True):
+        """Dump a tracemalloc snapshot and compare it with the previous one"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        if collect:
+            gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        self.snapshots += 1
+        path = self._path("memory", ".snapshot")
+        snapshot.dump(path)
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            "path": path,
+            "rss_mb": rss_mb(),
+            "traced_mb": current / 2 ** 20,
+            "traced_peak_mb": peak / 2 ** 20,
+            "top": [_stat_entry(stat) for stat in snapshot.statistics("lineno")[:limit]],
+            "growth": None
+        }
+        if self.previous is not None:
+            diff = self.previous.compare_to(snapshot, "lineno")
+            result["growth"] = [_diff_entry(stat) for stat in diff[:limit]]
+            result["growth_kb"] = round(sum(stat.size_diff for stat in diff) / 1024, 1)
+        self.previous = snapshot
+        return result
+
+    @contextmanager
+    def track(self, kind):
+        """Count net allocations made while the block runs, per request kind"""
+        blocks = sys.getallocatedblocks()
+        tracing = tracemalloc.is_tracing()
+        traced = tracemalloc.get_traced_memory()[0] if tracing else 0
+        try:
+            yield
+        finally:
+            net_blocks = sys.getallocatedblocks() - blocks
+            net_bytes = tracemalloc.get_traced_memory()[0] - traced if tracing and tracemalloc.is_tracing() else None
+            with self._lock:
+                stats = self.requests.setdefault(kind, {"requests": 0, "net_blocks": 0, "max_net_blocks": 0,
+                                                        "traced_requests": 0, "net_traced_kb": 0.0})
+                stats["requests"] += 1
+                stats["net_blocks"] += net_blocks
+                stats["max_net_blocks"] = max(stats["max_net_blocks"], net_blocks)
+                if net_bytes is not None:
+                    stats["traced_requests"] += 1
+                    stats["net_traced_kb"] += net_bytes / 1024
+
+    def sample_cpu(self, seconds, interval_ms=None, limit=20):
+        """Sample every thread's stack for `seconds` and write collapsed stacks (blocking)"""
+        if not self._sampling.acquire(blocking=False):
+            raise RuntimeError("a CPU profile is already running")
+        try:
+            interval = (interval_ms or config.PROFILE_SAMPLE_INTERVAL_MS) / 1000.0
+            me = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks, leaves = Counter(), Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = _collapse(frame)
+                    stacks[f"{names.get(ident, ident)};{stack}"] += 1
+                    leaves[stack.rsplit(";", 1)[-1]] += 1
+                samples += 1
+                time.sleep(interval)
+            self.snapshots += 1
+            path = self._path("cpu", ".folded")
+            with open(path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            return {
+                "path": path,
+                "samples": samples,
+                "interval_ms": interval * 1000,
+                "top": [{"function": leaf, "samples": count} for leaf, count in leaves.most_common(limit)]
+            }
+        finally:
+            self._sampling.release()
+
+    def describe(self):
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        with self._lock:
+            requests = {kind: dict(stats) for kind, stats in self.requests.items()}
+        return {
+            "directory": self.directory,
+            "rss_mb": rss_mb(),
+            "tracing": tracemalloc.is_tracing(),
+            "traced_mb": current / 2 ** 20,
+            "traced_peak_mb": peak / 2 ** 20,
+            "gc_objects": len(gc.get_objects()),
+            "requests": requests,
+            "cpu_profiling": self._sampling.locked()
+        }
+
+
+@contextmanager
+def track(app, kind):
+    """Profiler.track when profiling is enabled, otherwise nothing"""
+    if app.state.profiler is None:
+        yield
+    else:
+        with app.state.profiler.track(kind):
+            yield
+
+
+router = APIRouter()
+
+
+def _profiler(request):
+    profiler = request.app.state.profiler
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set PROFILE_DIR)")
+    return profiler
+
+
+@router.get("/admin/profile")
+async def profile_status(request: Request):
+    """RSS, tracemalloc state and per-request allocation counts"""
+    return _profiler(request).describe()
+
+
+@router.post("/admin/profile/memory/start")
+async def start_memory_tracing(request: Request, frames: int = Query(None, ge=1, le=100)):
+    """Start tracemalloc; following snapshots are diffed against each other"""
+    profiler = _profiler(request)
+    profiler.start_tracing(frames)
+    return profiler.describe()
+
+
+@router.post("/admin/profile/memory/snapshot")
+async def memory_snapshot(request: Request, limit: int = Query(20, ge=1, le=200), collect: bool = Query(True)):
+    """Dump a snapshot and report the top allocations and growth since the last one"""
+    profiler = _profiler(request)
+    try:
+        return await run_in_threadpool(profiler.snapshot, limit, collect)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/admin/profile/memory/stop")
+async def stop_memory_tracing(request: Request):
+    profiler = _profiler(request)
+    profiler.stop_tracing()
+    return profiler.describe()
+
+
+@router.post("/admin/profile/cpu")
+async def cpu_profile(request: Request,
+                      seconds: float = Query(10, gt=0, le=300),
+                      interval_ms: float = Query(None, ge=1, le=1000),
+                      limit: int = Query(20, ge=1, le=200)):
+    """Sample all threads for a while and write a collapsed-stack CPU profile"""
+    profiler = _profiler(request)
+    try:
+        return await run_in_threadpool(profiler.sample_cpu, seconds, interval_ms, limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
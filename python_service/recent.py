@@ -0,0 +1,136 @@
+"""
+Recent-recognition cache
+
+A person standing at a kiosk is scanned again every few seconds. Each
+camera (or client) remembers the identities it recognized in the last
+few seconds; a new embedding is first scored against just those
+identities' gallery rows, and when one of them matches with high
+confidence and clear margin the full 1:N search is skipped.
+
+Only confident full-search results are remembered (margin at least
+RECENT_CACHE_MIN_MARGIN), and a cached identity must score at least
+RECENT_CACHE_MIN_CONFIDENCE and beat the other cached identities by that
+margin again, so the cache only short-circuits scans the full search
+would have answered the same way.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import calibration
+import config
+
+
+class RecentCache:
+    """Per-camera recently recognized identities with TTL and bounded size"""
+
+    def __init__(self, ttl=None, cameras=None, per_camera=None, min_confidence=None, min_margin=None):
+        self.ttl = config.RECENT_CACHE_TTL_SECONDS if ttl is None else ttl
+        self.cameras = cameras or config.RECENT_CACHE_CAMERAS
+        self.per_camera = per_camera or config.RECENT_CACHE_PER_CAMERA
+        self.min_confidence = config.RECENT_CACHE_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        self.min_margin = config.RECENT_CACHE_MIN_MARGIN if min_margin is None else min_margin
+        # (camera, model fingerprint) -> OrderedDict(employee id -> (expires at, margin)), least recent first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.expired = 0
+        self.evicted = 0
+        self.rows_scored = 0
+        self.rows_skipped = 0
+
+    def _live(self, key, now):
+        """Unexpired entries for a key, dropping expired ones (call with the lock held)"""
+        entries = self._entries.get(key)
+        if entries is None:
+            return None
+        for employee_id in [e for e, (expires, _) in entries.items() if expires <= now]:
+            del entries[employee_id]
+            self.expired += 1
+        if not entries:
+            del self._entries[key]
+            return None
+        return entries
+
+    def match(self, camera, engine, gallery, embedding, threshold):
+        """(margin, candidates) for a cached identity, or None to run the full search
+
+        Candidates are the camera's cached identities as (employee id,
+        calibrated confidence, raw score), best first; margin is the one
+        the full search recorded for the best of them.
+        """
+        if not camera or self.ttl <= 0:
+            return None
+        key = (camera, engine.fingerprint)
+        with self._lock:
+            self.lookups += 1
+            entries = self._live(key, time.monotonic())
+            cached = list(entries.items()) if entries else []
+        if not cached:
+            return None
+
+        scored = []
+        rows = 0
+        for employee_id, (_, margin) in cached:
+            score = gallery.verify(embedding, employee_id)
+            if score is None:
+                continue
+            rows += len(gallery.rows_by_id.get(employee_id, ()))
+            scored.append((float(calibration.calibrate(engine, score)), score, employee_id, margin))
+        if not scored:
+            return None
+        scored.sort(key=lambda entry: -entry[0])
+        confidence, _, employee_id, margin = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        if confidence < max(threshold, self.min_confidence) or confidence - runner_up < self.min_margin:
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.rows_scored += rows
+            self.rows_skipped += max(len(gallery) - rows, 0)
+            entries = self._entries.get(key)
+            if entries is not None and employee_id in entries:
+                entries[employee_id] = (time.monotonic() + self.ttl, margin)
+                entries.move_to_end(employee_id)
+                self._entries.move_to_end(key)
+        return margin, [(e, c, s) for c, s, e, _ in scored]
+
+    def remember(self, camera, engine, employee_id, margin):
+        """Cache a full-search recognition if it was confident enough"""
+        if not camera or self.ttl <= 0 or employee_id is None or margin < self.min_margin:
+            return
+        key = (camera, engine.fingerprint)
+        with self._lock:
+            entries = self._entries.setdefault(key, OrderedDict())
+            entries[employee_id] = (time.monotonic() + self.ttl, margin)
+            entries.move_to_end(employee_id)
+            self._entries.move_to_end(key)
+            while len(entries) > self.per_camera:
+                entries.popitem(last=False)
+                self.evicted += 1
+            while len(self._entries) > self.cameras:
+                _, dropped = self._entries.popitem(last=False)
+                self.evicted += len(dropped)
+
+    def clear(self):
+        """Forget everything (the gallery changed underneath the cached identities)"""
+        with self._lock:
+            self._entries.clear()
+
+    def describe(self):
+        with self._lock:
+            return {
+                "ttl_seconds": self.ttl,
+                "cameras": len(self._entries),
+                "identities": sum(len(entries) for entries in self._entries.values()),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "rows_scored": self.rows_scored,
+                "rows_skipped": self.rows_skipped
+            }
@@ -0,0 +1,244 @@
+"""
+Gallery export and import for seeding replicas
+
+A new instance normally builds its gallery by fetching every employee as
+JSON from the Node backend and decoding one base64 pickle per row. It can
+instead copy a running peer's gallery (or a saved export) in a single
+sequential read:
+
+- npy: three consecutive .npy arrays in one stream - metadata (UTF-8
+  JSON as uint8), ids (int64) and the embedding matrix (float32). Only
+  numpy is needed; the matrix is streamed straight from gallery memory
+  and imported as a view of the received bytes.
+- arrow: one Arrow IPC stream with id, embedding (fixed-size list of
+  float32) and employee columns; gallery settings ride in the schema
+  metadata. Needs pyarrow.
+
+Rows are exported as the gallery holds them (normalized for cosine
+engines), so an import skips decoding and preparing rows entirely. A
+snapshot only loads into a gallery of the same model fingerprint.
+"""
+
+import io
+import json
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+import config
+
+FORMAT_VERSION = 1
+NPY_MAGIC = b"\x93NUMPY"
+ARROW_STREAM_MAGIC = b"\xff\xff\xff\xff"
+RECORD_FIELDS = ("name", "employeeId", "specialty", "city", "birthDate")
+CHUNK_BYTES = 1 << 20
+
+
+def gallery_state(gallery):
+    """(ids, embeddings, records) of one gallery version; later swaps do not affect it"""
+    # A single read of the tuple _swap replaces whole, so the three always belong together
+    ids, embeddings, records, _, _ = gallery.state
+    return ids, embeddings, records
+
+
+def describe_gallery(gallery, ids, embeddings):
+    return {
+        "version": FORMAT_VERSION,
+        "fingerprint": gallery.fingerprint,
+        "metric": gallery.metric,
+        "count": len(ids),
+        "dimension": int(embeddings.shape[1]) if len(ids) else 0
+    }
+
+
+def _npy_header(array):
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, np.lib.format.header_data_from_array_1_0(array))
+    return header.getvalue()
+
+
+def iter_npy(gallery, state=None):
+    """Byte chunks of the npy export of a gallery (or of a state it had)"""
+    ids, embeddings, records = state or gallery_state(gallery)
+    meta = describe_gallery(gallery, ids, embeddings)
+    meta["records"] = {str(employee_id): records.get(employee_id, {}) for employee_id in ids}
+    meta_array = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+    id_array = np.asarray(ids, dtype=np.int64)
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    for array in (meta_array, id_array):
+        yield _npy_header(array) + array.tobytes()
+    yield _npy_header(matrix)
+    if not matrix.size:
+        return
+    view = memoryview(matrix).cast("B")
+    for start in range(0, len(view), CHUNK_BYTES):
+        yield view[start:start + CHUNK_BYTES]
+
+
+def _read_npy(buffer, offset):
+    """(array viewing buffer, next offset) for the .npy array starting at offset"""
+    stream = io.BytesIO(memoryview(buffer)[offset:offset + 65536 + 10])
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    if dtype.hasobject or fortran_order:
+        raise ValueError("npy export arrays must be plain C-ordered numbers")
+    start = offset + stream.tell()
+    count = int(np.prod(shape))
+    array = np.frombuffer(buffer, dtype=dtype, count=count, offset=start).reshape(shape)
+    return array, start + count * dtype.itemsize
+
+
+def read_npy(buffer):
+    """(metadata, ids, embeddings, records) from an npy export held in memory"""
+    meta_array, offset = _read_npy(buffer, 0)
+    id_array, offset = _read_npy(buffer, offset)
+    embeddings, _ = _read_npy(buffer, offset)
+    meta = json.loads(meta_array.tobytes().decode("utf-8"))
+    ids = [int(employee_id) for employee_id in id_array]
+    records = {int(employee_id): record for employee_id, record in meta.pop("records", {}).items()}
+    return meta, ids, embeddings, records
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401 (loads the ipc submodule)
+    except ImportError:
+        raise ImportError("Arrow export/import needs pyarrow (pip install pyarrow); use format=npy instead")
+    return pyarrow
+
+
+def arrow_export(gallery, state=None):
+    """Arrow IPC stream bytes of a gallery (or of a state it had)"""
+    pa = _pyarrow()
+    ids, embeddings, records = state or gallery_state(gallery)
+    meta = describe_gallery(gallery, ids, embeddings)
+    dimension = meta["dimension"] or 1
+    values = pa.array(np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1))
+    columns = {
+        "id": pa.array(np.asarray(ids, dtype=np.int64)),
+        "embedding": pa.FixedSizeListArray.from_arrays(values, dimension)
+    }
+    for field in RECORD_FIELDS:
+        column = [records.get(employee_id, {}).get(field) for employee_id in ids]
+        columns[field] = pa.array([None if value is None else str(value) for value in column], type=pa.string())
+    table = pa.table(columns).replace_schema_metadata({"gallery": json.dumps(meta)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def read_arrow(buffer):
+    """(metadata, ids, embeddings, records) from an Arrow IPC stream held in memory"""
+    pa = _pyarrow()
+    table = pa.ipc.open_stream(pa.py_buffer(buffer)).read_all()
+    meta = json.loads(table.schema.metadata[b"gallery"].decode("utf-8"))
+    ids = table.column("id").to_pylist()
+    embedding = table.column("embedding").combine_chunks()
+    embeddings = embedding.flatten().to_numpy(zero_copy_only=False).reshape(len(ids), meta["dimension"] or 0)
+    columns = {field: table.column(field).to_pylist() for field in RECORD_FIELDS if field in table.column_names}
+    records = {
+        employee_id: {field: values[row] for field, values in columns.items()}
+        for row, employee_id in enumerate(ids)
+    }
+    return meta, ids, embeddings, records
+
+
+def read_export(buffer):
+    """Parse an export of either format, told apart by its leading bytes"""
+    prefix = bytes(buffer[:6])
+    if prefix == NPY_MAGIC:
+        return "npy", read_npy(buffer)
+    if prefix[:4] == ARROW_STREAM_MAGIC:
+        return "arrow", read_arrow(buffer)
+    raise ValueError("Not a gallery export (expected an npy or Arrow IPC stream)")
+
+
+def install(gallery, snapshot):
+    """Load a parsed export into a gallery of the same model; returns the row count"""
+    meta, ids, embeddings, records = snapshot
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported gallery export version {meta.get('version')}")
+    if gallery.fingerprint and meta.get("fingerprint") != gallery.fingerprint:
+        raise ValueError(f"Export is for {meta.get('fingerprint')}, this gallery serves {gallery.fingerprint}")
+    if meta.get("metric") != gallery.metric:
+        raise ValueError(f"Export uses the {meta.get('metric')} metric, this gallery uses {gallery.metric}")
+    if not len(ids):
+        embeddings = np.empty((0, 0), dtype=np.float32)
+    return gallery.load_prepared(ids, embeddings, records)
+
+
+def read_source(source):
+    """Bytes of an export from a peer service URL or a file path (one sequential read)"""
+    if source.startswith(("http://", "https://")):
+        import requests
+
+        response = requests.get(f"{source.rstrip('/')}/gallery/export", params={"format": "npy"},
+                                timeout=config.GALLERY_SEED_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def seed_gallery(gallery, source):
+    """Load a gallery from a peer or a file; returns (row count, format)"""
+    data_format, snapshot = read_export(read_source(source))
+    count = install(gallery, snapshot)
+    print(f"✅ Seeded {count} face embeddings from {source} ({data_format})")
+    return count, data_format
+
+
+router = APIRouter()
+
+
+@router.get("/gallery/export")
+async def export_gallery(request: Request, format: str = Query("npy")):
+    """Stream the serving gallery as one npy or Arrow IPC payload"""
+    if format not in ("npy", "arrow"):
+        raise HTTPException(status_code=400, detail="format must be 'npy' or 'arrow'")
+    gallery = request.app.state.gallery
+    # Taken once, so the count header and the payload describe the same version
+    state = gallery_state(gallery)
+    name = (gallery.fingerprint or "gallery").replace(":", "-")
+    headers = {
+        "Content-Disposition": f'attachment; filename="{name}.{format}"',
+        "X-Gallery-Count": str(len(state[0])),
+        "X-Gallery-Fingerprint": str(gallery.fingerprint)
+    }
+    if format == "npy":
+        return StreamingResponse(iter_npy(gallery, state), media_type="application/octet-stream", headers=headers)
+    try:
+        payload = await run_in_threadpool(arrow_export, gallery, state)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return StreamingResponse(iter([memoryview(payload)]), media_type="application/vnd.apache.arrow.stream",
+                             headers=headers)
+
+
+@router.post("/gallery/import")
+async def import_gallery(request: Request, peer: str = Query(None)):
+    """Replace the serving gallery with an export: the request body, or pulled from a peer URL"""
+    if peer is not None and not peer.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="peer must be an http(s) URL of another recognition service")
+    gallery = request.app.state.gallery
+    try:
+        data = await run_in_threadpool(read_source, peer) if peer else await request.body()
+        data_format, snapshot = await run_in_threadpool(read_export, data)
+        count = await run_in_threadpool(install, gallery, snapshot)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error importing gallery: {e}")
+        raise HTTPException(status_code=502 if peer else 500, detail=f"Gallery import failed: {str(e)}")
+    request.app.state.recent.clear()
+    print(f"✅ Imported {count} face embeddings ({data_format})")
+    return {"success": True, "loaded_faces": count, "format": data_format, "source": peer or "upload"}
@@ -0,0 +1,598 @@
+"""
+Face Recognition Service
+
+A single FastAPI app factory shared by every engine. The engine, gallery
+and threshold come from configuration; engine dependencies (TensorFlow,
+dlib, ONNX Runtime) are only imported when that engine is loaded.
+"""
+
+import time
+import warnings
+
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Query
+from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+
+import admission
+import calibration
+import config
+import cpu_tuning
+import crops
+import enrollment
+import events
+import fastpath
+import jobs
+import liveness
+import migration
+import profiling
+import recent
+import replication
+import shards
+import singleflight
+from engines import add_timing, get_engine
+from gallery import Gallery, encode_embedding, fetch_employees, join_face_encoding
+
+# Suppress warnings
+warnings.filterwarnings("ignore")
+
+
+def extract_face_embedding(engine, contents, liveness_check=None, timings=None, plan=None):
+    """Decode uploaded bytes and extract the first face embedding
+
+    liveness.SpoofDetected propagates so callers can answer it distinctly.
+    Stage durations (ms) are added to timings when given. An admission
+    plan may lower the decode resolution and pick the fast detector.
+    """
+    try:
+        timings = {} if timings is None else timings
+        started = time.perf_counter()
+        if plan is not None and plan.max_side:
+            image = engine.decode(contents, plan.max_side)
+        else:
+            image = engine.decode(contents)
+        add_timing(timings, "decode", started)
+        detector, detect_side = plan.detection(engine) if plan is not None else (None, None)
+        face_embedding, face = engine.represent(image, liveness_check, timings, detector, detect_side)
+        if face_embedding is None:
+            print("❌ No face embedding extracted")
+            return None, None
+        print(f"✅ Face embedding extracted, length: {len(face_embedding)}")
+        return face_embedding, face
+    except liveness.SpoofDetected:
+        raise
+    except Exception as e:
+        print(f"❌ Error extracting face embedding: {e}")
+        return None, None
+
+
+def shared_face_embedding(app, engine, contents, liveness_check=None, timings=None, plan=None):
+    """extract_face_embedding, shared by concurrent requests for the same upload
+
+    Identical uploads under the same engine, liveness check and admission
+    plan wait for the one already running; the wait is timed as 'coalesced'.
+    """
+    key = (engine.fingerprint, crops.crop_key(contents), liveness_check is not None,
+           plan.max_side if plan is not None else None, plan.detection(engine) if plan is not None else None)
+    started = time.perf_counter()
+    (face_embedding, face), shared = app.state.inflight.do(
+        key, extract_face_embedding, engine, contents, liveness_check, timings, plan
+    )
+    if shared and timings is not None:
+        add_timing(timings, "coalesced", started)
+    return face_embedding, face
+
+
+def recognize_face(engine, gallery, face_embedding, threshold, top_k=1, site=None, fallback=True):
+    """Match an embedding against the gallery in one vectorized pass
+
+    Returns (employee id or None, candidates, margin, scope). Candidates
+    are the top_k matches, best first, with calibrated confidence and raw
+    score; margin is the calibrated gap between the first and second
+    match. With a site and an attribute-partitioned gallery, the site's
+    partition is searched first and the whole gallery only on a miss
+    (never without fallback); scope says which search answered ('site' or
+    'global').
+    """
+    try:
+        k = max(top_k, 2)
+        scope = "global"
+        matches = []
+        if site and gallery.partition_by and gallery.partition_by != "hash":
+            matches = gallery.top_k(face_embedding, k, partition=site)
+            scope = "site"
+            if fallback and (not matches or calibration.calibrate(engine, matches[0][1]) < threshold):
+                matches, scope = [], "global"
+            elif not matches:
+                return None, [], 0.0, scope
+        if not matches:
+            matches = gallery.top_k(face_embedding, k)
+        if not matches:
+            return None, [], 0.0, scope
+        confidences = calibration.calibrate(engine, [score for _, score in matches])
+        candidates = [
+            {"employeeId": int(employee_id), "confidence": float(confidence), "raw_score": float(score)}
+            for (employee_id, score), confidence in zip(matches, confidences)
+        ]
+        best = candidates[0]
+        margin = best["confidence"] - (candidates[1]["confidence"] if len(candidates) > 1 else 0.0)
+        print(f"🔍 Best confidence: {best['confidence']:.4f} (raw {best['raw_score']:.4f}), "
+              f"margin: {margin:.4f}, threshold: {threshold}")
+        employee_id = best["employeeId"] if best["confidence"] >= threshold else None
+        return employee_id, candidates[:top_k], margin, scope
+    except Exception as e:
+        print(f"❌ Error recognizing face: {e}")
+        return None, [], 0.0, "global"
+
+
+def serving_models(app):
+    """(engine, gallery) pairs in match order: primary first, then a migration's secondary"""
+    models = [(app.state.engine, app.state.gallery)]
+    if app.state.secondary is not None:
+        models.append(app.state.secondary)
+    return models
+
+
+def reload_galleries(app):
+    """Fetch employees once and rebuild every served gallery"""
+    print("🔄 Loading face database...")
+    with profiling.track(app, "reload"):
+        employees = fetch_employees()
+        if employees is not None:
+            for engine, gallery in serving_models(app):
+                count = gallery.load_employees(employees)
+                print(f"✅ Loaded {count} {engine.fingerprint} face embeddings from database")
+            app.state.recent.clear()
+    return len(app.state.gallery)
+
+
+def identify(app, contents, top_k=1, timings=None, site=None, camera=None, plan=None):
+    """Run recognition, falling back to the secondary model during a migration
+
+    Returns (engine, gallery, employee id or None, candidates, margin, scope)
+    of the model that matched, or of the primary when none did; engine is
+    None when no model found a face. Raises liveness.SpoofDetected on a spoof.
+    Requests from a camera first try the identities that camera recognized
+    moments ago (scope 'recent', candidates limited to those identities).
+    Under load the admission plan may restrict the search to the site.
+    """
+    threshold = app.state.threshold
+    result = None
+    for engine, gallery in serving_models(app):
+        if result is not None and not len(gallery):
+            continue
+        face_embedding, face = shared_face_embedding(app, engine, contents, app.state.liveness, timings, plan)
+        if face_embedding is None:
+            continue
+        started = time.perf_counter()
+        hit = app.state.recent.match(camera, engine, gallery, face_embedding, threshold)
+        if hit is not None:
+            margin, cached = hit
+            candidates = [
+                {"employeeId": int(cached_id), "confidence": confidence, "raw_score": float(raw_score)}
+                for cached_id, confidence, raw_score in cached[:top_k]
+            ]
+            employee_id, scope = candidates[0]["employeeId"], "recent"
+            print(f"🔍 Recent match for {camera}: {employee_id} ({candidates[0]['confidence']:.4f}), "
+                  f"full search skipped")
+        else:
+            employee_id, candidates, margin, scope = recognize_face(
+                engine, gallery, face_embedding, threshold, top_k, site,
+                fallback=plan is None or not plan.local_only
+            )
+            app.state.recent.remember(camera, engine, employee_id, margin)
+        add_timing(timings if timings is not None else {}, "search", started)
+        if result is None or employee_id is not None:
+            result = (engine, gallery, employee_id, candidates, margin, scope)
+        if employee_id is not None:
+            break
+    return result or (None, None, None, [], 0.0, None)
+
+
+# Response fields copied into recognition events
+EVENT_FIELDS = ("recognized", "verified", "employeeId", "confidence", "raw_score", "margin", "spoof", "liveness_score",
+                "site", "search_scope", "degradation")
+
+
+def log_event(app, kind, engine, response, timings, contents):
+    """Queue a recognition event (no-op when the event log is disabled)"""
+    if app.state.events is None:
+        return
+    app.state.events.record(kind, {
+        "model": engine.fingerprint if engine is not None else None,
+        "image": crops.crop_key(contents)[:16],
+        "threshold": app.state.threshold,
+        **{key: response[key] for key in EVENT_FIELDS if key in response},
+        "candidates": [[c["employeeId"], round(c["confidence"], 4), round(c["raw_score"], 4)]
+                       for c in response.get("candidates", [])],
+        "timings": {stage: round(ms, 2) for stage, ms in timings.items()}
+    })
+
+
+def recognition_response(app, contents, top_k=1, source="recognize", site=None, camera=None, plan=None):
+    """The /recognize response for an uploaded image (blocking; run off the event loop)
+
+    site (defaulting to config.SITE) scopes the search to that partition
+    first. camera keys the recent-recognition cache; without one the site
+    stands in for it. plan is the admission plan (None serves in full).
+    The outcome is queued on the event log under `source` with stage
+    timings.
+    """
+    site = site or config.SITE or None
+    timings = {}
+    started = time.perf_counter()
+    with profiling.track(app, source):
+        try:
+            engine, response = recognition_result(app, contents, top_k, timings, site, camera or site, plan)
+        except liveness.SpoofDetected as e:
+            engine, response = app.state.engine, spoof_response(e, recognized=False, candidates=[])
+    # Only measures that changed this request; levels with no effect here are skipped
+    level = plan.applied(engine or app.state.engine, response.get("search_scope")) if plan is not None else 0
+    if level:
+        response["degradation"] = admission.LEVELS[level]
+    add_timing(timings, "total", started)
+    log_event(app, source, engine, response, timings, contents)
+    return response
+
+
+def recognition_result(app, contents, top_k, timings, site=None, camera=None, plan=None):
+    """(engine that answered, response dict) for an uploaded image"""
+    engine, gallery, employee_id, candidates, margin, scope = identify(app, contents, top_k, timings, site, camera,
+                                                                       plan)
+
+    if engine is None:
+        return None, {
+            "recognized": False,
+            "message": "No faces detected in the image",
+            "confidence": 0.0,
+            "candidates": []
+        }
+
+    for candidate in candidates:
+        candidate["name"] = gallery.records.get(candidate["employeeId"], {}).get("name")
+    best = candidates[0] if candidates else {"confidence": 0.0, "raw_score": 0.0}
+
+    result = {
+        "confidence": best["confidence"],
+        "raw_score": best["raw_score"],
+        "margin": margin,
+        "candidates": candidates,
+        "model_used": engine.model_name,
+        "site": site,
+        "search_scope": scope
+    }
+    if employee_id is not None:
+        employee_info = gallery.records.get(employee_id, {})
+        return engine, {
+            "recognized": True,
+            "employeeId": employee_id,
+            "employee": employee_info,
+            "message": f"Welcome, {employee_info.get('name', 'Unknown')}!",
+            **result
+        }
+    return engine, {
+        "recognized": False,
+        "message": "Face not recognized",
+        **result
+    }
+
+
+def verification_response(app, engine, gallery, claimed_id, contents, timings, plan=None):
+    """The /verify response for an uploaded image and a resolved claim (blocking)"""
+    try:
+        face_embedding, face = shared_face_embedding(app, engine, contents, app.state.liveness, timings, plan)
+    except liveness.SpoofDetected as e:
+        return spoof_response(e, verified=False, employeeId=int(claimed_id))
+
+    if face_embedding is None:
+        return {
+            "verified": False,
+            "employeeId": int(claimed_id),
+            "message": "No faces detected in the image",
+            "confidence": 0.0
+        }
+
+    threshold = app.state.threshold
+    started = time.perf_counter()
+    raw_score = gallery.verify(face_embedding, claimed_id)
+    add_timing(timings, "search", started)
+    if raw_score is None:
+        # No rows for the claim (e.g. removed by a reload since it was resolved)
+        return {
+            "verified": False,
+            "employeeId": int(claimed_id),
+            "message": "Employee has no enrolled face",
+            "confidence": 0.0
+        }
+    confidence = float(calibration.calibrate(engine, raw_score))
+    verified = confidence >= threshold
+    print(f"🔍 Verification confidence: {confidence:.4f} (raw {raw_score:.4f}), threshold: {threshold}")
+
+    employee_info = gallery.records.get(claimed_id, {})
+    return {
+        "verified": verified,
+        "employeeId": int(claimed_id),
+        "confidence": confidence,
+        "raw_score": raw_score,
+        "employee": employee_info if verified else None,
+        "message": f"Welcome, {employee_info.get('name', 'Unknown')}!" if verified else "Face does not match the claimed employee",
+        "model_used": engine.model_name
+    }
+
+
+def spoof_response(error, **fields):
+    """Response for a face rejected by the liveness check"""
+    return {
+        **fields,
+        "spoof": True,
+        "liveness_score": error.score,
+        "message": "Liveness check failed, please scan your face directly",
+        "confidence": 0.0
+    }
+
+
+def overloaded_error(error):
+    """HTTP error for a request refused by admission control"""
+    return HTTPException(status_code=error.status, detail=str(error),
+                         headers={"Retry-After": str(error.retry_after)})
+
+
+def create_app(engine=None, gallery=None, load_gallery=True):
+    """Assemble the recognition service for an engine (name or instance)"""
+    cpu_tuning.apply_process_settings()
+    if engine is None or isinstance(engine, str):
+        engine = get_engine(engine)
+    if gallery is None:
+        gallery = Gallery(metric=engine.metric, fingerprint=engine.fingerprint,
+                          accept_untagged=engine.accepts_untagged, partition_by=config.GALLERY_PARTITION_BY)
+
+    app = FastAPI(title=f"Face Recognition Service ({engine.name})", version="3.0.0")
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.include_router(enrollment.router)
+    app.include_router(migration.router)
+    app.include_router(jobs.router)
+    app.include_router(events.router)
+    app.include_router(profiling.router)
+    app.include_router(replication.router)
+
+    # Routes read the serving model from app.state on every request so a
+    # migration cutover can swap engine and gallery without a restart
+    app.state.engine = engine
+    app.state.gallery = gallery
+    app.state.secondary = None
+    app.state.migration = None
+    app.state.threshold = config.CONFIDENCE_THRESHOLD
+    app.state.liveness = liveness.get_check()
+    app.state.jobs = jobs.JobQueue(lambda contents, top_k, site: recognition_response(app, contents, top_k, "job", site))
+    app.state.events = events.EventLog() if config.EVENTS_DB else None
+    app.state.fastpath = None
+    app.state.recent = recent.RecentCache()
+    app.state.profiler = profiling.Profiler() if config.PROFILE_DIR else None
+    app.state.admission = admission.AdmissionController()
+    app.state.inflight = singleflight.SingleFlight()
+
+    def status():
+        engine, gallery = app.state.engine, app.state.gallery
+        secondary = app.state.secondary
+        return {
+            "loaded_faces": len(gallery),
+            "confidence_threshold": app.state.threshold,
+            **engine.describe(),
+            "liveness": app.state.liveness.describe() if app.state.liveness else None,
+            "gallery": gallery.describe_partitions(),
+            "secondary": {"loaded_faces": len(secondary[1]), **secondary[0].describe()} if secondary else None
+        }
+
+    @app.on_event("startup")
+    async def startup_event():
+        """Warm the engine up and load the gallery"""
+        print(f"🚀 Starting Face Recognition Service with engine: {engine.name}")
+        print(f"🔧 Using model: {engine.model_name}")
+        print(f"🔧 Using detector: {engine.detector_name}")
+        print(f"🔧 Degradation levels in effect: {', '.join(admission.levels_in_effect(engine, app.state.gallery))}")
+        await run_in_threadpool(engine.load)
+        await run_in_threadpool(shards.attach, app.state.gallery, engine.metric)
+        if load_gallery:
+            seeded = False
+            if config.GALLERY_SEED:
+                try:
+                    await run_in_threadpool(replication.seed_gallery, app.state.gallery, config.GALLERY_SEED)
+                    seeded = True
+                except Exception as e:
+                    print(f"⚠️ Could not seed gallery from {config.GALLERY_SEED}, loading from backend: {e}")
+            if not seeded:
+                try:
+                    await run_in_threadpool(reload_galleries, app)
+                except Exception as e:
+                    print(f"❌ Error loading face database: {e}")
+        app.state.jobs.start()
+        if app.state.events is not None:
+            app.state.events.start()
+        if config.FASTPATH_SOCKET:
+            app.state.fastpath = await fastpath.start_server(app)
+        print("✅ Face Recognition Service ready!")
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        app.state.jobs.stop()
+        for _, gallery in serving_models(app):
+            shards.detach(gallery)
+        if app.state.events is not None:
+            app.state.events.stop()
+        if app.state.fastpath is not None:
+            app.state.fastpath.close()
+
+    @app.get("/")
+    async def root():
+        return {
+            "message": "Face Recognition Service",
+            "status": "running",
+            **status()
+        }
+
+    @app.get("/health")
+    async def health_check():
+        load = app.state.admission.describe()
+        load["levels_in_effect"] = admission.levels_in_effect(app.state.engine, app.state.gallery)
+        if load["level"] >= admission.SHEDDING:
+            state = "overloaded"
+        else:
+            state = "degraded" if load["level"] else "healthy"
+        return {
+            "status": state,
+            **status(),
+            "admission": load,
+            "cpu": cpu_tuning.describe(),
+            "events": app.state.events.describe() if app.state.events is not None else None,
+            "recent_cache": app.state.recent.describe(),
+            "coalescing": app.state.inflight.describe()
+        }
+
+    @app.post("/recognize")
+    async def recognize_face_endpoint(file: UploadFile = File(...),
+                                      top_k: int = Query(config.DEFAULT_TOP_K, ge=1, le=config.MAX_TOP_K),
+                                      site: str = Form(None),
+                                      camera: str = Form(None)):
+        """Recognize face in uploaded image, returning the top-k candidates
+
+        site (e.g. the gate's city) is searched first; other sites only on a miss.
+        camera identifies the capturing kiosk for the recent-recognition cache.
+        """
+        try:
+            print(f"🔍 Recognition request received for file: {file.filename}")
+            contents = await file.read()
+            async with app.state.admission.slot() as plan:
+                return await run_in_threadpool(recognition_response, app, contents, top_k, "recognize", site,
+                                               camera, plan)
+
+        except admission.Overloaded as e:
+            print(f"⚠️ Recognition refused: {e}")
+            raise overloaded_error(e)
+        except Exception as e:
+            print(f"❌ Error in face recognition: {e}")
+            raise HTTPException(status_code=500, detail=f"Face recognition failed: {str(e)}")
+
+    @app.post("/verify")
+    async def verify_face_endpoint(file: UploadFile = File(...),
+                                   employee_id: int = Form(None),
+                                   employee_code: str = Form(None)):
+        """1:1 check of an uploaded face against a claimed identity (badge/PIN)"""
+        if employee_id is None and employee_code is None:
+            raise HTTPException(status_code=400, detail="employee_id or employee_code is required")
+
+        # Resolve the claim before running inference so unknown badges cost nothing;
+        # during a migration the claimed employee may only be enrolled with one model
+        for engine, gallery in serving_models(app):
+            claimed_id = gallery.resolve_id(employee_id, employee_code)
+            if claimed_id is not None:
+                break
+        else:
+            raise HTTPException(status_code=404, detail="Employee has no enrolled face")
+
+        try:
+            print(f"🔍 Verification request for employee {claimed_id}, file: {file.filename}")
+            contents = await file.read()
+            timings = {}
+            started = time.perf_counter()
+            async with app.state.admission.slot() as plan:
+                with profiling.track(app, "verify"):
+                    response = await run_in_threadpool(verification_response, app, engine, gallery, claimed_id,
+                                                       contents, timings, plan)
+            add_timing(timings, "total", started)
+            log_event(app, "verify", engine, response, timings, contents)
+            return response
+
+        except admission.Overloaded as e:
+            print(f"⚠️ Verification refused: {e}")
+            raise overloaded_error(e)
+        except Exception as e:
+            print(f"❌ Error in face verification: {e}")
+            raise HTTPException(status_code=500, detail=f"Face verification failed: {str(e)}")
+
+    @app.post("/encode")
+    async def encode_face_endpoint(file: UploadFile = File(...), include_crop: bool = Query(False)):
+        """Encode face in uploaded image for database storage
+
+        During a migration the face is embedded with both models, so the
+        stored encoding stays usable whichever side of the cutover we are on.
+        The response describes the detected face (box, landmarks, aligned
+        crop shape); include_crop adds the aligned crop as a base64 PNG.
+        With CROP_CACHE_DIR set the crop is kept for later re-embedding.
+        """
+        try:
+            print(f"🔍 Encoding request received for file: {file.filename}")
+            contents = await file.read()
+            entries = {}
+            face_embedding = None
+            primary_face = None
+            for engine, gallery in serving_models(app):
+                embedding, face = await run_in_threadpool(shared_face_embedding, app, engine, contents)
+                if embedding is None:
+                    continue
+                entries[engine.fingerprint] = encode_embedding(embedding, engine.encoding_format, engine.fingerprint)
+                if face_embedding is None:
+                    face_embedding = embedding
+                    primary_face = face
+
+            engine = app.state.engine
+            if engine.fingerprint not in entries:
+                return {
+                    "success": False,
+                    "face_encoding": None,
+                    "message": "No faces detected in the image",
+                    "model_used": engine.model_name
+                }
+
+            face_encoding_b64 = join_face_encoding(entries)
+            print(f"💾 Face encoding length: {len(face_encoding_b64)} characters")
+
+            cache = crops.get_cache()
+            crop_key = None
+            if cache is not None:
+                crop_key = await run_in_threadpool(cache.put, contents, primary_face, engine)
+
+            return {
+                "success": True,
+                "face_encoding": face_encoding_b64,
+                "message": f"Face encoding generated successfully using {engine.name}",
+                "model_used": engine.model_name,
+                "fingerprints": list(entries),
+                "embedding_length": len(face_embedding),
+                "face": crops.face_metadata(primary_face, engine),
+                "aligned_crop": crops.crop_png(primary_face) if include_crop else None,
+                "crop_key": crop_key
+            }
+
+        except Exception as e:
+            print(f"❌ Error encoding face: {e}")
+            raise HTTPException(status_code=500, detail=f"Face encoding failed: {str(e)}")
+
+    @app.post("/reload")
+    async def reload_database():
+        """Reload face database from backend"""
+        try:
+            loaded = await run_in_threadpool(reload_galleries, app)
+            return {
+                "success": True,
+                "message": f"Database reloaded. {loaded} faces loaded.",
+                "loaded_faces": loaded,
+                "model": app.state.engine.model_name
+            }
+        except Exception as e:
+            print(f"❌ Error reloading database: {e}")
+            raise HTTPException(status_code=500, detail=f"Database reload failed: {str(e)}")
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(create_app(), host=config.HOST, port=config.PORT)
@@ -0,0 +1,160 @@
+"""
+Gallery shard processes
+
+Splits the gallery across local worker processes, each holding a slice
+of the embedding matrix. A global search is scattered to every shard
+and the per-shard top-k lists are merged; a partition-scoped search only
+goes to the shard holding that partition. Whole partitions are kept on
+one shard (largest first, onto the least loaded shard), so a site search
+never needs to gather.
+
+Each shard has its own lock, held from a request to its reply, so
+searches on different shards run in parallel and concurrent global
+searches overlap shard by shard. Every served gallery (including a
+migration's secondary) gets its own pool.
+"""
+
+import multiprocessing as mp
+import threading
+
+import numpy as np
+
+import config
+import cpu_tuning
+
+
+def _shard_main(conn, metric):
+    """Shard process loop: answer load / top_k messages until stopped"""
+    # Parallelism comes from the shard processes themselves
+    cpu_tuning.apply_blas_threads(1)
+    from gallery import Gallery
+
+    gallery = Gallery(metric=metric)
+    while True:
+        message = conn.recv()
+        if message[0] == "load":
+            _, ids, embeddings, partitions = message
+            gallery._swap(ids, embeddings, {}, partitions)
+            conn.send(len(ids))
+        elif message[0] == "top_k":
+            _, query, k, partition = message
+            try:
+                conn.send(gallery.top_k(query, k, partition))
+            except Exception as e:
+                print(f"❌ Gallery shard search failed: {e}")
+                conn.send([])
+        else:
+            break
+
+
+class ShardPool:
+    """Gallery search scattered over shard processes"""
+
+    def __init__(self, shards, metric="cosine"):
+        context = mp.get_context("spawn")
+        self.connections, self.processes = [], []
+        for i in range(shards):
+            parent, child = context.Pipe()
+            process = context.Process(target=_shard_main, args=(child, metric),
+                                      name=f"gallery-shard-{i}", daemon=True)
+            process.start()
+            self.connections.append(parent)
+            self.processes.append(process)
+        # A shard's lock is held from request to reply, which keeps replies paired with requests
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self.holders = {}
+        self.rows = [0] * shards
+
+    def assign(self, ids, partitions):
+        """Row indexes per shard and the shard holding each partition"""
+        shards = len(self.connections)
+        rows = [[] for _ in range(shards)]
+        holders = {}
+        placed = np.zeros(len(ids), dtype=bool)
+        for key, partition_rows in sorted(partitions.items(), key=lambda item: -len(item[1])):
+            shard = min(range(shards), key=lambda s: len(rows[s]))
+            rows[shard].extend(partition_rows.tolist())
+            placed[partition_rows] = True
+            holders[key] = shard
+        # Rows outside any partition are dealt out evenly
+        for i, row in enumerate(np.nonzero(~placed)[0]):
+            rows[i % shards].append(int(row))
+        return rows, holders
+
+    def load(self, ids, embeddings, partitions):
+        """Send every shard its slice of a new gallery"""
+        rows, holders = self.assign(ids, partitions)
+        shards = range(len(self.connections))
+        # All shards switch together: no search sees some shards old and others new
+        for shard in shards:
+            self._locks[shard].acquire()
+        try:
+            for shard, (conn, shard_rows) in enumerate(zip(self.connections, rows)):
+                position = {row: i for i, row in enumerate(shard_rows)}
+                local_partitions = {
+                    key: np.asarray([position[r] for r in partitions[key].tolist()], dtype=np.int64)
+                    for key, holder in holders.items() if holder == shard
+                }
+                conn.send(("load", [ids[r] for r in shard_rows],
+                           embeddings[shard_rows] if len(shard_rows) else embeddings[:0], local_partitions))
+            for conn in self.connections:
+                conn.recv()
+            self.holders = holders
+            self.rows = [len(r) for r in rows]
+        finally:
+            for shard in shards:
+                self._locks[shard].release()
+
+    def top_k(self, query, k=1, partition=None):
+        """Merged top-k over all shards, or over the shard holding a partition"""
+        if partition is not None:
+            targets = [self.holders[partition]] if partition in self.holders else []
+        else:
+            targets = range(len(self.connections))
+        query = np.asarray(query, dtype=np.float32)
+        matches = []
+        # Locks are taken in shard order, so concurrent searches cannot deadlock; each is
+        # released as soon as its shard has replied, letting the next search in behind it
+        acquired = []
+        try:
+            for shard in targets:
+                self._locks[shard].acquire()
+                acquired.append(shard)
+                self.connections[shard].send(("top_k", query, k, partition))
+            while acquired:
+                shard = acquired[0]
+                matches.extend(self.connections[shard].recv())
+                acquired.pop(0)
+                self._locks[shard].release()
+        finally:
+            for shard in acquired:
+                self._locks[shard].release()
+        matches.sort(key=lambda match: -match[1])
+        return matches[:k]
+
+    def describe(self):
+        return {"processes": len(self.processes), "rows": self.rows}
+
+    def close(self):
+        for lock, conn in zip(self._locks, self.connections):
+            with lock:
+                try:
+                    conn.send(("stop",))
+                except (BrokenPipeError, OSError):
+                    pass
+        for process in self.processes:
+            process.join(timeout=5)
+
+
+def attach(gallery, metric):
+    """Give a served gallery its own shard processes when GALLERY_SHARDS is set (blocking)"""
+    if config.GALLERY_SHARDS > 0 and gallery.shards is None:
+        gallery.attach_shards(ShardPool(config.GALLERY_SHARDS, metric))
+    return gallery
+
+
+def detach(gallery):
+    """Stop the shard processes of a gallery that is no longer served"""
+    pool, gallery.shards = gallery.shards, None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,116 @@
+"""
+Admission control and degradation tests
+
+Uses the mock engine and engine instances that are never loaded (no
+models needed).
+"""
+
+import asyncio
+import time
+
+import numpy as np
+
+import admission
+import config
+import service
+from engines import DeepFaceEngine, DetectedFace, DlibEngine, FaceEngine, OnnxEngine
+from gallery import Gallery
+
+
+class BoxEngine(FaceEngine):
+    """Finds one face covering the middle of whatever image it is given"""
+
+    name = "box"
+
+    def detect(self, image, detector=None):
+        self.seen = image.shape[:2]
+        height, width = image.shape[:2]
+        return [DetectedFace((width // 4, height // 4, width // 2, height // 2),
+                             landmarks={"left_eye": (width * 0.375, height * 0.4)})]
+
+
+def wait(controller, seconds):
+    """Make the controller see a request that has been waiting for `seconds`"""
+    controller._waiting[object()] = time.monotonic() - seconds
+
+
+def admit(controller):
+    async def run():
+        async with controller.slot() as plan:
+            return plan
+    return asyncio.run(run())
+
+
+def test_levels_follow_queue_latency():
+    """Thresholds pick the level; shedding answers 503 and a full wait queue 429"""
+    controller = admission.AdmissionController(concurrency=1, max_queue=8, level_ms="100,200,300,400")
+    assert admit(controller).level == 0
+    wait(controller, 0.25)
+    assert controller.level() == admission.FAST_DETECTOR
+    wait(controller, 0.45)
+    try:
+        admit(controller)
+        raise AssertionError("admitted while shedding")
+    except admission.Overloaded as e:
+        assert e.status == 503 and e.retry_after >= 1
+
+    controller = admission.AdmissionController(concurrency=1, max_queue=1, level_ms="")
+    wait(controller, 10)
+    try:
+        admit(controller)
+        raise AssertionError("admitted with a full wait queue")
+    except admission.Overloaded as e:
+        assert e.status == 429
+
+
+def test_fast_detection_is_cheaper_or_skipped():
+    """Each engine gets a cheaper detector or a smaller detection image, or the level is skipped"""
+    plan = admission.Plan(admission.FAST_DETECTOR)
+    side = config.ADMISSION_DETECT_SIDE
+    assert plan.detection(DeepFaceEngine(detector_backend="opencv")) == (None, side)
+    assert plan.detection(DeepFaceEngine(detector_backend="retinaface")) == ("opencv", side)
+    assert plan.detection(DlibEngine(detection_model="hog")) == (None, side)
+    assert plan.detection(DlibEngine(detection_model="cnn")) == ("hog", side)
+    # ONNX detectors resize to a fixed input: only a configured smaller model helps
+    assert plan.detection(OnnxEngine()) == (None, None)
+    assert not admission.fast_detection(OnnxEngine())
+    assert admission.Plan(admission.REDUCED_RESOLUTION).detection(DlibEngine()) == (None, None)
+
+    plan = admission.Plan(admission.LOCAL_SEARCH)
+    assert plan.applied(OnnxEngine(), "global") == admission.REDUCED_RESOLUTION
+    assert plan.applied(DlibEngine(), "global") == admission.FAST_DETECTOR
+    assert plan.applied(OnnxEngine(), "site") == admission.LOCAL_SEARCH
+
+    partitioned = Gallery(partition_by="city")
+    assert admission.levels_in_effect(OnnxEngine(), Gallery()) == ["reduced_resolution", "shedding"]
+    assert admission.levels_in_effect(DlibEngine(), partitioned) == \
+        ["reduced_resolution", "fast_detector", "local_search", "shedding"]
+    assert "local_search" not in admission.levels_in_effect(DlibEngine(), Gallery(partition_by="hash"))
+
+
+def test_scaled_detection_maps_back():
+    """Detection on the downscaled image reports boxes and landmarks in full-image pixels"""
+    engine = BoxEngine()
+    image = np.zeros((960, 1280, 3), dtype=np.uint8)
+    face = engine.detect_scaled(image, max_side=320)[0]
+    assert engine.seen == (240, 320)
+    assert face.box == (320, 240, 640, 480)
+    assert np.allclose(face.landmarks["left_eye"], (480, 384))
+    engine.detect_scaled(image)
+    assert engine.seen == (960, 1280)
+
+
+def test_responses_name_applied_level(engine, employee, make_app):
+    """A response only reports a degradation that changed it"""
+    employees = [employee(1, city="Cairo")]
+    plan = admission.Plan(admission.LOCAL_SEARCH)
+
+    app = make_app(employees)
+    response = service.recognition_response(app, b"employee-1", site="Cairo", plan=plan)
+    assert response["recognized"] and response["degradation"] == "reduced_resolution"
+
+    app = make_app(employees, gallery=Gallery(metric=engine.metric, fingerprint=engine.fingerprint,
+                                              partition_by="city"))
+    response = service.recognition_response(app, b"employee-1", site="Cairo", plan=plan)
+    assert response["search_scope"] == "site" and response["degradation"] == "local_search"
+    assert "degradation" not in service.recognition_response(app, b"employee-1", plan=admission.Plan(0))
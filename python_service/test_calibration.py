@@ -0,0 +1,77 @@
+"""
+Score calibration and top-k search tests
+
+Uses the mock engine and engine instances that are never loaded (no
+models needed).
+"""
+
+import json
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import calibration
+from engines import DeepFaceEngine, DlibEngine, MockEngine, OnnxEngine
+from gallery import Gallery
+
+
+def test_operating_points():
+    """Every engine's operating point calibrates to 0.5, and raw_threshold inverts calibrate"""
+    for engine in (DeepFaceEngine(model_name="OpenFace"), DlibEngine(), OnnxEngine(), MockEngine()):
+        assert abs(float(calibration.calibrate(engine, engine.default_threshold)) - 0.5) < 1e-9, engine.name
+        for confidence in (0.05, 0.5, 0.9):
+            raw = calibration.raw_threshold(engine, confidence)
+            assert abs(float(calibration.calibrate(engine, raw)) - confidence) < 1e-9
+        scores = calibration.calibrate(engine, np.linspace(-1.0, 1.0, 41))
+        assert np.all(np.diff(scores) >= 0) and scores[0] == 0.0 and scores[-1] == 1.0
+
+    # A model without a table is anchored on its engine's default threshold
+    engine = DeepFaceEngine(model_name="Facenet512")
+    assert float(calibration.calibrate(engine, engine.default_threshold)) == 0.5
+
+
+def test_calibration_file_overrides(tmp_path, monkeypatch):
+    """Tables from CALIBRATION_FILE replace the built-in ones, sorted by raw score"""
+    monkeypatch.setattr(calibration, "CALIBRATION_TABLES", dict(calibration.CALIBRATION_TABLES))
+    path = tmp_path / "calibration.json"
+    path.write_text(json.dumps({"calibration-test-model": [[1.0, 1.0], [-1.0, 0.0], [0.2, 0.5]]}))
+    assert calibration.load_calibration_file(str(path)) == 1
+    engine = MockEngine()
+    engine.model_name = "calibration-test-model"
+    assert float(calibration.calibrate(engine, 0.2)) == 0.5
+    assert calibration.raw_threshold(engine, 0.5) == 0.2
+    assert calibration.load_calibration_file(str(tmp_path / "missing.json")) == 0
+
+
+def test_top_k_matches_full_sort():
+    """top_k returns the k best rows, best first, as a full sort would; k beyond the gallery returns all"""
+    rng = np.random.default_rng(3)
+    embeddings = rng.standard_normal((50, 16))
+    gallery = Gallery()
+    gallery.load_prepared(list(range(100, 150)), gallery._prepare(embeddings),
+                          {100 + i: {"employeeId": f"EMP{i:04d}"} for i in range(50)})
+    query = rng.standard_normal(16)
+    scores = gallery.scores(query)
+    expected = [100 + int(i) for i in np.argsort(-scores)]
+    for k in (1, 5, 50):
+        matches = gallery.top_k(query, k)
+        assert [employee_id for employee_id, _ in matches] == expected[:k]
+        assert all(a[1] >= b[1] for a, b in zip(matches, matches[1:]))
+    assert len(gallery.top_k(query, 80)) == 50
+
+
+def test_recognize_returns_calibrated_candidates(engine, employee, make_app):
+    """/recognize lists top_k candidates with calibrated confidence, raw score and margin"""
+    app = make_app([employee(i) for i in range(4)])
+
+    response = TestClient(app).post("/recognize", params={"top_k": 3},
+                                    files={"file": ("face.jpg", b"employee-2", "image/jpeg")})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    candidates = result["candidates"]
+    assert result["recognized"] and result["employeeId"] == 2 and len(candidates) == 3
+    assert candidates[0]["employeeId"] == 2 and candidates[0]["confidence"] == result["confidence"]
+    for candidate in candidates:
+        assert abs(candidate["confidence"] - float(calibration.calibrate(engine, candidate["raw_score"]))) < 1e-9
+    assert abs(result["margin"] - (candidates[0]["confidence"] - candidates[1]["confidence"])) < 1e-9
+
@@ -0,0 +1,76 @@
+"""
+CPU thread and affinity setting tests
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+import config
+import cpu_tuning
+
+
+def test_parse_cpu_list():
+    """Core lists accept ranges, single cores, duplicates and stray commas"""
+    assert cpu_tuning.parse_cpu_list("0-3,8") == [0, 1, 2, 3, 8]
+    assert cpu_tuning.parse_cpu_list(" 2, 1-2,,5 ") == [1, 2, 5]
+    assert cpu_tuning.parse_cpu_list("") == []
+
+
+def test_worker_cpus_split_evenly():
+    """Workers get disjoint equal shares, wrapping around when cores run out"""
+    cpus = [0, 1, 2, 3, 4, 5, 6, 7]
+    assert [cpu_tuning.worker_cpus(slot, 4, cpus=cpus) for slot in range(4)] == [[0, 1], [2, 3], [4, 5], [6, 7]]
+    assert cpu_tuning.worker_cpus(1, 2, cpus_per_worker=3, cpus=cpus) == [3, 4, 5]
+    assert cpu_tuning.worker_cpus(2, 3, cpus_per_worker=3, cpus=cpus) == [6, 7, 0]
+    assert cpu_tuning.worker_cpus(3, 8, cpus=[0, 1]) == [1]
+
+
+def test_worker_slots_are_exclusive(tmp_path, monkeypatch):
+    """Each claim takes the next free slot until all are held"""
+    pytest.importorskip("fcntl")
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(cpu_tuning, "_slot_lock", None)
+    first = cpu_tuning.claim_worker_slot(2)
+    held = cpu_tuning._slot_lock
+    try:
+        assert first == 0
+        assert cpu_tuning.claim_worker_slot(2) == 1
+        assert cpu_tuning.claim_worker_slot(2) is None
+    finally:
+        held.close()
+        cpu_tuning._slot_lock.close()
+    assert os.listdir(tmp_path) == [f"face_service_slots_{config.PORT}"]
+
+
+def test_affinity_pins_configured_cores(monkeypatch):
+    """An explicit core list pins the process; an empty setting leaves it alone"""
+    if not hasattr(os, "sched_setaffinity"):
+        pytest.skip("CPU affinity is not supported on this platform")
+    original = os.sched_getaffinity(0)
+    core = min(original)
+    try:
+        assert cpu_tuning.apply_cpu_affinity("") is None
+        assert cpu_tuning.apply_cpu_affinity(str(core)) == [core]
+        assert cpu_tuning.available_cpus() == [core]
+        monkeypatch.setenv("WORKER_INDEX", "0")
+        monkeypatch.setattr(config, "WORKERS", 1)
+        monkeypatch.setattr(config, "CPUS_PER_WORKER", 1)
+        assert cpu_tuning.apply_cpu_affinity("auto") == [core]
+    finally:
+        os.sched_setaffinity(0, original)
+
+
+def test_blas_threads_respect_existing_environment(monkeypatch):
+    """BLAS limits fill unset variables only, and 0 leaves everything alone"""
+    # Keep an installed threadpoolctl from limiting BLAS for the rest of the session
+    monkeypatch.setitem(sys.modules, "threadpoolctl", None)
+    for name in cpu_tuning.BLAS_ENV_VARS:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("OMP_NUM_THREADS", "3")
+    cpu_tuning.apply_blas_threads(0)
+    assert "MKL_NUM_THREADS" not in os.environ
+    cpu_tuning.apply_blas_threads(1)
+    assert os.environ["OMP_NUM_THREADS"] == "3" and os.environ["MKL_NUM_THREADS"] == "1"
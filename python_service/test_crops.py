@@ -0,0 +1,71 @@
+"""
+Aligned crop cache tests
+
+The dlib geometry test stands a recorder in for face_recognition, so it
+runs without dlib installed.
+"""
+
+import numpy as np
+
+import config
+import crops
+import enrollment
+import migration
+from engines import DetectedFace, DlibEngine
+
+
+def test_round_trip_and_alignment_misses(engine, tmp_path, monkeypatch):
+    """A stored crop comes back for engines aligning the same way and is a miss for others"""
+    cache = crops.CropCache(str(tmp_path / "crops"))
+    embedding, face = engine.represent(engine.decode(b"employee-1"))
+    key = cache.put(b"employee-1", face, engine)
+    assert key == crops.crop_key(b"employee-1") and len(cache) == 1
+
+    cached = cache.get(b"employee-1", engine)
+    assert cached.box == face.box and np.array_equal(cached.aligned, face.aligned)
+    assert np.array_equal(engine.represent_aligned(cached.aligned), embedding)
+    assert cache.get(b"unknown", engine) is None
+    assert cache.get(b"employee-1", DlibEngine()) is None
+    monkeypatch.setattr(config, "ALIGN_MODE", "eyes")
+    assert cache.get(b"employee-1", engine) is None
+
+
+def test_cache_disabled_without_directory(tmp_path, monkeypatch):
+    """get_cache is None while CROP_CACHE_DIR is unset"""
+    assert crops.get_cache() is None
+    monkeypatch.setattr(config, "CROP_CACHE_DIR", str(tmp_path))
+    assert crops.get_cache().directory == str(tmp_path)
+
+
+def test_migration_embeds_cached_crops(engine, tmp_path, monkeypatch):
+    """Re-embedding a cached photo gives the same embedding as a fresh scan"""
+    monkeypatch.setattr(config, "CROP_CACHE_DIR", str(tmp_path / "crops"))
+    monkeypatch.setattr(enrollment, "worker_engine", engine)
+    fresh = migration._embed_photos([(1, b"employee-1")])
+    assert len(crops.get_cache()) == 1
+    cached = migration._embed_photos([(1, b"employee-1")])
+    assert fresh[0][1] == cached[0][1] == "migrated"
+    assert np.array_equal(fresh[0][2], cached[0][2])
+
+
+class RecordingFaceRecognition:
+    """Returns the pixels inside the location it was asked to encode"""
+
+    def face_encodings(self, image, locations):
+        top, right, bottom, left = locations[0]
+        return [image[top:bottom, left:right].copy()]
+
+
+def test_dlib_context_crop_keeps_box():
+    """dlib's crop carries context around the box, zero-filled at the edge, and embeds the box itself"""
+    engine = DlibEngine()
+    engine._fr = RecordingFaceRecognition()
+    image = np.arange(60 * 80 * 3, dtype=np.uint8).reshape(60, 80, 3)
+    for box in ((20, 10, 30, 21), (0, 0, 15, 16), (70, 50, 10, 10)):
+        face = DetectedFace(box)
+        crop = engine.align(image, face)
+        _, _, w, h = box
+        assert crop.shape == (h + 2 * (h // 2), w + 2 * (w // 2), 3)
+        assert np.array_equal(engine.embed(image, face), face.crop(image))
+    assert not crop[-1].any() and not crop[:, -1].any()
+    assert engine.alignment == "dlib"
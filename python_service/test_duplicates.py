@@ -0,0 +1,30 @@
+"""
+Duplicate-identity detection tests
+"""
+
+import numpy as np
+
+import duplicates
+
+
+def test_backend_gallery_loads_tagged_encodings(engine, employee, backend):
+    """The backend-mode duplicate job loads encodings tagged with its engine's fingerprint"""
+    backend.employees = [employee(0), employee(1)]
+    assert len(duplicates.load_backend_gallery(engine)) == 2
+
+
+def test_projected_pass_misses_no_pair():
+    """The PCA prefilter finds exactly the pairs of the exact join, for both metrics"""
+    rng = np.random.default_rng(11)
+    embeddings = rng.standard_normal((300, 64)).astype(np.float32)
+    # Near-duplicates whose difference lies mostly outside the top principal directions
+    embeddings[150:] = embeddings[:150] + 0.6 * rng.standard_normal((150, 64)).astype(np.float32)
+    projection = duplicates.fit_projection(embeddings, 8)
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    for metric, matrix, threshold in (("cosine", normalized, 0.6), ("euclidean", embeddings / 8.0, 0.3)):
+        exact = sorted(duplicates.blocked_join(matrix, matrix, threshold, metric, 64, same=True))
+        projected = sorted(duplicates.blocked_join(matrix, matrix, threshold, metric, 64, same=True,
+                                                   projection=projection))
+        assert len(exact) >= 100
+        assert [(a, b) for a, b, _ in projected] == [(a, b) for a, b, _ in exact]
+        assert np.allclose([score for _, _, score in projected], [score for _, _, score in exact], atol=1e-5)
@@ -0,0 +1,122 @@
+"""
+Engine registry and pipeline tests
+
+Model-backed engines are only constructed, never loaded, so none of
+their libraries need to be installed.
+"""
+
+import numpy as np
+import pytest
+
+import config
+import engines
+from engines import DeepFaceEngine, DetectedFace, MockEngine, OnnxEngine
+
+
+def test_registry_builds_named_engines(monkeypatch):
+    """Engines are looked up by registered name, take options, and unknown names are refused"""
+    assert {"deepface", "dlib", "onnx", "mock"} <= set(engines.available_engines())
+    assert engines.get_engine("mock", dimension=16).dimension == 16
+    monkeypatch.setattr(config, "FACE_ENGINE", "mock")
+    assert isinstance(engines.get_engine(), MockEngine)
+    with pytest.raises(ValueError):
+        engines.get_engine("missing")
+
+    monkeypatch.setattr(engines, "ENGINES", dict(engines.ENGINES))
+
+    @engines.register_engine("custom")
+    class CustomEngine(MockEngine):
+        pass
+
+    assert CustomEngine.name == "custom" and isinstance(engines.get_engine("custom"), CustomEngine)
+
+
+class BrokenEngine(MockEngine):
+    def _load(self):
+        raise RuntimeError("model file missing")
+
+
+def test_failed_load_finds_no_face():
+    """An engine that cannot load reports it and represents nothing"""
+    engine = BrokenEngine()
+    assert engine.load() is False and not engine.loaded
+    assert engine.represent(b"photo") == (None, None)
+    assert engine.represent_aligned(np.zeros(4, dtype=np.uint8)) is None
+
+
+def test_onnx_engine_reads_config(monkeypatch):
+    """The ONNX engine takes model paths, threads and its fast detector from config"""
+    monkeypatch.setattr(config, "ONNX_INTRA_OP_THREADS", 2)
+    monkeypatch.setattr(config, "ONNX_INTER_OP_THREADS", 1)
+    engine = OnnxEngine(detector_model="models/detector.onnx")
+    assert (engine.intra_op_threads, engine.inter_op_threads) == (2, 1)
+    assert engine.detector_name == "onnx:detector.onnx" and engine.fast_detector is None
+    assert engine.fingerprint == f"onnx:{config.ONNX_MODEL_NAME}"
+    assert OnnxEngine(intra_op_threads=4).intra_op_threads == 4
+
+    monkeypatch.setattr(config, "ONNX_FAST_DETECTOR_MODEL", "models/small.onnx")
+    assert OnnxEngine().fast_detector == "onnx:small.onnx"
+
+
+def test_alignment_and_fingerprints(monkeypatch):
+    """Non-engine alignment changes the fingerprint only of engines that align natively"""
+    deepface, onnx = DeepFaceEngine(model_name="OpenFace"), OnnxEngine()
+    assert deepface.alignment == "deepface" and onnx.alignment == "box"
+    assert deepface.accepts_untagged and deepface.fingerprint == "deepface:OpenFace"
+
+    monkeypatch.setattr(config, "ALIGN_MODE", "eyes")
+    assert deepface.alignment == onnx.alignment == "eyes"
+    assert deepface.fingerprint == "deepface:OpenFace+eyes" and not deepface.accepts_untagged
+    assert onnx.fingerprint == f"onnx:{config.ONNX_MODEL_NAME}" and onnx.accepts_untagged
+
+
+def test_align_face_modes():
+    """'box' cuts the box, 'eyes' levels tilted eyes, 'engine' keeps a detector chip"""
+    image = np.arange(40 * 40 * 3, dtype=np.uint8).reshape(40, 40, 3)
+    face = DetectedFace((10, 5, 20, 16), landmarks={"left_eye": (14, 10), "right_eye": (26, 10)})
+    box = engines.align_face(image, face, "box")
+    assert np.array_equal(box, image[5:21, 10:30])
+    # Level eyes need no rotation
+    assert np.array_equal(engines.align_face(image, face, "eyes"), box)
+    face.landmarks = {"left_eye": (14, 8), "right_eye": (26, 12)}
+    assert engines.align_face(image, face, "eyes").shape == box.shape
+    assert not np.array_equal(engines.align_face(image, face, "eyes"), box)
+
+    face.chip = np.zeros((8, 8, 3), dtype=np.uint8)
+    assert np.array_equal(engines.align_face(image, face, "engine"), face.chip)
+    assert np.array_equal(engines.align_face(image, face, "box"), box)
+
+
+class FixedBoxEngine(MockEngine):
+    """Finds one face at a fixed spot of whatever image it gets"""
+
+    downscales_detection = True
+
+    def detect(self, image, detector=None):
+        self.detected_shape = image.shape
+        return [DetectedFace((10, 5, 20, 10), landmarks={"left_eye": (12, 8)})]
+
+
+def test_detect_scaled_maps_boxes_back():
+    """Detection on a downscaled copy reports boxes in full-image pixels"""
+    engine = FixedBoxEngine()
+    faces = engine.detect_scaled(np.zeros((100, 200, 3), dtype=np.uint8), max_side=50)
+    assert engine.detected_shape == (25, 50, 3)
+    assert faces[0].box == (40, 20, 80, 40) and faces[0].landmarks["left_eye"] == (48.0, 32.0)
+    faces = engine.detect_scaled(np.zeros((40, 40, 3), dtype=np.uint8), max_side=50)
+    assert engine.detected_shape == (40, 40, 3) and faces[0].box == (10, 5, 20, 10)
+
+
+def test_nms_keeps_best_of_overlaps():
+    """Overlapping boxes collapse to the highest score; separate ones stay"""
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30]], dtype=np.float32)
+    scores = np.array([0.8, 0.9, 0.7], dtype=np.float32)
+    assert engines._nms(boxes, scores, 0.3) == [1, 2]
+
+
+def test_represent_records_stage_timings(engine):
+    """represent fills the per-stage timings and keeps the aligned crop on the face"""
+    timings = {}
+    embedding, face = engine.represent(engine.decode(b"employee-1"), timings=timings)
+    assert set(timings) == {"detect", "align", "embed"}
+    assert face.aligned is not None and np.array_equal(engine.represent_aligned(face.aligned), embedding)
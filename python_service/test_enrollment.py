@@ -0,0 +1,76 @@
+"""
+Bulk enrollment tests
+
+Runs use one spawned mock-engine worker, which enrolls every photo.
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import config
+import enrollment
+import engines
+from engines import MockEngine
+
+
+def write_photos(directory, names):
+    directory.mkdir()
+    for name in names:
+        (directory / name).write_bytes(name.encode())
+
+
+def test_resume_retries_only_errors(tmp_path):
+    """A resumed run keeps final results and embeds photos that previously failed again"""
+    photos, output = tmp_path / "photos", tmp_path / "run"
+    write_photos(photos, ["EMP0001.jpg", "EMP0002.jpg", "EMP0003.jpg"])
+    output.mkdir()
+    with open(output / enrollment.MANIFEST_FILE, "w") as manifest:
+        manifest.write(json.dumps({"file": "EMP0002.jpg", "employeeId": "EMP0002", "status": "no_face"}) + "\n")
+        manifest.write(json.dumps({"file": "EMP0003.jpg", "employeeId": "EMP0003", "status": "error"}) + "\n")
+
+    run = enrollment.EnrollmentRun(str(photos), str(output), "mock", workers=1)
+    assert run.run() == {"no_face": 1, "ok": 2}
+    entries = enrollment.read_manifest(str(output))
+    assert [entry["file"] for entry in entries].count("EMP0002.jpg") == 1
+    assert entries[-1]["status"] == "ok"
+    assert run.write_gallery() == 2
+
+
+class BrokenEngine(MockEngine):
+    def _load(self):
+        raise RuntimeError("model file missing")
+
+
+def test_worker_fails_without_engine(monkeypatch):
+    """A worker whose engine cannot load fails instead of embedding with an unloaded engine"""
+    for name in ("INTRA_OP_THREADS", "ONNX_INTRA_OP_THREADS", "INTER_OP_THREADS",
+                 "ONNX_INTER_OP_THREADS", "OPENCV_THREADS"):
+        monkeypatch.setattr(config, name, getattr(config, name))
+    monkeypatch.setitem(engines.ENGINES, "broken", BrokenEngine)
+    monkeypatch.setattr(enrollment, "worker_engine", None)
+    with pytest.raises(RuntimeError):
+        enrollment.init_worker("broken")
+
+
+def test_bulk_source_confined_to_root(make_app, tmp_path, monkeypatch):
+    """/enroll/bulk only reads sources under ENROLL_SOURCE_ROOT, and none while it is unset"""
+    started = []
+    monkeypatch.setattr(enrollment, "start_background_run", lambda run_id, run, *args, **kwargs: started.append(run))
+    monkeypatch.setattr(config, "ENROLL_DIR", str(tmp_path / "runs"))
+    root = tmp_path / "root"
+    write_photos(root, ["EMP0001.jpg"])
+    (tmp_path / "outside").mkdir()
+    client = TestClient(make_app())
+
+    def enroll(source):
+        return client.post("/enroll/bulk", data={"source": source}).status_code
+
+    assert enroll(str(root)) == 403
+    monkeypatch.setattr(config, "ENROLL_SOURCE_ROOT", str(root))
+    assert enroll("../outside") == 403 and enroll(str(tmp_path / "outside")) == 403
+    assert enroll("missing") == 400
+    assert not started and not (tmp_path / "runs").exists()
+    assert enroll(".") == 200 and enroll(str(root / "EMP0001.jpg")) == 200
+    assert [run.source for run in started] == [str(root), str(root / "EMP0001.jpg")]
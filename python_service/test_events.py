@@ -0,0 +1,50 @@
+"""
+Recognition event log tests
+"""
+
+from fastapi.testclient import TestClient
+
+import config
+import events
+
+
+def test_batched_writes_flush_on_stop(tmp_path):
+    """Queued events are written in batches and the rest is flushed when the writer stops"""
+    path = str(tmp_path / "events.sqlite3")
+    log = events.EventLog(path, batch_size=2, flush_seconds=0.05)
+    for i in range(5):
+        log.record("recognize", {"model": "mock", "recognized": i % 2 == 0, "employeeId": i,
+                                 "confidence": 0.5, "timings": {"total": 10.0 + i}})
+    log.record("verify", {"model": "mock", "verified": True, "confidence": 1.0})
+    log.start()
+    log.stop()
+
+    assert log.describe()["written"] == 6 and log.describe()["queued"] == 0
+    assert [event["employeeId"] for event in events.read_events(path, kind="recognize")] == [0, 1, 2, 3, 4]
+    assert [event["kind"] for event in log.recent(2)] == ["verify", "recognize"]
+    groups = {group["kind"]: group for group in log.stats(0)}
+    assert groups["recognize"]["events"] == 5 and groups["recognize"]["accepted"] == 3
+    assert groups["recognize"]["avg_total_ms"] == 12.0 and groups["verify"]["accepted"] == 1
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    """Without a writer keeping up, extra events are counted as dropped and nothing touches the disk"""
+    log = events.EventLog(str(tmp_path / "events.sqlite3"), queue_max=2)
+    for _ in range(3):
+        log.record("recognize", {})
+    assert log.describe()["queued"] == 2 and log.dropped == 1
+    assert not (tmp_path / "events.sqlite3").exists()
+
+
+def test_recognitions_logged(employee, make_app, tmp_path, monkeypatch):
+    """Scans through the service land in the log with their stage timings; a disabled log answers 404"""
+    path = str(tmp_path / "events.sqlite3")
+    monkeypatch.setattr(config, "EVENTS_DB", path)
+    with TestClient(make_app([employee(1)])) as client:
+        assert client.post("/recognize", files={"file": ("face.jpg", b"employee-1", "image/jpeg")}).status_code == 200
+    logged = events.read_events(path)
+    assert len(logged) == 1 and logged[0]["kind"] == "recognize" and logged[0]["employeeId"] == 1
+    assert {"detect", "embed", "search"} <= set(logged[0]["timings"])
+
+    monkeypatch.setattr(config, "EVENTS_DB", "")
+    assert TestClient(make_app()).get("/events").status_code == 404
@@ -0,0 +1,144 @@
+"""
+Fast path tests
+
+Runs the Unix socket listener on a private event loop with the mock
+engine and talks to it with FastPathClient.
+"""
+
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+
+import admission
+import fastpath
+from engines import MockEngine, register_engine
+from gallery import Gallery
+
+SLOW_SECONDS = 1.0
+
+
+@register_engine("mock-slow")
+class SlowMockEngine(MockEngine):
+    """Mock engine that takes SLOW_SECONDS for images starting with b'slow'"""
+
+    model_name = "mock"
+
+    def represent(self, image, *args, **kwargs):
+        if bytes(image).startswith(b"slow"):
+            time.sleep(SLOW_SECONDS)
+        return super().represent(image, *args, **kwargs)
+
+
+@pytest.fixture
+def app(employee, make_app):
+    engine = SlowMockEngine()
+    employees = [employee(i, with_engine=engine, city="Cairo" if i else "Giza") for i in range(3)]
+    app = make_app(employees, with_engine=engine,
+                   gallery=Gallery(metric=engine.metric, fingerprint=engine.fingerprint, partition_by="city"))
+    app.state.admission = admission.AdmissionController(concurrency=4, level_ms="")
+    return app
+
+
+@pytest.fixture
+def listener(app, tmp_path):
+    listener = Listener(app, str(tmp_path / "fastpath.sock"))
+    yield listener
+    listener.close()
+
+
+def cameras(app):
+    """Cameras with identities in the recent-recognition cache"""
+    return {camera for camera, _ in app.state.recent._entries}
+
+
+class Listener:
+    """The fast path server on its own event loop thread"""
+
+    def __init__(self, app, path):
+        self.path = path
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(fastpath.start_server(app, self.path), self.loop).result(5)
+
+    async def _shutdown(self):
+        self.server.close()
+        # Let connection handlers see their clients go away
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if others:
+            await asyncio.wait(others, timeout=5)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.loop.close()
+
+
+def test_frames_round_trip(app):
+    """Request frames carry their id, op, top_k, site and camera through to the answer"""
+    frame = fastpath.encode_request(7, fastpath.OP_RECOGNIZE, b"employee-1", 2, site="Cairo", camera="kiosk-1")
+    request_id, payload = fastpath.split_frame(frame[fastpath.HEADER.size:])
+    assert request_id == 7
+    result = fastpath.handle_payload(app, payload)
+    assert result["recognized"] and result["employeeId"] == 1
+    assert result["search_scope"] == "site"
+    # The camera keys the recent-recognition cache, as on the HTTP path
+    assert cameras(app) == {"kiosk-1"}
+
+    # A camera without a site, and the older site-only op
+    _, payload = fastpath.split_frame(fastpath.encode_request(8, fastpath.OP_RECOGNIZE, b"employee-2",
+                                                              camera="kiosk-2")[fastpath.HEADER.size:])
+    assert fastpath.handle_payload(app, payload)["search_scope"] == "global"
+    assert cameras(app) == {"kiosk-1", "kiosk-2"}
+    payload = bytes((fastpath.OP_RECOGNIZE_AT_SITE, 1, 4)) + b"Giza" + b"employee-0"
+    assert fastpath.handle_payload(app, payload)["search_scope"] == "site"
+
+    for bad in (bytes((fastpath.OP_RECOGNIZE_AT_SITE, 1, 200)) + b"short",
+                bytes((fastpath.OP_RECOGNIZE_WITH_CONTEXT, 1, 0, 200)) + b"short", bytes((9, 1)), b"\x01"):
+        try:
+            fastpath.handle_payload(app, bad)
+        except fastpath.FrameError:
+            continue
+        raise AssertionError(f"payload {bad!r} was accepted")
+
+
+def test_slow_request_does_not_hold_up_others(listener):
+    """Requests pipelined behind a slow one on the same connection are answered first"""
+    client = fastpath.FastPathClient(listener.path, timeout=10)
+    try:
+        started = time.perf_counter()
+        slow = client.send(fastpath.OP_RECOGNIZE, b"slow photo")
+        fast = [client.send(fastpath.OP_RECOGNIZE, f"employee-{i}".encode()) for i in range(3)]
+        answers = [client.receive() for _ in range(4)]
+        order = [request_id for request_id, _ in answers]
+        assert sorted(order[:3]) == sorted(fast) and order[3] == slow, order
+        assert all(result["recognized"] for _, result in answers[:3])
+        assert time.perf_counter() - started < SLOW_SECONDS * 2
+        # The connection stays usable afterwards
+        assert client.ping()["ok"] is True
+    finally:
+        client.close()
+
+
+def test_malformed_stream_is_reported(listener):
+    """A frame too short to carry a request id gets an error under id 0, then the connection closes"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    try:
+        sock.connect(listener.path)
+        sock.sendall(fastpath.HEADER.pack(2) + b"\x00\x01")
+        data = b""
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        request_id, payload = fastpath.split_frame(data[fastpath.HEADER.size:])
+        assert request_id == 0 and b"error" in payload
+    finally:
+        sock.close()
+
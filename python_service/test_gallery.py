@@ -0,0 +1,79 @@
+"""
+Gallery and /verify tests
+"""
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import service
+from gallery import Gallery
+
+
+def filtered_employees(employee):
+    """Three employees that load, one with a stray embedding size, one enrolled with another model"""
+    return [
+        employee(1), employee(2), employee(3),
+        employee(4, embedding=np.ones(64)),
+        employee(5, fingerprint="onnx:other")
+    ]
+
+
+def test_filtered_rows_not_resolvable(engine, employee):
+    """Employees dropped by the size/fingerprint filters have no record and no badge lookup"""
+    gallery = Gallery(metric=engine.metric, fingerprint=engine.fingerprint)
+    assert gallery.load_employees(filtered_employees(employee)) == 3
+    assert sorted(gallery.records) == [1, 2, 3]
+    assert gallery.resolve_id(employee_code="EMP0001") == 1
+    assert gallery.resolve_id(employee_code="EMP0004") is None
+    assert gallery.resolve_id(employee_code="EMP0005") is None
+    assert gallery.verify(np.ones(128), 4) is None
+
+
+def test_verify_filtered_employee(engine, employee, make_app):
+    """/verify answers 404 for a filtered claim and 'not verified' for one removed after resolving"""
+    app = make_app(filtered_employees(employee))
+    client = TestClient(app)
+
+    photo = ("face.jpg", b"employee-1", "image/jpeg")
+    response = client.post("/verify", files={"file": photo}, data={"employee_code": "EMP0001"})
+    assert response.status_code == 200 and response.json()["verified"] is True
+    response = client.post("/verify", files={"file": photo}, data={"employee_code": "EMP0004"})
+    assert response.status_code == 404
+
+    result = service.verification_response(app, engine, app.state.gallery, 4, b"employee-1", {})
+    assert result["verified"] is False and result["confidence"] == 0.0
+
+
+class SwappingGallery(Gallery):
+    """Installs a pending version in the middle of a search, as a concurrent reload would"""
+
+    pending = None
+
+    def _scores(self, embeddings, embedding, rows=None):
+        if self.pending is not None:
+            version, self.pending = self.pending, None
+            self.load_prepared(*version)
+        return super()._scores(embeddings, embedding, rows)
+
+
+def test_searches_use_one_version():
+    """A swap during top_k or verify does not mix the old rows with the new ids or partitions"""
+    rng = np.random.default_rng(5)
+    gallery = SwappingGallery(partition_by="city")
+    old = (list(range(10)), gallery._prepare(rng.standard_normal((10, 8))),
+           {i: {"employeeId": f"EMP{i:04d}", "city": ("Cairo", "Giza")[i % 2]} for i in range(10)})
+    new = ([100, 101, 102], gallery._prepare(rng.standard_normal((3, 8))),
+           {i: {"employeeId": f"EMP{i:04d}", "city": "Giza"} for i in (100, 101, 102)})
+    gallery.load_prepared(*old)
+    query = old[1][4]
+    expected = gallery.top_k(query, 3, "cairo")
+
+    gallery.load_prepared(*old)
+    gallery.pending = new
+    assert gallery.top_k(query, 3, "cairo") == expected and expected[0][0] == 4
+    assert gallery.ids == new[0] and gallery.top_k(query, 3, "cairo") == []
+
+    gallery.load_prepared(*old)
+    gallery.pending = new
+    assert abs(gallery.verify(query, 4) - 1.0) < 1e-5
+    assert gallery.verify(query, 4) is None
@@ -0,0 +1,94 @@
+"""
+Recognition job queue tests
+
+Several queues on one database stand in for service workers sharing
+JOBS_DB.
+"""
+
+import os
+import socket
+import time
+
+import config
+import jobs
+import service
+
+
+def make_queue(directory, name, processor=None):
+    return jobs.JobQueue(processor or (lambda contents, top_k, site: {"size": len(contents)}),
+                         str(directory / f"{name}.sqlite3"), str(directory / name))
+
+
+def set_running(queue, job_id, owner, lease_until):
+    queue._execute("UPDATE jobs SET status = 'running', owner = ?, lease_until = ? WHERE id = ?",
+                   (owner, lease_until, job_id))
+
+
+def test_app_creation_touches_no_files(tmp_path, monkeypatch):
+    """The job queue and event log open their databases on first use, not in create_app"""
+    directory = tmp_path / "lazy"
+    directory.mkdir()
+    monkeypatch.setattr(config, "JOBS_DB", str(directory / "jobs.sqlite3"))
+    monkeypatch.setattr(config, "JOBS_DIR", str(directory / "jobs"))
+    monkeypatch.setattr(config, "EVENTS_DB", str(directory / "events.sqlite3"))
+    app = service.create_app("mock", load_gallery=False)
+    assert os.listdir(directory) == []
+    app.state.jobs.submit(b"photo")
+    assert os.path.exists(config.JOBS_DB) and os.path.isdir(config.JOBS_DIR)
+
+
+def test_recover_only_takes_over_abandoned_jobs(tmp_path):
+    """Jobs of a live, leasing worker stay put; dead owners and expired leases are re-queued"""
+    first, second = make_queue(tmp_path, "shared"), make_queue(tmp_path, "shared")
+    running = first.submit(b"a")
+    assert first._claim()["id"] == running
+    # A sibling starting up must not steal the job the first worker is running
+    assert second.recover() == 0
+    assert first.get(running)["status"] == "running"
+
+    dead = first.submit(b"b")
+    set_running(first, dead, f"{socket.gethostname()}:999999999", time.time() + 60)
+    expired = first.submit(b"c")
+    set_running(first, expired, "other-host:1", time.time() - 1)
+    leased = first.submit(b"d")
+    set_running(first, leased, "other-host:1", time.time() + 60)
+
+    assert second.recover() == 2
+    assert first.get(dead)["status"] == "queued" and first.get(expired)["status"] == "queued"
+    assert first.get(leased)["status"] == "running" and first.get(running)["status"] == "running"
+
+
+def test_restart_with_same_pid_recovers_orphans(tmp_path):
+    """Jobs of an earlier process that had this hostname and pid are neither renewed nor left running"""
+    queue = make_queue(tmp_path, "restart")
+    lease_until = time.time() + 60
+    orphans = []
+    for owner in (f"{socket.gethostname()}:{os.getpid()}:0123456789ab", f"{socket.gethostname()}:{os.getpid()}"):
+        orphans.append(queue.submit(b"a"))
+        set_running(queue, orphans[-1], owner, lease_until)
+    queue._renew()
+    leases = [row[0] for row in queue._query("SELECT lease_until FROM jobs")]
+    assert leases == [lease_until, lease_until]
+
+    assert queue.recover() == 2
+    assert all(queue.get(job_id)["status"] == "queued" for job_id in orphans)
+    # This process's own jobs stay its own
+    claimed = queue._claim()["id"]
+    assert queue.recover() == 0 and queue.get(claimed)["status"] == "running"
+
+
+def test_jobs_processed_once(tmp_path):
+    """Submitted jobs are processed and their results stored"""
+    calls = []
+    queue = make_queue(tmp_path, "process",
+                       lambda contents, top_k, site: calls.append(contents) or {"size": len(contents)})
+    job_id = queue.submit(b"photo", top_k=2, site="cairo")
+    queue.start()
+    try:
+        deadline = time.time() + 5
+        while queue.get(job_id)["status"] != "done" and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        queue.stop()
+    assert queue.get(job_id)["result"] == {"size": 5}
+    assert calls == [b"photo"]
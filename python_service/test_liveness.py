@@ -0,0 +1,74 @@
+"""
+Liveness check tests
+
+The texture check runs on synthetic crops: fine noise stands in for a
+sharp live capture, an upscaled thumbnail for a re-photographed print.
+"""
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import config
+import liveness
+from engines import DetectedFace
+
+
+def sharp_capture(rng, pattern=0.0):
+    """96px crop with fine detail, optionally overlaid with a screen-like stripe pattern"""
+    x = np.arange(96)[None, :, None]
+    pixels = 128 + pattern * np.sin(x * 2.6) + rng.normal(0, 10, (96, 96, 3))
+    return pixels.clip(0, 255).astype(np.uint8)
+
+
+def test_texture_check_scores():
+    """Sharp captures pass, blurred recaptures and moire fail, tiny crops are left undecided"""
+    rng = np.random.default_rng(0)
+    check = liveness.TextureCheck()
+    face = DetectedFace((0, 0, 96, 96))
+    assert check.score(sharp_capture(rng), face) > check.threshold
+
+    thumbnail = rng.integers(0, 256, (12, 12, 3)).astype(np.uint8)
+    printed = np.asarray(Image.fromarray(thumbnail).resize((96, 96), Image.BILINEAR))
+    assert check.score(printed, face) < check.threshold
+    with pytest.raises(liveness.SpoofDetected):
+        check.check(printed, face)
+
+    assert check.score(sharp_capture(rng, pattern=80.0), face) < check.threshold
+    assert check.score(sharp_capture(rng), DetectedFace((0, 0, 30, 30))) is None
+    assert check.check(sharp_capture(rng), DetectedFace((0, 0, 30, 30))) is None
+
+
+def test_get_check(monkeypatch):
+    """The configured check is built by name; '' disables the stage"""
+    assert liveness.get_check() is None
+    monkeypatch.setattr(config, "LIVENESS_CHECK", "texture")
+    assert isinstance(liveness.get_check(), liveness.TextureCheck)
+    with pytest.raises(ValueError):
+        liveness.get_check("missing")
+
+
+def test_spoof_rejected_before_embedding(engine):
+    """represent raises on a spoof after detection, without running the embed stage"""
+    timings = {}
+    with pytest.raises(liveness.SpoofDetected):
+        engine.represent(engine.decode(b"spoof-photo"), liveness.MockCheck(), timings)
+    assert "liveness" in timings and "embed" not in timings
+    embedding, _ = engine.represent(engine.decode(b"employee-1"), liveness.MockCheck())
+    assert embedding is not None
+
+
+def test_endpoints_answer_spoofs(employee, make_app, monkeypatch):
+    """/recognize and /verify report a spoof instead of a match or an error"""
+    monkeypatch.setattr(config, "LIVENESS_CHECK", "mock")
+    client = TestClient(make_app([employee(1)]))
+    photo = ("face.jpg", b"spoof-employee-1", "image/jpeg")
+
+    recognized = client.post("/recognize", files={"file": photo})
+    assert recognized.status_code == 200
+    assert recognized.json()["spoof"] and not recognized.json()["recognized"]
+    verified = client.post("/verify", data={"employee_id": "1"}, files={"file": photo})
+    assert verified.status_code == 200, verified.text
+    assert verified.json()["spoof"] and not verified.json()["verified"]
+    assert client.post("/recognize", files={"file": ("face.jpg", b"employee-1", "image/jpeg")}).json()["recognized"]
@@ -0,0 +1,87 @@
+"""
+Memory regression test for the recognition hot path
+
+Checks that repeated reloads and recognitions leave traced memory flat
+once warmed up.
+"""
+
+import gc
+import os
+import tracemalloc
+
+import pytest
+
+import profiling
+import service
+
+EMPLOYEES = 200
+WARMUP = 20
+ROUNDS = 200
+# Growth allowed after warm-up, in KB (a leak of one small object per round exceeds it)
+MAX_GROWTH_KB = 64
+
+
+@pytest.fixture
+def app(employee, make_app):
+    """Service app with a mock gallery of EMPLOYEES employees"""
+    return make_app([employee(i) for i in range(EMPLOYEES)])
+
+
+def traced_growth_kb(step):
+    """Traced memory growth (KB) over ROUNDS calls of step, after WARMUP calls
+
+    The warm-up runs traced too, so state replaced by every call (the
+    gallery itself) is counted in the baseline rather than as growth.
+    """
+    tracemalloc.start()
+    try:
+        for i in range(WARMUP):
+            step(i)
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(ROUNDS):
+            step(i)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before) / 1024
+
+
+def test_reload_memory_steady(app):
+    """Rebuilding the gallery must release the previous one"""
+    growth = traced_growth_kb(lambda i: service.reload_galleries(app))
+    print(f"📊 Reload growth over {ROUNDS} rounds: {growth:.1f} KB")
+    assert growth < MAX_GROWTH_KB, f"gallery reloads grew traced memory by {growth:.1f} KB"
+
+
+def test_recognition_memory_steady(app):
+    """Recognitions (hits, misses and recent-cache hits) must not accumulate state"""
+
+    def recognize(i):
+        contents = f"employee-{i % EMPLOYEES}".encode() if i % 3 else b"unknown face"
+        service.recognition_response(app, contents, 3, "recognize", camera=f"kiosk-{i % 4}")
+
+    growth = traced_growth_kb(recognize)
+    print(f"📊 Recognition growth over {ROUNDS} rounds: {growth:.1f} KB")
+    assert growth < MAX_GROWTH_KB, f"recognitions grew traced memory by {growth:.1f} KB"
+
+
+def test_profiler_hooks(app, tmp_path):
+    """Snapshots diff, request counters and CPU profiles land in the profile directory"""
+    app.state.profiler = profiler = profiling.Profiler(str(tmp_path / "profiles"))
+    profiler.start_tracing()
+    try:
+        first = profiler.snapshot(limit=5)
+        for i in range(10):
+            service.recognition_response(app, f"employee-{i}".encode())
+        second = profiler.snapshot(limit=5)
+    finally:
+        profiler.stop_tracing()
+    assert first["growth"] is None and second["growth"] is not None
+    assert os.path.exists(first["path"]) and os.path.exists(second["path"])
+    assert profiler.describe()["requests"]["recognize"]["requests"] == 10
+
+    cpu = profiler.sample_cpu(0.2, interval_ms=5)
+    assert cpu["samples"] > 0 and os.path.exists(cpu["path"])
+
@@ -0,0 +1,27 @@
+"""
+Model migration tests
+"""
+
+import numpy as np
+
+import migration
+from gallery import split_face_encoding
+
+
+def test_migration_keeps_concurrent_updates(engine, monkeypatch):
+    """An encoding stored while a batch was embedding survives the merge of that batch"""
+    stored = {1: {"id": 1, "name": "Employee 1", "employeeId": "EMP0001", "faceEncoding": "onnx:old|c3RhbGU="}}
+    snapshot = {1: dict(stored[1])}
+    # Re-enrolled through /encode after the migration fetched its snapshot
+    stored[1]["faceEncoding"] = "onnx:old|ZnJlc2g="
+
+    monkeypatch.setattr(migration, "fetch_employee", lambda employee_id, *args: dict(stored[employee_id]))
+    monkeypatch.setattr(migration, "store_face_encoding",
+                        lambda employee_id, value, *args: stored[employee_id].update(faceEncoding=value))
+    run = migration.MigrationRun(engine, "onnx:old")
+    run._store([(1, "migrated", np.ones(128))], snapshot)
+
+    entries = split_face_encoding(stored[1]["faceEncoding"])
+    assert entries["onnx:old"] == "onnx:old|ZnJlc2g="
+    assert engine.fingerprint in entries
+    assert run.counts == {"migrated": 1}
@@ -0,0 +1,62 @@
+"""
+Gallery export/import tests
+
+Copies a gallery between two mock-engine apps over /gallery/export and
+/gallery/import.
+"""
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import replication
+import service
+
+
+def employees(employee, count):
+    return [employee(i, city=("Cairo", "Giza")[i % 2]) for i in range(count)]
+
+
+def test_npy_round_trip(engine, employee, make_app):
+    """An npy export imported by another instance serves the same rows, records and matches"""
+    source, target = make_app(employees(employee, 5)), make_app()
+    exported = TestClient(source).get("/gallery/export", params={"format": "npy"})
+    assert exported.status_code == 200 and exported.headers["X-Gallery-Count"] == "5"
+
+    imported = TestClient(target).post("/gallery/import", content=exported.content)
+    assert imported.status_code == 200, imported.text
+    assert imported.json()["loaded_faces"] == 5 and imported.json()["format"] == "npy"
+    copy, original = target.state.gallery, source.state.gallery
+    assert copy.ids == original.ids and copy.records == original.records
+    assert np.array_equal(copy.embeddings, original.embeddings)
+    query, _ = engine.represent(engine.decode(b"employee-3"))
+    assert copy.top_k(query, 2) == original.top_k(query, 2)
+    assert copy.resolve_id(employee_code="EMP0003") == 3
+
+
+def test_export_is_one_version(employee, backend, make_app):
+    """A state taken before a swap exports that version whole"""
+    app = make_app(employees(employee, 4))
+    gallery = app.state.gallery
+    state = replication.gallery_state(gallery)
+    backend.employees = employees(employee, 2)
+    service.reload_galleries(app)
+    assert len(gallery) == 2
+
+    meta, ids, embeddings, records = replication.read_npy(b"".join(replication.iter_npy(gallery, state)))
+    assert meta["count"] == 4 and ids == [0, 1, 2, 3] and embeddings.shape[0] == 4 and sorted(records) == ids
+
+
+def test_arrow_round_trip_or_unavailable(employee, make_app):
+    """Arrow exports round-trip with pyarrow installed and answer 501 without it"""
+    client = TestClient(make_app(employees(employee, 3)))
+    exported = client.get("/gallery/export", params={"format": "arrow"})
+    try:
+        replication._pyarrow()
+    except ImportError:
+        assert exported.status_code == 501
+        return
+    assert exported.status_code == 200
+    _, (meta, ids, embeddings, records) = replication.read_export(exported.content)
+    assert meta["count"] == 3 and ids == [0, 1, 2] and embeddings.shape == (3, 128)
+    assert records[1]["employeeId"] == "EMP0001"
+
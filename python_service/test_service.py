@@ -0,0 +1,53 @@
+"""
+App factory tests
+
+The entry-point modules are imported in a fresh interpreter so the
+check for heavy imports sees only what that import pulled in.
+"""
+
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+import service
+from engines import MockEngine
+
+HEAVY_MODULES = ("tensorflow", "deepface", "face_recognition", "dlib", "onnxruntime", "cv2")
+
+
+def imported_after(statement):
+    """Heavy modules loaded by running statement in a fresh interpreter"""
+    code = f"import sys\n{statement}\nprint('heavy:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    env = dict(os.environ, FACE_ENGINE="mock", EVENTS_DB="")
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    # The app factory logs as it builds; the answer is the last line
+    return result.stdout.strip().splitlines()[-1][len("heavy:"):]
+
+
+def test_entry_points_import_no_engine_libraries():
+    """Every service variant builds its app without importing a model library"""
+    for module in ("simple_face_service", "face_recognition_service", "real_face_service"):
+        assert imported_after(f"import {module}") == "", module
+
+
+def test_variants_share_routes():
+    """The variants differ only in their engine, not in the API they serve"""
+    routes = [sorted(service.create_app(name, load_gallery=False).openapi()["paths"])
+              for name in ("mock", "dlib", "deepface", "onnx")]
+    assert all(paths == routes[0] for paths in routes)
+    assert {"/recognize", "/verify", "/encode", "/reload", "/health", "/enroll/bulk"} <= set(routes[0])
+
+
+def test_startup_loads_given_engine():
+    """An engine instance is used as given and warmed up on startup"""
+    engine = MockEngine(dimension=16)
+    app = service.create_app(engine, load_gallery=False)
+    assert app.state.engine is engine and not engine.loaded
+    with TestClient(app) as client:
+        health = client.get("/health").json()
+    assert engine.loaded
+    assert health["engine"] == "mock" and health["loaded_faces"] == 0 and health["status"] == "healthy"
@@ -0,0 +1,62 @@
+"""
+Gallery shard tests
+
+Starts real shard processes (spawn), so keep the shard counts small.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import config
+import shards
+from gallery import Gallery
+
+
+def make_gallery(partition_by="city", count=60, dimension=32):
+    rng = np.random.default_rng(7)
+    embeddings = rng.standard_normal((count, dimension)).astype(np.float32)
+    ids = list(range(count))
+    records = {i: {"name": f"Employee {i}", "employeeId": f"EMP{i:04d}", "specialty": "Staff",
+                   "city": ("Cairo", "Giza", "Alexandria")[i % 3], "birthDate": None} for i in ids}
+    gallery = Gallery(partition_by=partition_by)
+    gallery.load_prepared(ids, embeddings, records)
+    return gallery, embeddings
+
+
+def test_concurrent_searches_match_unsharded():
+    """Global and site searches from many threads get the same answers as the in-process gallery"""
+    local, embeddings = make_gallery()
+    sharded, _ = make_gallery()
+    pool = shards.ShardPool(2, sharded.metric)
+    sharded.attach_shards(pool)
+    try:
+        queries = [(embeddings[i] + 0.01, partition) for i in range(0, 60, 3)
+                   for partition in (None, "cairo", "giza")]
+
+        def search(query):
+            embedding, partition = query
+            return [employee_id for employee_id, _ in sharded.top_k(embedding, 3, partition)]
+
+        with ThreadPoolExecutor(8) as executor:
+            answers = list(executor.map(search, queries * 4))
+        expected = [[employee_id for employee_id, _ in local.top_k(embedding, 3, partition)]
+                    for embedding, partition in queries] * 4
+        assert answers == expected
+    finally:
+        pool.close()
+
+
+def test_attach_and_detach(monkeypatch):
+    """Galleries get a pool only when GALLERY_SHARDS is set, and detaching stops its processes"""
+    monkeypatch.setattr(config, "GALLERY_SHARDS", 0)
+    gallery, _ = make_gallery()
+    assert shards.attach(gallery, gallery.metric).shards is None
+
+    monkeypatch.setattr(config, "GALLERY_SHARDS", 2)
+    shards.attach(gallery, gallery.metric)
+    pool = gallery.shards
+    assert pool is not None and sum(pool.rows) == len(gallery)
+    shards.detach(gallery)
+    assert gallery.shards is None
+    assert not any(process.is_alive() for process in pool.processes)
@@ -0,0 +1,88 @@
+"""
+Request coalescing tests
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import admission
+import service
+from engines import MockEngine
+from singleflight import SingleFlight
+
+
+class CountingEngine(MockEngine):
+    """Mock engine whose represent() is slow enough to overlap and counts its runs"""
+
+    def __init__(self):
+        super().__init__()
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def represent(self, image, *args, **kwargs):
+        with self._lock:
+            self.runs += 1
+        time.sleep(0.2)
+        return super().represent(image, *args, **kwargs)
+
+
+def test_same_key_runs_once():
+    """Concurrent calls with one key share a single run; the key is free again afterwards"""
+    flight = SingleFlight()
+    runs = []
+
+    def slow(value):
+        runs.append(value)
+        time.sleep(0.2)
+        return value * 2
+
+    with ThreadPoolExecutor(5) as executor:
+        results = list(executor.map(lambda _: flight.do("photo", slow, 21), range(5)))
+    assert runs == [21]
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(result == 42 for result, _ in results)
+    assert flight.do("photo", slow, 1) == (2, False)
+    assert flight.describe()["in_flight"] == 0
+
+
+def test_errors_shared_and_keys_independent():
+    """Waiters get the leader's exception; a slow key never holds up another"""
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("no face")
+
+    def call_failing():
+        try:
+            flight.do("bad", failing)
+        except ValueError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(3) as executor:
+        leader = executor.submit(call_failing)
+        started.wait(5)
+        follower = executor.submit(call_failing)
+        began = time.perf_counter()
+        assert flight.do("other", lambda: "fast") == ("fast", False)
+        assert time.perf_counter() - began < 0.1
+        assert leader.result() == "no face" and follower.result() == "no face"
+
+
+def test_identical_uploads_embed_once(make_app):
+    """Simultaneous identical uploads run one embedding; different admission plans do not share"""
+    engine = CountingEngine()
+    app = make_app(with_engine=engine)
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: service.shared_face_embedding(app, engine, b"photo"), range(4)))
+    assert engine.runs == 1
+    assert all((embedding == results[0][0]).all() for embedding, _ in results)
+
+    plans = [None, admission.Plan(admission.FAST_DETECTOR)]
+    with ThreadPoolExecutor(2) as executor:
+        list(executor.map(lambda plan: service.shared_face_embedding(app, engine, b"photo", plan=plan), plans))
+    assert engine.runs == 3
+
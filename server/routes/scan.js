@@ -5,6 +5,7 @@ const fs = require('fs');
 const axios = require('axios');
 const FormData = require('form-data');
 const { Employee, ScanHistory } = require('../models');
+const fastpath = require('../services/fastpath');
 const router = express.Router();
 
 // Configure multer for scan image uploads
@@ -34,6 +35,30 @@ const upload = multer({
   }
 });
 
+// Multipart upload of a scan to the Python service's /recognize
+async function recognizeOverHttp(imagePath, site, camera) {
+  const formData = new FormData();
+  formData.append('file', fs.createReadStream(imagePath));
+  if (site) {
+    formData.append('site', site);
+  }
+  if (camera) {
+    formData.append('camera', camera);
+  }
+
+  const pythonResponse = await axios.post(
+    `${process.env.PYTHON_SERVICE_URL || 'http://localhost:8000'}/recognize`,
+    formData,
+    {
+      headers: {
+        ...formData.getHeaders(),
+      },
+      timeout: 30000 // 30 seconds timeout
+    }
+  );
+  return pythonResponse.data;
+}
+
 // POST /api/scan/recognize - Face recognition scan
 router.post('/recognize', upload.single('image'), async (req, res) => {
   try {
@@ -54,23 +79,29 @@ router.post('/recognize', upload.single('image'), async (req, res) => {
 
     // Call Python face recognition service
     console.log('🐍 Calling Python service...');
-    const formData = new FormData();
-    formData.append('file', fs.createReadStream(imagePath));
-
-    const pythonResponse = await axios.post(
-      `${process.env.PYTHON_SERVICE_URL || 'http://localhost:8000'}/recognize`,
-      formData,
-      {
-        headers: {
-          ...formData.getHeaders(),
-        },
-        timeout: 30000 // 30 seconds timeout
+    // The scan's location scopes the gallery search to that site first
+    const site = req.body.location || null;
+    // Keys the recent-recognition cache, so a person held at the kiosk skips the full search
+    const camera = req.body.camera || clientIP;
+    const fastpathClient = fastpath.getClient();
+    let recognition;
+    if (fastpathClient) {
+      try {
+        // Raw bytes over the persistent socket; no multipart round trip
+        recognition = await fastpathClient.recognize(await fs.promises.readFile(imagePath), 1, site, camera);
+      } catch (error) {
+        // Answers from the service (admission refusals included) stand; only a lost connection retries over HTTP
+        if (!error.connectionLost) throw error;
+        console.warn(`⚠️ Fast path unavailable (${error.message}), falling back to HTTP`);
+        recognition = await recognizeOverHttp(imagePath, site, camera);
       }
-    );
-    
-    console.log('🐍 Python service response:', pythonResponse.data);
+    } else {
+      recognition = await recognizeOverHttp(imagePath, site, camera);
+    }
+
+    console.log('🐍 Python service response:', recognition);
 
-    const { recognized, employeeId, confidence, faceEncoding } = pythonResponse.data;
+    const { recognized, employeeId, confidence, faceEncoding, spoof } = recognition;
 
     let scanResult;
     let employee = null;
@@ -99,7 +130,7 @@ router.post('/recognize', upload.single('image'), async (req, res) => {
         ipAddress: clientIP,
         userAgent,
         location: req.body.location || null,
-        notes: 'Face not recognized'
+        notes: spoof ? 'Liveness check failed' : 'Face not recognized'
       });
     }
 
@@ -120,12 +151,29 @@ router.post('/recognize', upload.single('image'), async (req, res) => {
       employee,
       confidence,
       scanId: scanResult.id,
+      spoof: Boolean(spoof),
       message: recognized 
         ? `Welcome, ${employee.name}!` 
-        : 'You are not an employee here. Access denied.'
+        : spoof
+          ? 'Please look directly at the camera, photos and screens are not accepted.'
+          : 'You are not an employee here. Access denied.'
     });
 
   } catch (error) {
+    // The Python service refused the scan up front because it is overloaded;
+    // nothing was attempted, so tell the kiosk to retry rather than log a failure
+    const overloadStatus = error.status || error.response?.status;
+    if (overloadStatus === 429 || overloadStatus === 503) {
+      const retryAfter = Number(error.retryAfter || error.response?.headers?.['retry-after']) || 1;
+      console.warn(`⚠️ Face recognition busy (${overloadStatus}), retry in ${retryAfter}s`);
+      res.set('Retry-After', String(retryAfter));
+      return res.status(503).json({
+        error: 'Face recognition busy',
+        message: 'The scanner is busy, please try again in a moment.',
+        retryAfter
+      });
+    }
+
     console.error('Face recognition error:', error);
     
     // Log failed scan
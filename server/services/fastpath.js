@@ -0,0 +1,162 @@
+const net = require('net');
+
+// Binary fast path to the Python recognition service (see python_service/fastpath.py).
+// Request frame:  uint32 length | uint32 requestId | uint8 op | uint8 topK | image bytes
+//                 (op 3 adds uint8 site length | site | uint8 camera length | camera before
+//                 the image, either possibly empty; text fields are UTF-8)
+// Response frame: uint32 length | uint32 requestId | compact JSON
+// Requests on one connection run concurrently and are answered as they finish,
+// so responses are matched to requests by id, not by order.
+
+const OP_PING = 0;
+const OP_RECOGNIZE = 1;
+const OP_RECOGNIZE_AT_SITE = 2;
+const OP_RECOGNIZE_WITH_CONTEXT = 3;
+
+// uint8 length + UTF-8 bytes, truncated to 255 bytes
+function shortField(text) {
+  const encoded = text ? Buffer.from(String(text), 'utf8').subarray(0, 255) : Buffer.alloc(0);
+  return Buffer.concat([Buffer.from([encoded.length]), encoded]);
+}
+
+function encodeRequest(requestId, op, image = Buffer.alloc(0), topK = 1, site = null, camera = null) {
+  // The camera keys the recent-recognition cache, as on the HTTP path
+  const context = site || camera ? [shortField(site), shortField(camera)] : [];
+  const header = Buffer.alloc(10);
+  const contextLength = context.reduce((total, part) => total + part.length, 0);
+  header.writeUInt32BE(header.length - 4 + contextLength + image.length, 0);
+  header.writeUInt32BE(requestId, 4);
+  header.writeUInt8(context.length ? OP_RECOGNIZE_WITH_CONTEXT : op, 8);
+  header.writeUInt8(topK, 9);
+  return [header, ...context, image];
+}
+
+// Splits a byte stream into frame payloads
+class FrameReader {
+  constructor(onFrame) {
+    this.onFrame = onFrame;
+    this.buffer = Buffer.alloc(0);
+  }
+
+  push(chunk) {
+    this.buffer = this.buffer.length ? Buffer.concat([this.buffer, chunk]) : chunk;
+    while (this.buffer.length >= 4) {
+      const length = this.buffer.readUInt32BE(0);
+      if (this.buffer.length < 4 + length) break;
+      const payload = this.buffer.subarray(4, 4 + length);
+      this.buffer = this.buffer.subarray(4 + length);
+      this.onFrame(payload);
+    }
+  }
+}
+
+class FastPathClient {
+  constructor(socketPath, { timeout = 30000 } = {}) {
+    this.socketPath = socketPath;
+    this.timeout = timeout;
+    this.socket = null;
+    this.pending = new Map();
+    this.nextId = 1;
+  }
+
+  connect() {
+    if (this.socket) return this.socket;
+    const socket = net.createConnection(this.socketPath);
+    const reader = new FrameReader((frame) => {
+      const requestId = frame.readUInt32BE(0);
+      const request = this.pending.get(requestId);
+      if (!request) {
+        // Id 0 reports a stream the service could not parse; anything else answers a timed-out request
+        if (requestId === 0) this.reset(new Error(`Fast path protocol error: ${frame.subarray(4).toString()}`), socket);
+        return;
+      }
+      this.pending.delete(requestId);
+      clearTimeout(request.timer);
+      try {
+        const result = JSON.parse(frame.subarray(4).toString());
+        if (result.error) {
+          // status/retry_after are set when admission control refused the request
+          const error = new Error(result.error);
+          error.status = result.status;
+          error.retryAfter = result.retry_after;
+          request.reject(error);
+        } else {
+          request.resolve(result);
+        }
+      } catch (error) {
+        request.reject(error);
+      }
+    });
+    socket.on('data', (chunk) => reader.push(chunk));
+    // Events of a socket already replaced by a reconnect must not tear down the new one
+    socket.on('error', (error) => this.reset(error, socket));
+    socket.on('close', () => this.reset(new Error('Fast path connection closed'), socket));
+    this.socket = socket;
+    return socket;
+  }
+
+  // Drop the connection and fail everything sent on it; those requests will never be answered
+  reset(error, socket = this.socket) {
+    if (socket !== this.socket) return;
+    // Tells callers the request got no answer (as opposed to an error reply from the service)
+    error.connectionLost = true;
+    if (this.socket) {
+      this.socket.destroy();
+      this.socket = null;
+    }
+    const pending = this.pending;
+    this.pending = new Map();
+    for (const request of pending.values()) {
+      clearTimeout(request.timer);
+      request.reject(error);
+    }
+  }
+
+  call(op, image, topK, site, camera) {
+    return new Promise((resolve, reject) => {
+      const socket = this.connect();
+      const requestId = this.nextId;
+      this.nextId = this.nextId >= 0xffffffff ? 1 : this.nextId + 1;
+      // A slow request only fails itself; the connection and other requests carry on
+      const timer = setTimeout(() => {
+        this.pending.delete(requestId);
+        reject(new Error('Fast path request timed out'));
+      }, this.timeout);
+      this.pending.set(requestId, { resolve, reject, timer });
+      for (const part of encodeRequest(requestId, op, image, topK, site, camera)) socket.write(part);
+    });
+  }
+
+  recognize(image, topK = 1, site = null, camera = null) {
+    return this.call(OP_RECOGNIZE, image, topK, site, camera);
+  }
+
+  ping() {
+    return this.call(OP_PING);
+  }
+
+  close() {
+    this.reset(new Error('Fast path client closed'));
+  }
+}
+
+let sharedClient = null;
+
+// The process-wide client when PYTHON_FASTPATH_SOCKET is configured, otherwise null
+function getClient() {
+  const socketPath = process.env.PYTHON_FASTPATH_SOCKET;
+  if (!socketPath) return null;
+  if (!sharedClient) sharedClient = new FastPathClient(socketPath);
+  return sharedClient;
+}
+
+module.exports = {
+  OP_PING,
+  OP_RECOGNIZE,
+  OP_RECOGNIZE_AT_SITE,
+  OP_RECOGNIZE_WITH_CONTEXT,
+  FastPathClient,
+  FrameReader,
+  encodeRequest,
+  getClient
+};